@@ -1,5 +1,9 @@
 import os
+import re
+import sys
 import glob
+import json
+import subprocess
 from functools import wraps
 
 import click
@@ -17,8 +21,17 @@ from src.database import (
     ChatQuery,
     YandexDiskTokenQuery
 )
+from src.rq import TaskQueueName
 from src.rq.worker import (
-    run_worker as run_rq_worker
+    run_workers as run_rq_workers
+)
+from src.http.telegram import rate_limiter
+from src.blueprints.telegram_bot._common import stateful_chat
+from src.blueprints.telegram_bot._common.operation_tracker import (
+    run_tracker as run_yandex_operation_tracker
+)
+from src.blueprints.telegram_bot.webhook.updates_consumer import (
+    run_consumer as run_updates_stream_consumer
 )
 
 
@@ -41,6 +54,12 @@ class InvalidTableDataError(Exception):
     pass
 
 
+# Line of `python -X importtime` output
+IMPORT_TIME_PATTERN = re.compile(
+    r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$"
+)
+
+
 def with_app_context(func):
     """
     Decorator which enables app context.
@@ -396,11 +415,233 @@ def init_translations(language_code: str) -> None:
 
 
 @cli.command()
-def run_worker():
+@click.option(
+    "--queue",
+    "queue_names",
+    multiple=True,
+    type=click.Choice([name.value for name in TaskQueueName]),
+    help=(
+        "Queue to listen to, can be specified multiple times. "
+        "Order defines priority. Defaults to all queues"
+    )
+)
+@click.option(
+    "--concurrency",
+    default=1,
+    type=int,
+    help="How many worker processes to run"
+)
+@click.option(
+    "--jobs-per-worker",
+    default=0,
+    type=int,
+    help=(
+        "Run jobs without fork, that many jobs at the same time "
+        "in every worker process. Greenlets are used if gevent "
+        "monkey patching was applied (python -m gevent.monkey "
+        "manage.py ...), otherwise threads are used. "
+        "Defaults to forking worker"
+    )
+)
+def run_worker(
+    queue_names: tuple,
+    concurrency: int,
+    jobs_per_worker: int
+):
+    """
+    Runs workers for background tasks.
+
+    - run separate pools for different queues
+    if you need to size them separately.
+    """
+    run_rq_workers(
+        list(queue_names) or None,
+        concurrency,
+        jobs_per_worker
+    )
+
+
+@cli.command()
+@click.option(
+    "--name",
+    default=None,
+    help="Unique name of consumer. Defaults to hostname and PID"
+)
+@click.option(
+    "--max-partitions",
+    default=None,
+    type=int,
+    help=(
+        "Maximum number of partitions that can be handled "
+        "at the same time. Defaults to fair share"
+    )
+)
+def run_updates_consumer(name: str, max_partitions: int) -> None:
+    """
+    Runs consumer of stream of incoming Telegram updates.
+
+    - run as many consumers as you need (on different machines
+    too), partitions of stream will be distributed between them
+
+    - `RUNTIME_UPDATES_STREAM_ENABLED` should be enabled
+    """
+    run_updates_stream_consumer(
+        create_app(),
+        name=name,
+        max_partitions=max_partitions
+    )
+
+
+@cli.command()
+def run_operation_tracker() -> None:
+    """
+    Runs tracker of Yandex.Disk operations.
+
+    - run as many trackers as you need, operations
+    will be distributed between them
+
+    - `RUNTIME_OPERATION_TRACKER_ENABLED` should be enabled
+    """
+    run_yandex_operation_tracker(create_app())
+
+
+@cli.command()
+@click.option(
+    "--reset",
+    is_flag=True,
+    help="Remove collected metrics after printing"
+)
+@with_app_context
+def telegram_rate_limiter_stats(reset: bool) -> None:
+    """
+    Prints metrics of Telegram Bot API rate limiter.
+    """
+    metrics = rate_limiter.get_metrics()
+
+    for name, value in metrics.items():
+        click.echo(f"{name}: {value}")
+
+    if reset:
+        rate_limiter.reset_metrics()
+
+
+@cli.command()
+@click.option(
+    "--batch-size",
+    default=1000,
+    show_default=True,
+    help="How many keys should be scanned at once"
+)
+@with_app_context
+def migrate_stateful_chat(batch_size: int) -> None:
     """
-    Runs single worker for background tasks.
+    Converts stateful chat data of old versions into new format.
+
+    - can be used while app is running
+    - prints memory usage before and after migration
+    """
+    report = stateful_chat.migrate_legacy_keys(batch_size)
+
+    for name, value in report.items():
+        click.echo(f"{name}: {value}")
+
+
+@cli.command()
+@click.option(
+    "--limit",
+    default=30,
+    show_default=True,
+    help="How many modules should be printed, 0 for all"
+)
+@click.option(
+    "--sort",
+    "sort_by",
+    default="cumulative",
+    show_default=True,
+    type=click.Choice(["cumulative", "self"]),
+    help="Sort modules by cumulative time or by own time"
+)
+@click.option(
+    "--json",
+    "as_json",
+    is_flag=True,
+    help="Print report as JSON (to compare it between releases)"
+)
+def import_report(limit: int, sort_by: str, as_json: bool) -> None:
     """
-    run_rq_worker()
+    Prints import time of modules that are imported on start of app.
+
+    - app is created in separate Python process
+    (`python -X importtime`), i.e. same as server worker
+    and RQ worker do it. `CONFIG_NAME` env variable is used
+
+    - max RSS of that process is printed too
+    """
+    code = (
+        "import resource;"
+        "from src.app import create_app;"
+        "create_app();"
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+
+    if result.returncode != 0:
+        raise click.ClickException(
+            f"Unable to create app:\n{result.stderr}"
+        )
+
+    modules = []
+
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+
+        if match is None:
+            continue
+
+        self_us, cumulative_us, indent, name = match.groups()
+
+        modules.append({
+            "name": name,
+            "depth": (len(indent) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000
+        })
+
+    total_ms = sum(module["self_ms"] for module in modules)
+    max_rss_kb = int(result.stdout.split()[-1])
+    modules.sort(
+        key=lambda module: module[f"{sort_by}_ms"],
+        reverse=True
+    )
+
+    if limit > 0:
+        modules = modules[:limit]
+
+    if as_json:
+        click.echo(json.dumps({
+            "total_ms": total_ms,
+            "max_rss_kb": max_rss_kb,
+            "modules": modules
+        }, indent=2))
+
+        return
+
+    click.echo(f"Total import time: {total_ms:.1f} ms")
+    click.echo(f"Max RSS: {max_rss_kb / 1024:.1f} MB")
+    click.echo("")
+    click.echo(f"{'cumulative, ms':>15} {'self, ms':>10}  module")
+
+    for module in modules:
+        click.echo(
+            f"{module['cumulative_ms']:>15.1f} "
+            f"{module['self_ms']:>10.1f}  "
+            f"{module['name']}"
+        )
 
 
 @cli.command()
@@ -22,7 +22,8 @@ from .extensions import (
     migrate,
     redis_client,
     task_queue,
-    babel
+    babel,
+    make_psycopg2_cooperative
 )
 from .blueprints import (
     telegram_bot_blueprint,
@@ -66,6 +67,17 @@ def configure_app(app: Flask, config_name: str) -> None:
 
     app.config.from_object(config)
 
+    # update of crashed consumer should be claimable
+    # again before its partition will be owned by another one
+    claim_expire = app.config["RUNTIME_UPDATE_CLAIM_EXPIRE"]
+    lease_time = app.config["RUNTIME_UPDATES_STREAM_LEASE_TIME"]
+
+    if (claim_expire >= lease_time):
+        raise ValueError(
+            "RUNTIME_UPDATE_CLAIM_EXPIRE should be less "
+            "than RUNTIME_UPDATES_STREAM_LEASE_TIME"
+        )
+
 
 def configure_logger(app: Flask) -> None:
     """
@@ -141,6 +153,10 @@ def configure_extensions(app: Flask) -> None:
     Configures Flask extensions.
     """
     # Database
+    if app.config["SQLALCHEMY_COOPERATIVE_DRIVER"]:
+        if make_psycopg2_cooperative():
+            app.logger.debug("psycopg2 is cooperative with gevent")
+
     db.init_app(app)
 
     # Migration
@@ -0,0 +1,179 @@
+"""
+Concurrent execution of independent calls (for example,
+requests to Yandex.Disk API that don't depend on each other)
+and delayed calls in background (see `run_later()`).
+
+- if gevent monkey patching was applied, then greenlets are
+used, otherwise threads are used.
+- every call is executed in separate app context, which is
+a copy of current app context (including `g`).
+"""
+
+from time import monotonic
+from threading import Timer
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeoutError
+)
+from typing import Any, Callable, List, Sequence, Tuple, Union
+
+from flask import g, current_app
+
+
+class ConcurrentTimeoutError(Exception):
+    """
+    Call was not completed before deadline.
+    """
+    pass
+
+
+def _gevent_is_patched() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+
+    return monkey.is_module_patched("threading")
+
+
+def _with_app_context(function: Callable) -> Callable:
+    """
+    :returns:
+    Function that executes `function` in copy of current app context.
+    """
+    app = current_app._get_current_object()
+    g_data = {key: g.get(key) for key in g}
+
+    def wrapper():
+        with app.app_context():
+            for key, value in g_data.items():
+                setattr(g, key, value)
+
+            return function()
+
+    return wrapper
+
+
+def _run_greenlets(
+    functions: Sequence[Callable],
+    timeout: Union[float, None]
+) -> List[Tuple[Any, Union[Exception, None]]]:
+    import gevent
+
+    greenlets = [gevent.spawn(function) for function in functions]
+    result = []
+
+    gevent.joinall(greenlets, timeout=timeout)
+
+    for greenlet in greenlets:
+        if not greenlet.ready():
+            greenlet.kill(block=False)
+            result.append((None, ConcurrentTimeoutError()))
+        elif greenlet.successful():
+            result.append((greenlet.value, None))
+        else:
+            result.append((None, greenlet.exception))
+
+    return result
+
+
+def _run_threads(
+    functions: Sequence[Callable],
+    timeout: Union[float, None]
+) -> List[Tuple[Any, Union[Exception, None]]]:
+    executor = ThreadPoolExecutor(len(functions))
+    futures = [executor.submit(function) for function in functions]
+    deadline = None if (timeout is None) else (monotonic() + timeout)
+    result = []
+
+    for future in futures:
+        remaining = (
+            None if (deadline is None) else
+            max(0, deadline - monotonic())
+        )
+
+        try:
+            result.append((future.result(remaining), None))
+        except FutureTimeoutError:
+            future.cancel()
+            result.append((None, ConcurrentTimeoutError()))
+        except Exception as error:
+            result.append((None, error))
+
+    # threads can't be interrupted, so, calls that exceed
+    # deadline will be completed in background
+    executor.shutdown(wait=False)
+
+    return result
+
+
+def run_concurrently(
+    functions: Sequence[Callable],
+    timeout: Union[float, None] = None
+) -> List[Tuple[Any, Union[Exception, None]]]:
+    """
+    Runs functions concurrently and waits for all of them.
+
+    - should be called within app context.
+    - use `functools.partial` or `lambda` to pass arguments.
+
+    :param functions:
+    Functions without arguments.
+    :param timeout:
+    Shared deadline (in seconds) for all functions.
+    Functions that were not completed before deadline
+    will have `ConcurrentTimeoutError` error.
+    `None` for no deadline.
+
+    :returns:
+    `(result, error)` for every function in same order.
+    `error` is an exception raised by function, `None` if
+    function completed successfully.
+    """
+    if not functions:
+        return []
+
+    functions = [_with_app_context(function) for function in functions]
+
+    if _gevent_is_patched():
+        return _run_greenlets(functions, timeout)
+
+    return _run_threads(functions, timeout)
+
+
+def run_later(
+    delay: float,
+    function: Callable
+) -> Timer:
+    """
+    Runs function in background after delay.
+
+    - should be called within app context.
+    - errors of function are logged, not raised.
+    - background call will be lost if process exits earlier,
+    so, wait for it (`join()`) before end of RQ job.
+
+    :param delay:
+    In seconds.
+    :param function:
+    Function without arguments.
+
+    :returns:
+    Started timer. Use `cancel()` to cancel the call
+    and `join()` to wait for it.
+    """
+    app = current_app._get_current_object()
+    function = _with_app_context(function)
+
+    def wrapper():
+        try:
+            function()
+        except Exception:
+            app.logger.exception("Delayed call failed")
+
+    timer = Timer(delay, wrapper)
+    timer.daemon = True
+
+    timer.start()
+
+    return timer
@@ -0,0 +1,107 @@
+"""
+Cache of Yandex.Disk folders that are known to exist.
+
+Before every upload default upload folder should exist, and
+creation of folder requires one request for every part of path.
+Almost always that folder already exists, so, folders that were
+confirmed to exist are remembered for every user.
+
+- cache is keyed by digest of user access token, so, token itself
+is not stored. New token (for example, after refreshing) will
+have empty cache.
+- if something indicates that cache is wrong (for example, folder
+was removed by user), then whole cache of user should be forgotten.
+- requires Redis to be enabled. If Redis is disabled, then
+nothing is known.
+"""
+
+import hashlib
+from typing import Iterable
+
+from flask import current_app
+
+from src.extensions import redis_client
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "known_folders"
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_user_key(user_access_token: str) -> str:
+    digest = hashlib.sha256(user_access_token.encode()).hexdigest()
+
+    return _create_key(_NAMESPACE_KEY, digest)
+
+
+def known_folders_is_enabled() -> bool:
+    return (
+        (current_app.config["YANDEX_DISK_API_KNOWN_FOLDERS_EXPIRE"] > 0) and
+        redis_client.is_enabled
+    )
+
+
+def is_known_folder(
+    user_access_token: str,
+    absolute_path: str
+) -> bool:
+    """
+    :param absolute_path:
+    Absolute path that was created by `YandexDiskPath`.
+
+    :returns:
+    Folder was confirmed to exist recently.
+    """
+    if not known_folders_is_enabled():
+        return False
+
+    return redis_client.sismember(
+        _get_user_key(user_access_token),
+        absolute_path
+    )
+
+
+def remember_folders(
+    user_access_token: str,
+    absolute_paths: Iterable[str]
+) -> None:
+    """
+    Remembers that folders exist.
+
+    - expiration of cache of user will be prolonged.
+
+    :param absolute_paths:
+    Absolute paths that were created by `YandexDiskPath`.
+    """
+    absolute_paths = list(absolute_paths)
+
+    if (
+        not absolute_paths or
+        not known_folders_is_enabled()
+    ):
+        return
+
+    key = _get_user_key(user_access_token)
+    expire = current_app.config["YANDEX_DISK_API_KNOWN_FOLDERS_EXPIRE"]
+    pipeline = redis_client.pipeline()
+
+    pipeline.sadd(key, *absolute_paths)
+    pipeline.expire(key, expire)
+
+    pipeline.execute(raise_on_error=True)
+
+
+def forget_folders(user_access_token: str) -> None:
+    """
+    Forgets all known folders of user.
+    """
+    if not known_folders_is_enabled():
+        return
+
+    redis_client.delete(
+        _get_user_key(user_access_token)
+    )
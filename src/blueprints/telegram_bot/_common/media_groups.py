@@ -0,0 +1,183 @@
+"""
+Buffer of media group (album) messages.
+
+Telegram sends every message of media group as separate update,
+but all of them have same `media_group_id`. Instead of uploading
+every message separately (separate job, separate status message),
+messages of one media group are buffered for a short window and
+uploaded together as one batch.
+
+- first message of media group is a "leader": only that message
+should start batch uploading (see `add_to_media_group()`).
+- batch is taken when no new messages were added during
+window (see `take_media_group()`). Message that came after batch
+was taken will start new media group with new leader.
+- requires Redis to be enabled. If Redis is disabled,
+then media groups are not buffered.
+"""
+
+import json
+from time import time, sleep
+from typing import List
+
+from flask import current_app
+
+from src.extensions import redis_client
+from src.rq import background_tasks_is_enabled
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "media_groups"
+_GROUP_KEY = "group"
+_ITEMS_KEY = "items"
+_LAST_ADDED_KEY = "last_added"
+
+# How long media group is stored in case if
+# leader will be not able to take it. In seconds
+_GROUP_EXPIRE = 60 * 10
+
+# KEYS[1] - items key
+# KEYS[2] - last added key
+# ARGV[1] - serialized item
+# ARGV[2] - current timestamp
+# ARGV[3] - expire in seconds
+#
+# returns count of items after adding
+_ADD_SCRIPT = """
+local count = redis.call("RPUSH", KEYS[1], ARGV[1])
+
+redis.call("SET", KEYS[2], ARGV[2], "EX", ARGV[3])
+redis.call("EXPIRE", KEYS[1], ARGV[3])
+
+return count
+"""
+
+_add_script = None
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_group_key(
+    chat_id: int,
+    media_group_id: str,
+    handler_name: str
+) -> str:
+    return _create_key(
+        _NAMESPACE_KEY,
+        _GROUP_KEY,
+        chat_id,
+        media_group_id,
+        handler_name
+    )
+
+
+def _get_add_script():
+    global _add_script
+
+    if _add_script is None:
+        _add_script = redis_client.register_script(_ADD_SCRIPT)
+
+    return _add_script
+
+
+def media_groups_is_enabled() -> bool:
+    """
+    - batch uploading is performed by background task,
+    because task should wait for the rest of media group.
+    """
+    return (
+        (current_app.config["RUNTIME_MEDIA_GROUP_WINDOW"] > 0) and
+        redis_client.is_enabled and
+        background_tasks_is_enabled()
+    )
+
+
+def add_to_media_group(
+    chat_id: int,
+    media_group_id: str,
+    handler_name: str,
+    item: dict
+) -> bool:
+    """
+    Adds message of media group into buffer.
+
+    :param chat_id:
+    Telegram ID of chat.
+    :param media_group_id:
+    `media_group_id` of Telegram message.
+    :param handler_name:
+    Name of handler of message. Messages of same media
+    group but with different handlers are buffered separately.
+    :param item:
+    Serializable data that is needed to upload this message.
+
+    :returns:
+    `True` if this message is a leader of media group,
+    i.e. caller should start batch uploading with
+    `take_media_group()`. Otherwise `False`.
+    """
+    key = _get_group_key(chat_id, media_group_id, handler_name)
+    count = _get_add_script()(
+        keys=[
+            _create_key(key, _ITEMS_KEY),
+            _create_key(key, _LAST_ADDED_KEY)
+        ],
+        args=[
+            json.dumps(item),
+            time(),
+            _GROUP_EXPIRE
+        ]
+    )
+
+    return (count == 1)
+
+
+def take_media_group(
+    chat_id: int,
+    media_group_id: str,
+    handler_name: str
+) -> List[dict]:
+    """
+    Waits for the rest of media group and takes all
+    buffered items from buffer.
+
+    - it is blocking function, it should be called
+    only by leader of media group.
+    - waiting is ended when no new messages were added
+    during `RUNTIME_MEDIA_GROUP_WINDOW` seconds, but no
+    longer than `RUNTIME_MEDIA_GROUP_MAX_WAIT` seconds.
+
+    :returns:
+    Items in order in which they were added.
+    """
+    config = current_app.config
+    window = config["RUNTIME_MEDIA_GROUP_WINDOW"]
+    deadline = time() + config["RUNTIME_MEDIA_GROUP_MAX_WAIT"]
+    key = _get_group_key(chat_id, media_group_id, handler_name)
+    items_key = _create_key(key, _ITEMS_KEY)
+    last_added_key = _create_key(key, _LAST_ADDED_KEY)
+
+    while True:
+        now = time()
+        last_added = float(redis_client.get(last_added_key) or 0)
+        remaining = min(
+            last_added + window - now,
+            deadline - now
+        )
+
+        if (remaining <= 0):
+            break
+
+        sleep(remaining)
+
+    pipeline = redis_client.pipeline(transaction=True)
+
+    pipeline.lrange(items_key, 0, -1)
+    pipeline.delete(items_key, last_added_key)
+
+    items, _ = pipeline.execute(raise_on_error=True)
+
+    return [json.loads(item) for item in items]
@@ -0,0 +1,239 @@
+"""
+Schedule of checks of Yandex.Disk operation status.
+
+Yandex.Disk downloads file by URL asynchronously, and time of
+downloading depends on file size. Small voice message is usually
+downloaded in less than a second, large video can take tens of
+seconds. So, instead of fixed interval between checks, schedule
+is sized by file size and by throughput of Yandex.Disk that was
+observed recently:
+- first check is made when file is expected to be downloaded;
+- next checks are made with exponential backoff;
+- all checks should fit into time budget, which is derived
+from RQ job timeout and time that job already spent.
+
+- throughput history is stored in Redis and shared between
+all processes. If Redis is disabled, then default throughput
+(`YANDEX_DISK_API_DEFAULT_THROUGHPUT`) is used.
+"""
+
+from time import time
+from datetime import datetime
+from statistics import median
+from typing import Generator, Union
+
+from flask import g, current_app, has_app_context
+from rq import get_current_job
+
+from src.extensions import redis_client
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "operation_schedule"
+_THROUGHPUT_KEY = "throughput"
+
+# How many last throughput samples are stored
+_THROUGHPUT_SAMPLES_COUNT = 50
+
+# How long throughput history is stored after
+# last sample. In seconds
+_THROUGHPUT_EXPIRE = 60 * 60 * 24
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_throughput_key() -> str:
+    return _create_key(_NAMESPACE_KEY, _THROUGHPUT_KEY)
+
+
+def get_throughput() -> float:
+    """
+    :returns:
+    Median throughput (bytes per second) of Yandex.Disk
+    downloads that was observed recently.
+    """
+    default = current_app.config["YANDEX_DISK_API_DEFAULT_THROUGHPUT"]
+
+    if not redis_client.is_enabled:
+        return default
+
+    samples = redis_client.lrange(
+        _get_throughput_key(),
+        0,
+        -1
+    )
+
+    if not samples:
+        return default
+
+    return median(map(float, samples))
+
+
+def record_throughput(
+    file_size: Union[int, None],
+    pending_seconds: Union[float, None],
+    completed_seconds: float
+) -> None:
+    """
+    Adds throughput of completed operation into history.
+
+    Operation was completed somewhere between last check
+    that saw it pending and first check that saw it completed.
+    Middle of that interval is used as duration of operation.
+    Check delays are produced by schedule itself, so, using
+    time of completed check instead will make throughput
+    lower and lower with every next operation.
+
+    - operations that were completed at first check are not
+    recorded, because check delay is only upper bound of
+    their duration.
+    - files smaller than `YANDEX_DISK_API_THROUGHPUT_MIN_FILE_SIZE`
+    are not recorded.
+
+    :param file_size:
+    Size of downloaded file in bytes.
+    `None` if size is unknown, then nothing will be added.
+    :param pending_seconds:
+    How long (in seconds after start of operation) operation
+    was seen pending last time. `None` if it was never seen.
+    :param completed_seconds:
+    How long (in seconds after start of operation) operation
+    was seen completed first time.
+    """
+    min_file_size = current_app.config[
+        "YANDEX_DISK_API_THROUGHPUT_MIN_FILE_SIZE"
+    ]
+
+    if (
+        not redis_client.is_enabled or
+        not file_size or
+        (file_size < min_file_size) or
+        (pending_seconds is None) or
+        (completed_seconds <= pending_seconds)
+    ):
+        return
+
+    seconds = (pending_seconds + completed_seconds) / 2
+    key = _get_throughput_key()
+    pipeline = redis_client.pipeline()
+
+    pipeline.lpush(key, file_size / seconds)
+    pipeline.ltrim(key, 0, _THROUGHPUT_SAMPLES_COUNT - 1)
+    pipeline.expire(key, _THROUGHPUT_EXPIRE)
+
+    pipeline.execute(raise_on_error=True)
+
+
+def get_time_budget() -> float:
+    """
+    :returns:
+    How long (in seconds) status of operation can be checked.
+    It is timeout of current RQ job (or of current task if it is
+    not RQ job, or default upload job timeout if it is unknown)
+    minus time that job already spent (waiting for media group,
+    extracting of URL, etc.) and minus time that is reserved for
+    other actions of job (creating of folder, publishing, etc.).
+    """
+    config = current_app.config
+    timeout = config["RUNTIME_UPLOAD_WORKER_JOB_TIMEOUT"]
+    elapsed = 0
+    job = get_current_job()
+
+    if job:
+        if job.timeout and (job.timeout > 0):
+            timeout = job.timeout
+
+        if job.started_at:
+            elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+    elif has_app_context():
+        # see `run_registered_task()`
+        task_timeout = g.get("task_timeout")
+        task_started_at = g.get("task_started_at")
+
+        if task_timeout and (task_timeout > 0):
+            timeout = task_timeout
+
+        if task_started_at is not None:
+            elapsed = time() - task_started_at
+
+    timeout -= elapsed
+    reserve = config["YANDEX_DISK_API_CHECK_OPERATION_STATUS_RESERVE"]
+    min_interval = config[
+        "YANDEX_DISK_API_CHECK_OPERATION_STATUS_MIN_INTERVAL"
+    ]
+
+    return max(timeout - reserve, min_interval)
+
+
+def get_check_delay(
+    attempt: int,
+    file_size: Union[int, None],
+    throughput: float
+) -> float:
+    """
+    :param attempt:
+    Number of checks that were made already.
+    :param file_size:
+    Size of file in bytes. `None` if size is unknown.
+    :param throughput:
+    Expected throughput in bytes per second.
+    See `get_throughput()`.
+
+    :returns:
+    How long (in seconds) to wait before next check.
+    """
+    config = current_app.config
+    min_interval = config[
+        "YANDEX_DISK_API_CHECK_OPERATION_STATUS_MIN_INTERVAL"
+    ]
+    max_interval = config[
+        "YANDEX_DISK_API_CHECK_OPERATION_STATUS_MAX_INTERVAL"
+    ]
+    backoff = config["YANDEX_DISK_API_CHECK_OPERATION_STATUS_BACKOFF"]
+    expected_time = 0
+
+    if file_size and (throughput > 0):
+        expected_time = file_size / throughput
+
+    if (attempt == 0):
+        delay = expected_time
+    else:
+        # if file wasn't downloaded in expected time,
+        # then expected time was not very accurate, so,
+        # let's check again in a part of that time
+        delay = max(min_interval, expected_time / 4) * (backoff ** attempt)
+
+    return min(max(delay, min_interval), max_interval)
+
+
+def generate_check_delays(
+    file_size: Union[int, None],
+    time_budget: Union[float, None] = None
+) -> Generator[float, None, None]:
+    """
+    :param file_size:
+    Size of file in bytes. `None` if size is unknown.
+    :param time_budget:
+    How long (in seconds) status of operation can be checked.
+    `None` to use `get_time_budget()`.
+
+    :yields:
+    How long (in seconds) to wait before every next check.
+    Sum of all delays fits into time budget.
+    """
+    budget = time_budget or get_time_budget()
+    throughput = get_throughput()
+    attempt = 0
+
+    while (budget > 0):
+        delay = min(
+            get_check_delay(attempt, file_size, throughput),
+            budget
+        )
+        budget -= delay
+        attempt += 1
+
+        yield delay
@@ -0,0 +1,517 @@
+"""
+Central tracker of Yandex.Disk asynchronous operations.
+
+Yandex.Disk uploads file by URL asynchronously, so, status of
+operation should be checked again and again until it is completed.
+Without tracker this is done inside of RQ job, and that job holds
+RQ worker in `sleep()` for most of its time.
+
+With tracker RQ job only starts an operation and passes it to
+tracker using `track_operation()`. Tracker (separate process, see
+`python manage.py run-operation-tracker`) checks all outstanding
+operations in batches on a shared schedule. When status of operation
+changes, tracker enqueues follow-up job with callback task of operation.
+So, RQ workers are not held while Yandex.Disk fetches a file.
+
+- requires Redis and RQ to be enabled. Use
+`operation_tracker_is_enabled()` to check if tracker can be used.
+- operations are stored in Redis, so, multiple trackers can
+be run at the same time, and operations will survive restart.
+- follow-up jobs of same operation are not chained, so, failure of
+one of them doesn't block next ones. Every job has a sequence number,
+and callback should skip outdated jobs, see `take_callback_turn()`.
+"""
+
+import json
+import uuid
+import signal
+from time import time
+from threading import Event
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
+
+from flask import Flask, current_app
+
+from src.extensions import redis_client, task_queue
+from src.rq import TaskQueueName
+from src.rq.task import (
+    create_task_context,
+    run_registered_task
+)
+from .operation_schedule import (
+    get_throughput,
+    record_throughput,
+    get_check_delay
+)
+from .yandex_disk import (
+    check_operation_status,
+    YandexAPIRequestError,
+    YandexAPIUploadFileError,
+    YandexAPIExceededNumberOfStatusChecksError
+)
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "operation_tracker"
+_SCHEDULE_KEY = "schedule"
+_OPERATION_KEY = "operation"
+_CALLBACK_KEY = "callback"
+
+# How long (in milliseconds) taken operation will be hidden from
+# other trackers. If tracker crashes while checking an operation,
+# then operation will be checked again after this time
+_TAKE_LEASE_TIME = 60 * 1000
+
+# How long (in seconds) data of operation will be stored.
+# It is only protection against garbage in Redis, normally
+# operation will be removed after completion
+_OPERATION_EXPIRE = 60 * 60 * 24
+
+# How long to wait (in seconds) when there are
+# no operations to check, or after unexpected error
+IDLE_INTERVAL = 0.5
+
+# Takes operations that should be checked right now
+# and postpones them, so, other trackers will not take them.
+# KEYS[1] - schedule key.
+# ARGV[1] - current time in milliseconds.
+# ARGV[2] - maximum number of operations.
+# ARGV[3] - time in milliseconds until which operations are postponed.
+# Returns list of ID's of operations.
+_TAKE_SCRIPT = """
+local ids = redis.call(
+    "ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[2]
+)
+
+for _, id in ipairs(ids) do
+    redis.call("ZADD", KEYS[1], ARGV[3], id)
+end
+
+return ids
+"""
+
+# Remembers sequence number of callback if it is newer than
+# sequence number of callback that was handled before.
+# KEYS[1] - callback key.
+# ARGV[1] - sequence number.
+# ARGV[2] - expiration time in seconds.
+# Returns `1` if sequence number is newer, `0` otherwise.
+_TURN_SCRIPT = """
+local current = tonumber(redis.call("GET", KEYS[1]) or "0")
+
+if tonumber(ARGV[1]) <= current then
+    return 0
+end
+
+redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[2])
+
+return 1
+"""
+
+# Errors that are passed to callback
+_UPLOAD_ERROR = "upload"
+_STATUS_CHECKS_ERROR = "status_checks"
+
+_take_script = None
+_turn_script = None
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_schedule_key() -> str:
+    return _create_key(_NAMESPACE_KEY, _SCHEDULE_KEY)
+
+
+def _get_operation_key(operation_id: str) -> str:
+    return _create_key(_NAMESPACE_KEY, _OPERATION_KEY, operation_id)
+
+
+def _get_callback_key(operation_id: str) -> str:
+    return _create_key(_NAMESPACE_KEY, _CALLBACK_KEY, operation_id)
+
+
+def _get_take_script():
+    global _take_script
+
+    if _take_script is None:
+        _take_script = redis_client.register_script(_TAKE_SCRIPT)
+
+    return _take_script
+
+
+def _get_turn_script():
+    global _turn_script
+
+    if _turn_script is None:
+        _turn_script = redis_client.register_script(_TURN_SCRIPT)
+
+    return _turn_script
+
+
+def _dump_error(error: Union[Exception, None]) -> Union[dict, None]:
+    """
+    :returns:
+    JSON-serializable representation of tracking error.
+    """
+    if error is None:
+        return None
+
+    if isinstance(error, YandexAPIUploadFileError):
+        error_type = _UPLOAD_ERROR
+    else:
+        error_type = _STATUS_CHECKS_ERROR
+
+    return {
+        "type": error_type,
+        "message": str(error)
+    }
+
+
+def _get_current_time() -> int:
+    """
+    :returns:
+    Current time in milliseconds.
+    """
+    return int(time() * 1000)
+
+
+def _get_check_interval(operation: dict) -> int:
+    """
+    :returns:
+    After how many milliseconds operation should be checked again.
+    """
+    delay = get_check_delay(
+        operation["attempt"],
+        operation["file_size"],
+        operation["throughput"]
+    )
+
+    return int(delay * 1000)
+
+
+def operation_tracker_is_enabled() -> bool:
+    return (
+        current_app.config["RUNTIME_OPERATION_TRACKER_ENABLED"] and
+        redis_client.is_enabled and
+        task_queue.is_enabled
+    )
+
+
+def track_operation(
+    user_access_token: str,
+    operation_status_link: dict,
+    task_name: str,
+    task_kwargs: dict = {},
+    file_size: Union[int, None] = None
+) -> str:
+    """
+    Passes Yandex.Disk operation to tracker.
+
+    Callback task will be called in follow-up RQ job every time
+    when status of operation changes, and last time when operation
+    is completed or can't be tracked anymore. Task will be called
+    with `task_kwargs` and with `operation_id`, `sequence`, `status`
+    and `error` keyword arguments, where `status` is result of
+    `check_operation_status()` (or `None`), and `error` is an error
+    that occurred while tracking (or `None`). Use `load_error()`
+    to get `YandexAPIUploadFileError` or
+    `YandexAPIExceededNumberOfStatusChecksError` from `error`.
+
+    - follow-up jobs can be executed in any order, so,
+    callback should start with `take_callback_turn()`.
+    - context of current task (see `create_task_context()`)
+    is passed to follow-up jobs.
+
+    :param user_access_token:
+    Access token of user to access Yandex.Disk API.
+    :param operation_status_link:
+    Yandex link to operation status.
+    :param task_name:
+    Name of registered task (see `register_task()`)
+    that will be called from follow-up jobs.
+    :param task_kwargs:
+    Arguments of task. Should be serializable to JSON.
+    :param file_size:
+    Size of file in bytes. `None` if size is unknown.
+    It is used to schedule checks, see `operation_schedule.py`.
+
+    :returns:
+    ID of tracked operation.
+    """
+    operation_id = uuid.uuid4().hex
+    operation = {
+        "user_access_token": user_access_token,
+        "link": operation_status_link,
+        "task": {
+            "name": task_name,
+            "context": create_task_context(),
+            "kwargs": task_kwargs
+        },
+        "attempt": 0,
+        "status": None,
+        "sequence": 0,
+        "pending_at": None,
+        "file_size": file_size,
+        "throughput": get_throughput(),
+        "started_at": _get_current_time()
+    }
+    next_check = _get_current_time() + _get_check_interval(operation)
+    pipeline = redis_client.pipeline()
+
+    pipeline.set(
+        _get_operation_key(operation_id),
+        json.dumps(operation),
+        ex=_OPERATION_EXPIRE
+    )
+    pipeline.zadd(
+        _get_schedule_key(),
+        {operation_id: next_check}
+    )
+
+    pipeline.execute(raise_on_error=True)
+
+    return operation_id
+
+
+def take_operations(count: int) -> List[str]:
+    """
+    :returns:
+    ID's of operations that should be checked right now.
+    These operations will be not returned again until
+    they will be postponed or `_TAKE_LEASE_TIME` passes.
+    """
+    script = _get_take_script()
+    now = _get_current_time()
+
+    return script(
+        keys=[_get_schedule_key()],
+        args=[now, count, now + _TAKE_LEASE_TIME]
+    )
+
+
+def check_operation(operation_id: str) -> None:
+    """
+    Checks status of single operation and enqueues
+    follow-up job if status was changed.
+
+    - should be called within app context.
+    """
+    key = _get_operation_key(operation_id)
+    raw_operation = redis_client.get(key)
+
+    if raw_operation is None:
+        redis_client.zrem(_get_schedule_key(), operation_id)
+
+        return
+
+    operation = json.loads(raw_operation)
+    max_duration = current_app.config[
+        "RUNTIME_OPERATION_TRACKER_MAX_DURATION"
+    ] * 1000
+    status = None
+    error = None
+
+    operation["attempt"] += 1
+
+    try:
+        status = check_operation_status(
+            operation["user_access_token"],
+            operation["link"]
+        )
+    except YandexAPIRequestError as request_error:
+        # most probably it is temporary error,
+        # so, operation will be checked again
+        current_app.logger.warning(
+            f"Unable to check operation {operation_id}: {request_error}"
+        )
+    except YandexAPIUploadFileError as upload_error:
+        error = upload_error
+
+    completed = (
+        (error is not None) or
+        (status and status["completed"])
+    )
+    elapsed = _get_current_time() - operation["started_at"]
+
+    if status and status["success"]:
+        pending_at = operation.get("pending_at")
+
+        record_throughput(
+            operation["file_size"],
+            None if (pending_at is None) else (pending_at / 1000),
+            elapsed / 1000
+        )
+    elif status and not status["completed"]:
+        operation["pending_at"] = elapsed
+
+    if (
+        not completed and
+        (elapsed + _get_check_interval(operation) > max_duration)
+    ):
+        error = YandexAPIExceededNumberOfStatusChecksError()
+        completed = True
+
+    status_changed = (
+        (status is not None) and
+        (status["status"] != operation["status"])
+    )
+
+    if completed or status_changed:
+        operation["sequence"] += 1
+
+        enqueue_callback(operation_id, operation, status, error)
+
+    if status:
+        operation["status"] = status["status"]
+
+    pipeline = redis_client.pipeline()
+
+    if completed:
+        pipeline.delete(key)
+        pipeline.zrem(_get_schedule_key(), operation_id)
+    else:
+        next_check = _get_current_time() + _get_check_interval(operation)
+
+        pipeline.set(key, json.dumps(operation), ex=_OPERATION_EXPIRE)
+        pipeline.zadd(_get_schedule_key(), {operation_id: next_check})
+
+    pipeline.execute(raise_on_error=True)
+
+
+def enqueue_callback(
+    operation_id: str,
+    operation: dict,
+    status: Union[dict, None],
+    error: Union[Exception, None]
+):
+    """
+    Enqueues follow-up job with callback of operation.
+
+    - job doesn't depend on previous follow-up job of same
+    operation, because failed job will block all next ones
+    (including final one). Instead, every job has sequence
+    number, see `take_callback_turn()`.
+
+    :returns:
+    Enqueued RQ job.
+    """
+    config = current_app.config
+
+    task = operation["task"]
+
+    return task_queue.get_queue(
+        TaskQueueName.NOTIFICATIONS.value
+    ).enqueue(
+        run_registered_task,
+        kwargs={
+            "name": task["name"],
+            "context": task["context"],
+            "kwargs": {
+                **task["kwargs"],
+                "operation_id": operation_id,
+                "sequence": operation["sequence"],
+                "status": status,
+                "error": _dump_error(error)
+            }
+        },
+        job_timeout=config["RUNTIME_UPLOAD_WORKER_JOB_TIMEOUT"],
+        ttl=config["RUNTIME_UPLOAD_WORKER_UPLOAD_TTL"],
+        result_ttl=config["RUNTIME_UPLOAD_WORKER_RESULT_TTL"],
+        failure_ttl=config["RUNTIME_UPLOAD_WORKER_FAILURE_TTL"]
+    )
+
+
+def take_callback_turn(operation_id: str, sequence: int) -> bool:
+    """
+    Should be called at start of callback of operation.
+
+    - should be called within app context.
+
+    :returns:
+    `True` if callback should be handled, `False` if newer
+    callback of same operation was already handled, so,
+    this one is outdated and should be skipped.
+    """
+    script = _get_turn_script()
+
+    return bool(
+        script(
+            keys=[_get_callback_key(operation_id)],
+            args=[sequence, _OPERATION_EXPIRE]
+        )
+    )
+
+
+def load_error(error: Union[dict, None]) -> Union[Exception, None]:
+    """
+    :param error:
+    `error` argument of callback.
+
+    :returns:
+    Exception that occurred while tracking.
+    `None` if there was no error.
+    """
+    if error is None:
+        return None
+
+    if error["type"] == _UPLOAD_ERROR:
+        return YandexAPIUploadFileError(error["message"])
+
+    return YandexAPIExceededNumberOfStatusChecksError(error["message"])
+
+
+def run_tracker(app: Flask) -> None:
+    """
+    Runs tracker of operations and blocks
+    until SIGINT or SIGTERM will be received.
+
+    - `RUNTIME_OPERATION_TRACKER_CONCURRENCY` operations
+    are checked at the same time.
+    - you can run as many trackers as you want.
+
+    :param app:
+    Flask app that will be used to check operations.
+    """
+    config = app.config
+    batch_size = config["RUNTIME_OPERATION_TRACKER_BATCH_SIZE"]
+    concurrency = config["RUNTIME_OPERATION_TRACKER_CONCURRENCY"]
+    stop_event = Event()
+
+    def stop(*args):
+        app.logger.info("Stopping operation tracker")
+        stop_event.set()
+
+    def check(operation_id: str):
+        with app.app_context():
+            try:
+                check_operation(operation_id)
+            except Exception:
+                app.logger.exception(
+                    f"Unable to check operation {operation_id}"
+                )
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    app.logger.info("Started operation tracker")
+
+    with app.app_context(), ThreadPoolExecutor(concurrency) as executor:
+        while not stop_event.is_set():
+            operation_ids = []
+
+            try:
+                operation_ids = take_operations(batch_size)
+            except Exception:
+                app.logger.exception("Unable to take operations")
+
+            if not operation_ids:
+                stop_event.wait(IDLE_INTERVAL)
+
+                continue
+
+            # wait for whole batch, so, next batch
+            # will not take same operations again
+            list(executor.map(check, operation_ids))
@@ -54,8 +54,10 @@ If you call register function again for same handler, then old timeout
 will be removed, and new one with this value will be setted.
 `events` - iterable of unique events for that dispatcher.
 Note: if you want to use `Enum`, then pass values of that enum, not
-objects itself. Redis will return back strings even if you will pass
-int values, so, be aware of it when comparing these values.
+objects itself. Events are stored as bit mask, so, every event should be
+a string with integer from 0 to 30 (`DispatcherEvent` values), because
+Lua `bit` library of Redis works with 32-bit integers. Functions
+will return back strings, so, be aware of it when comparing these values.
 Note: return result is an unordered. So, you shouldn't rely on order.
 
 "Subscribed handlers" means you can register any amount of handlers for
@@ -69,11 +71,35 @@ Documentation of function arguments is same as for "disposable handler".
 Note: these handlers stored in a set, so, you can safely call register
 function which registers same handler from different functions, and result
 will be one registered handler.
+
+"Routing" functions.
+
+`route_handlers` implements recommended routing of events to disposable
+and subscribed handlers in single Redis call (server-side script), so,
+dispatcher will not make separate requests for every step. Because script
+is atomic, disposable handler will be taken by only one message even if
+multiple messages are handled at the same time. If no handler is matched,
+then `direct_handler` will be used; handler will be memorized in user chat
+data under `data_key`. If there is no `direct_handler`, then handler from
+`data_key` will be used. Returns route (see `ROUTE_*` constants) and names of
+matched handlers; route is `None` if nothing is matched.
+
+"Storage".
+
+All data of one namespace (user in chat, user, chat) is stored in single
+Redis hash: custom data, disposable handler and subscribed handlers are
+fields of that hash. Every field value is prefixed with expiration time of
+that field (Unix time in seconds, `0` for permanent), so, expired fields are
+ignored on reading and removed on writing. Expiration of entire hash is equal
+to maximum expiration time of its fields, so, Redis will remove hash when all
+fields are expired. Use `migrate_legacy_keys` to convert data stored by old
+versions (separate string and set keys for every value).
 """
 
 
 from collections import deque
-from typing import Union, Set
+from time import time
+from typing import Union, Set, List, Tuple, Iterable
 
 from src.extensions import redis_client
 
@@ -92,11 +118,179 @@ _NAME_KEY = "name"
 _EVENTS_KEY = "events"
 _SUBSCRIBED_HANDLERS_KEY = "subscribed_handlers"
 
+# Fields of namespace hash
+_DATA_FIELD = "custom_data"
+_DISPOSABLE_HANDLER_FIELD = "disposable_handler"
+_SUBSCRIBED_HANDLER_FIELD = "subscribed_handler"
+
+# Maximum value of event. Events are stored as bit mask,
+# and Lua `bit` library of Redis uses 32-bit integers
+_MAX_EVENT = 30
+
+# Removes expired fields of hash and sets expiration
+# of hash to maximum expiration of its fields.
+# Every field value starts with `<expire_at>:`.
+_LUA_REFRESH_EXPIRE = """
+local function refresh_expire(key, now)
+    local data = redis.call("HGETALL", key)
+    local max_expire_at = 0
+    local is_permanent = false
+
+    for i = 1, #data, 2 do
+        local expire_at = tonumber(string.match(data[i + 1], "^(%d+):")) or 0
+
+        if expire_at == 0 then
+            is_permanent = true
+        elseif expire_at <= now then
+            redis.call("HDEL", key, data[i])
+        elseif expire_at > max_expire_at then
+            max_expire_at = expire_at
+        end
+    end
+
+    if is_permanent then
+        redis.call("PERSIST", key)
+    elseif max_expire_at > 0 then
+        redis.call("EXPIREAT", key, max_expire_at)
+    end
+end
+"""
+
+# Sets or deletes single field of hash.
+# KEYS[1] - namespace hash.
+# ARGV[1] - current time in seconds.
+# ARGV[2] - field.
+# ARGV[3] - encoded value, empty string to delete field.
+# ARGV[4] - `1` to set only if field not exists.
+_SET_FIELD_SCRIPT = _LUA_REFRESH_EXPIRE + """
+if ARGV[3] == "" then
+    redis.call("HDEL", KEYS[1], ARGV[2])
+elseif ARGV[4] == "1" then
+    redis.call("HSETNX", KEYS[1], ARGV[2], ARGV[3])
+else
+    redis.call("HSET", KEYS[1], ARGV[2], ARGV[3])
+end
+
+refresh_expire(KEYS[1], tonumber(ARGV[1]))
+"""
+
+_set_field_script = None
+
 
 def _create_key(*args) -> str:
     return _SEPARATOR.join(map(str, args))
 
 
+def _get_set_field_script():
+    global _set_field_script
+
+    if _set_field_script is None:
+        _set_field_script = redis_client.register_script(
+            _SET_FIELD_SCRIPT
+        )
+
+    return _set_field_script
+
+
+def _get_current_time() -> int:
+    return int(time())
+
+
+def _create_namespace_key(*args) -> str:
+    return _create_key(_NAMESPACE_KEY, *args)
+
+
+def _get_expire_at(expire: int) -> int:
+    """
+    :param expire:
+    After how many seconds value should expire.
+    `0` for permanent value.
+
+    :returns:
+    Unix time in seconds, `0` for permanent value.
+    """
+    return (_get_current_time() + expire) if (expire > 0) else 0
+
+
+def _encode_value(expire: int, *args) -> str:
+    return _create_key(_get_expire_at(expire), *args)
+
+
+def _decode_value(
+    value: Union[str, None],
+    parts_count: int = 1
+) -> Union[List[str], None]:
+    """
+    :returns:
+    Parts of value without expiration time,
+    `None` if value not exists or expired.
+    """
+    if value is None:
+        return None
+
+    expire_at, *parts = value.split(_SEPARATOR, parts_count)
+    expire_at = int(expire_at)
+
+    if (
+        (expire_at > 0) and
+        (expire_at <= _get_current_time())
+    ):
+        return None
+
+    return parts
+
+
+def _encode_events(events: Iterable[str]) -> int:
+    mask = 0
+
+    for event in events:
+        event = int(event)
+
+        # mask is compared by Lua `bit` library of Redis,
+        # which works with signed 32-bit integers
+        if not (0 <= event <= _MAX_EVENT):
+            raise ValueError(
+                f"Event should be from 0 to {_MAX_EVENT}, got {event}"
+            )
+
+        mask |= (1 << event)
+
+    return mask
+
+
+def _decode_events(mask: Union[int, str]) -> Set[str]:
+    mask = int(mask)
+
+    return set(
+        str(i) for i in range(mask.bit_length()) if (mask >> i) & 1
+    )
+
+
+def _set_field(
+    key: str,
+    field: str,
+    value: str,
+    only_if_not_exists: bool = False
+) -> None:
+    """
+    Sets field of namespace hash and refreshes expiration of hash.
+
+    :param value:
+    Encoded value. Use empty string to delete field.
+    """
+    script = _get_set_field_script()
+
+    script(
+        keys=[key],
+        args=[
+            _get_current_time(),
+            field,
+            value,
+            "1" if only_if_not_exists else "0"
+        ]
+    )
+
+
 def stateful_chat_is_enabled() -> bool:
     return redis_client.is_enabled
 
@@ -113,32 +307,35 @@ def _set_data(
     value: str,
     expire: int
 ) -> None:
-    key = _create_key(_NAMESPACE_KEY, key, _DATA_KEY, field)
-    pipeline = redis_client.pipeline()
-
-    pipeline.set(key, value)
-
-    if (expire > 0):
-        pipeline.expire(key, expire)
-
-    pipeline.execute(raise_on_error=True)
+    _set_field(
+        _create_namespace_key(key),
+        _create_key(_DATA_FIELD, field),
+        _encode_value(expire, value)
+    )
 
 
 def _get_data(
     key: str,
     field: str
 ) -> Union[str, None]:
-    return redis_client.get(
-        _create_key(_NAMESPACE_KEY, key, _DATA_KEY, field)
+    value = _decode_value(
+        redis_client.hget(
+            _create_namespace_key(key),
+            _create_key(_DATA_FIELD, field)
+        )
     )
 
+    return value[0] if value else None
+
 
 def _delete_data(
     key: str,
     field: str
 ) -> None:
-    redis_client.delete(
-        _create_key(_NAMESPACE_KEY, key, _DATA_KEY, field)
+    _set_field(
+        _create_namespace_key(key),
+        _create_key(_DATA_FIELD, field),
+        ""
     )
 
 
@@ -260,76 +457,31 @@ def set_disposable_handler(
     events: Set[str],
     expire: int = 0
 ) -> None:
-    name_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _DISPOSABLE_HANDLER_KEY,
-        _NAME_KEY
+    _set_field(
+        _create_namespace_key(_USER_KEY, user, _CHAT_KEY, chat),
+        _DISPOSABLE_HANDLER_FIELD,
+        _encode_value(expire, _encode_events(events), handler)
     )
-    events_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _DISPOSABLE_HANDLER_KEY,
-        _EVENTS_KEY
-    )
-    pipeline = redis_client.pipeline()
-
-    pipeline.set(name_key, handler)
-    # in case of update (same name for already
-    # existing handler) we need to delete old events
-    # in order to not merge them with new ones.
-    # also, `sadd` don't clears expire, but
-    # `delete` does
-    pipeline.delete(events_key)
-    pipeline.sadd(events_key, *events)
-
-    if (expire > 0):
-        pipeline.expire(name_key, expire)
-        pipeline.expire(events_key, expire)
-
-    pipeline.execute(raise_on_error=True)
 
 
 def get_disposable_handler(
     user: str,
     chat: str
 ) -> Union[dict, None]:
-    name_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _DISPOSABLE_HANDLER_KEY,
-        _NAME_KEY
+    value = _decode_value(
+        redis_client.hget(
+            _create_namespace_key(_USER_KEY, user, _CHAT_KEY, chat),
+            _DISPOSABLE_HANDLER_FIELD
+        ),
+        2
     )
-    events_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _DISPOSABLE_HANDLER_KEY,
-        _EVENTS_KEY
-    )
-    pipeline = redis_client.pipeline()
-
-    pipeline.get(name_key)
-    pipeline.smembers(events_key)
-
-    name, events = pipeline.execute(raise_on_error=True)
     result = None
 
-    if name:
+    if value:
+        events, name = value
         result = {
             "name": name,
-            "events": events
+            "events": _decode_events(events)
         }
 
     return result
@@ -339,30 +491,11 @@ def delete_disposable_handler(
     user: str,
     chat: str
 ) -> None:
-    name_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _DISPOSABLE_HANDLER_KEY,
-        _NAME_KEY
+    _set_field(
+        _create_namespace_key(_USER_KEY, user, _CHAT_KEY, chat),
+        _DISPOSABLE_HANDLER_FIELD,
+        ""
     )
-    events_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _DISPOSABLE_HANDLER_KEY,
-        _EVENTS_KEY
-    )
-    pipeline = redis_client.pipeline()
-
-    pipeline.delete(name_key)
-    pipeline.delete(events_key)
-
-    pipeline.execute(raise_on_error=True)
 
 
 def subscribe_handler(
@@ -372,47 +505,14 @@ def subscribe_handler(
     events: Set[str],
     expire: int = 0
 ) -> None:
-    # In this set stored all handler names
-    # that were registered. It is not indicator
-    # if handler is registered at the moment of check.
-    subscribed_handlers_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _SUBSCRIBED_HANDLERS_KEY
-    )
-    # Example - `...:<handler_name>:events`.
-    # In this set stored all events for this handler.
-    # If `events_key` doesn't exists or empty, then it is
-    # indicates that handler not registered anymore and
-    # should be removed from `subscribed_handlers_key`.
-    events_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _SUBSCRIBED_HANDLERS_KEY,
-        handler,
-        _EVENTS_KEY
-    )
-    pipeline = redis_client.pipeline()
-
-    pipeline.sadd(subscribed_handlers_key, handler)
     # in case of update (same name for already
-    # existing handler) we need to delete old events
-    # in order to not merge them with new ones.
-    # also, `sadd` don't clears expire, but
-    # `delete` does
-    pipeline.delete(events_key)
-    pipeline.sadd(events_key, *events)
-
-    if (expire > 0):
-        pipeline.expire(events_key)
-
-    pipeline.execute(raise_on_error=True)
+    # existing handler) old events and expiration
+    # will be replaced with new ones
+    _set_field(
+        _create_namespace_key(_USER_KEY, user, _CHAT_KEY, chat),
+        _create_key(_SUBSCRIBED_HANDLER_FIELD, handler),
+        _encode_value(expire, _encode_events(events))
+    )
 
 
 def unsubcribe_handler(
@@ -420,93 +520,435 @@ def unsubcribe_handler(
     chat: str,
     handler: str
 ) -> None:
-    subscribed_handlers_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _SUBSCRIBED_HANDLERS_KEY
-    )
-    events_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _SUBSCRIBED_HANDLERS_KEY,
-        handler,
-        _EVENTS_KEY
+    _set_field(
+        _create_namespace_key(_USER_KEY, user, _CHAT_KEY, chat),
+        _create_key(_SUBSCRIBED_HANDLER_FIELD, handler),
+        ""
     )
-    pipeline = redis_client.pipeline()
-
-    pipeline.srem(subscribed_handlers_key, handler)
-    pipeline.delete(events_key)
-
-    pipeline.execute(raise_on_error=True)
 
 
 def get_subscribed_handlers(
     user: str,
     chat: str
 ) -> deque:
-    subscribed_handlers_key = _create_key(
-        _NAMESPACE_KEY,
-        _USER_KEY,
-        user,
-        _CHAT_KEY,
-        chat,
-        _SUBSCRIBED_HANDLERS_KEY
+    data = redis_client.hgetall(
+        _create_namespace_key(_USER_KEY, user, _CHAT_KEY, chat)
     )
-    possible_handlers = redis_client.smembers(
-        subscribed_handlers_key
-    )
-    pipeline = redis_client.pipeline()
-
-    for possible_handler in possible_handlers:
-        pipeline.smembers(
-            _create_key(
-                _NAMESPACE_KEY,
-                _USER_KEY,
-                user,
-                _CHAT_KEY,
-                chat,
-                _SUBSCRIBED_HANDLERS_KEY,
-                possible_handler,
-                _EVENTS_KEY
-            )
-        )
-
-    events = pipeline.execute(raise_on_error=True)
+    prefix = _create_key(_SUBSCRIBED_HANDLER_FIELD, "")
     subscribed_handlers = deque()
-    i = 0
-
-    # `possible_handlers` is a set.
-    # Set it is an unordered structure, so, order
-    # of iteration not guaranted from time to time
-    # (for example, from first script execution to second
-    # script execution).
-    # However, in Python order of set iteration in
-    # single run is a same (if set wasn't modified),
-    # so, we can safely iterate this set one more time
-    # and associate it values with another values
-    # through `i` counter (`events` is an array).
-    # See for more: https://stackoverflow.com/q/3848091/8445442
-    for handler_name in possible_handlers:
-        handler_events = events[i]
-        i += 1
-
-        # see `subscribe_handler` documentation for
-        # why this check works so
-        if handler_events:
+
+    for field, value in data.items():
+        if not field.startswith(prefix):
+            continue
+
+        # expired handlers will be removed
+        # from hash on next writing
+        value = _decode_value(value)
+
+        if value:
             subscribed_handlers.append({
-                "name": handler_name,
-                "events": handler_events
+                "name": field[len(prefix):],
+                "events": _decode_events(value[0])
             })
-        else:
-            unsubcribe_handler(user, chat, handler_name)
 
     return subscribed_handlers
 
 
 # endregion
+
+
+# region Routing
+
+
+ROUTE_DISPOSABLE_HANDLER = "disposable_handler"
+ROUTE_SUBSCRIBED_HANDLERS = "subscribed_handlers"
+ROUTE_DIRECT_HANDLER = "direct_handler"
+ROUTE_DATA_HANDLER = "data_handler"
+
+# KEYS[1] - namespace hash of user in chat.
+# ARGV[1] - current time in seconds.
+# ARGV[2] - events mask.
+# ARGV[3] - direct handler, empty string if there is no one.
+# ARGV[4] - field of custom data for handler.
+# ARGV[5] - expiration time of custom data, `0` for permanent.
+# ARGV[6] - field of disposable handler.
+# ARGV[7] - prefix of fields of subscribed handlers.
+# ARGV[8...11] - routes (disposable, subscribed, direct, data).
+# Returns `{route, handler names...}`, route is empty
+# string if nothing is matched.
+_ROUTE_SCRIPT = _LUA_REFRESH_EXPIRE + """
+local now = tonumber(ARGV[1])
+local events = tonumber(ARGV[2])
+local route = ""
+local handlers = {}
+
+local function is_alive(expire_at)
+    expire_at = tonumber(expire_at)
+
+    if not expire_at then
+        return false
+    end
+
+    return (expire_at == 0) or (expire_at > now)
+end
+
+local function is_matched(expire_at, mask)
+    return is_alive(expire_at) and (bit.band(tonumber(mask), events) ~= 0)
+end
+
+local disposable_handler = redis.call("HGET", KEYS[1], ARGV[6])
+
+if disposable_handler then
+    local expire_at, mask, name = string.match(
+        disposable_handler, "^(%d+):(%d+):(.*)$"
+    )
+
+    if is_matched(expire_at, mask) then
+        redis.call("HDEL", KEYS[1], ARGV[6])
+
+        route = ARGV[8]
+        handlers[1] = name
+    end
+end
+
+if route == "" then
+    local data = redis.call("HGETALL", KEYS[1])
+    local prefix_length = string.len(ARGV[7])
+
+    for i = 1, #data, 2 do
+        if string.sub(data[i], 1, prefix_length) == ARGV[7] then
+            local expire_at, mask = string.match(
+                data[i + 1], "^(%d+):(%d+)$"
+            )
+
+            if is_matched(expire_at, mask) then
+                local name = string.sub(data[i], prefix_length + 1)
+
+                handlers[#handlers + 1] = name
+            end
+        end
+    end
+
+    if #handlers > 0 then
+        route = ARGV[9]
+    end
+end
+
+if route == "" and ARGV[3] ~= "" then
+    route = ARGV[10]
+    handlers[1] = ARGV[3]
+end
+
+if route == ARGV[8] or route == ARGV[10] then
+    redis.call("HSET", KEYS[1], ARGV[4], ARGV[5] .. ":" .. handlers[1])
+elseif route == "" then
+    local data_handler = redis.call("HGET", KEYS[1], ARGV[4])
+
+    if data_handler then
+        local expire_at, name = string.match(data_handler, "^(%d+):(.*)$")
+
+        if is_alive(expire_at) then
+            route = ARGV[11]
+            handlers[1] = name
+        end
+    end
+end
+
+if route == ARGV[8] or route == ARGV[10] then
+    refresh_expire(KEYS[1], now)
+end
+
+return {route, unpack(handlers)}
+"""
+
+_route_script = None
+
+
+def _get_route_script():
+    global _route_script
+
+    if _route_script is None:
+        _route_script = redis_client.register_script(_ROUTE_SCRIPT)
+
+    return _route_script
+
+
+def route_handlers(
+    user: str,
+    chat: str,
+    events: Set[str],
+    direct_handler: Union[str, None],
+    data_key: str,
+    data_expire: int = 0
+) -> Tuple[Union[str, None], List[str]]:
+    script = _get_route_script()
+    route, *handlers = script(
+        keys=[
+            _create_namespace_key(_USER_KEY, user, _CHAT_KEY, chat)
+        ],
+        args=[
+            _get_current_time(),
+            _encode_events(events),
+            direct_handler or "",
+            _create_key(_DATA_FIELD, data_key),
+            _get_expire_at(data_expire),
+            _DISPOSABLE_HANDLER_FIELD,
+            _create_key(_SUBSCRIBED_HANDLER_FIELD, ""),
+            ROUTE_DISPOSABLE_HANDLER,
+            ROUTE_SUBSCRIBED_HANDLERS,
+            ROUTE_DIRECT_HANDLER,
+            ROUTE_DATA_HANDLER
+        ]
+    )
+
+    return (route or None, handlers)
+
+
+# endregion
+
+
+# region Migration
+
+
+def _get_legacy_expire(key: str) -> Union[int, None]:
+    """
+    :returns:
+    Remaining time of legacy key in seconds (`0` for
+    permanent key), `None` if key not exists.
+    """
+    ttl = redis_client.ttl(key)
+
+    if (ttl == -2):
+        return None
+
+    return max(ttl, 0)
+
+
+def _split_legacy_key(key: str, marker: str) -> Tuple[str, str]:
+    """
+    :returns:
+    Namespace (for example, `user:1:chat:2`) and
+    remaining part of legacy key after `marker`.
+    """
+    namespace, remaining = key[
+        len(_create_key(_NAMESPACE_KEY, "")):
+    ].split(
+        _create_key("", marker),
+        1
+    )
+
+    # remove separator after marker
+    return (namespace, remaining[len(_SEPARATOR):])
+
+
+def _remove_legacy_key(key: str, report: dict) -> None:
+    memory = redis_client.memory_usage(key) or 0
+
+    if redis_client.delete(key):
+        report["legacy_keys"] += 1
+        report["legacy_memory"] += memory
+
+
+def _migrate_legacy_data(key: str, report: dict) -> Union[str, None]:
+    namespace, field = _split_legacy_key(key, _DATA_KEY)
+    value = redis_client.get(key)
+    expire = _get_legacy_expire(key)
+
+    _remove_legacy_key(key, report)
+
+    if (value is None) or (expire is None):
+        return None
+
+    _set_field(
+        _create_namespace_key(namespace),
+        _create_key(_DATA_FIELD, field),
+        _encode_value(expire, value),
+        only_if_not_exists=True
+    )
+    report["migrated_values"] += 1
+
+    return namespace
+
+
+def _migrate_legacy_disposable_handler(
+    key: str,
+    report: dict
+) -> Union[str, None]:
+    namespace, _ = _split_legacy_key(key, _DISPOSABLE_HANDLER_KEY)
+    events_key = _create_key(
+        _NAMESPACE_KEY,
+        namespace,
+        _DISPOSABLE_HANDLER_KEY,
+        _EVENTS_KEY
+    )
+    name = redis_client.get(key)
+    events = redis_client.smembers(events_key)
+    expire = _get_legacy_expire(key)
+
+    _remove_legacy_key(key, report)
+    _remove_legacy_key(events_key, report)
+
+    if (not name) or (not events) or (expire is None):
+        return None
+
+    _set_field(
+        _create_namespace_key(namespace),
+        _DISPOSABLE_HANDLER_FIELD,
+        _encode_value(expire, _encode_events(events), name),
+        only_if_not_exists=True
+    )
+    report["migrated_values"] += 1
+
+    return namespace
+
+
+def _migrate_legacy_subscribed_handlers(
+    key: str,
+    report: dict
+) -> Union[str, None]:
+    namespace, _ = _split_legacy_key(key, _SUBSCRIBED_HANDLERS_KEY)
+    handlers = redis_client.smembers(key)
+    migrated = False
+
+    _remove_legacy_key(key, report)
+
+    for handler in handlers:
+        events_key = _create_key(
+            _NAMESPACE_KEY,
+            namespace,
+            _SUBSCRIBED_HANDLERS_KEY,
+            handler,
+            _EVENTS_KEY
+        )
+        events = redis_client.smembers(events_key)
+        expire = _get_legacy_expire(events_key)
+
+        _remove_legacy_key(events_key, report)
+
+        if (not events) or (expire is None):
+            continue
+
+        _set_field(
+            _create_namespace_key(namespace),
+            _create_key(_SUBSCRIBED_HANDLER_FIELD, handler),
+            _encode_value(expire, _encode_events(events)),
+            only_if_not_exists=True
+        )
+        report["migrated_values"] += 1
+        migrated = True
+
+    return namespace if migrated else None
+
+
+def migrate_legacy_keys(batch_size: int = 1000) -> dict:
+    """
+    Converts data stored by old versions (separate string and
+    set keys for every value) into namespace hashes. Legacy keys
+    will be removed after conversion.
+
+    - can be used while app is running: keys are iterated with
+    `SCAN` (Redis is not blocked) and existing fields of hashes
+    will be not overwritten by legacy values.
+    - can be called multiple times.
+
+    :param batch_size:
+    `COUNT` hint for `SCAN`.
+
+    :returns:
+    Report with following keys:
+    `legacy_keys` - number of removed legacy keys;
+    `legacy_memory` - memory (bytes) used by legacy keys;
+    `migrated_values` - number of converted values (some
+    legacy values can be already expired or incomplete);
+    `hash_keys` - number of namespace hashes that got values;
+    `hash_memory` - memory (bytes) used by these hashes;
+    `used_memory_before`, `used_memory_after` - total
+    memory used by Redis before and after migration.
+    """
+    report = {
+        "legacy_keys": 0,
+        "legacy_memory": 0,
+        "migrated_values": 0,
+        "hash_keys": 0,
+        "hash_memory": 0,
+        "used_memory_before": redis_client.info("memory")["used_memory"],
+        "used_memory_after": 0
+    }
+    namespaces = set()
+    data_marker = _create_key("", _DATA_KEY, "")
+    disposable_handler_postfix = _create_key(
+        "",
+        _DISPOSABLE_HANDLER_KEY,
+        _NAME_KEY
+    )
+    subscribed_handlers_postfix = _create_key(
+        "",
+        _SUBSCRIBED_HANDLERS_KEY
+    )
+    disposable_handler_marker = _create_key(
+        "",
+        _DISPOSABLE_HANDLER_KEY,
+        ""
+    )
+    events_postfix = _create_key("", _EVENTS_KEY)
+
+    for key in redis_client.scan_iter(
+        match=_create_key(_NAMESPACE_KEY, "*"),
+        count=batch_size
+    ):
+        key_type = redis_client.type(key)
+        namespace = None
+
+        # new layout or key already removed
+        if key_type not in ("string", "set"):
+            continue
+
+        if (key_type == "string") and (data_marker in key):
+            namespace = _migrate_legacy_data(key, report)
+        elif key.endswith(disposable_handler_postfix):
+            namespace = _migrate_legacy_disposable_handler(key, report)
+        elif key.endswith(subscribed_handlers_postfix):
+            namespace = _migrate_legacy_subscribed_handlers(key, report)
+        elif key.endswith(events_postfix):
+            # events of handlers are migrated together with names
+            # of handlers. If there is no names, then it is garbage
+            if disposable_handler_marker in key:
+                legacy_namespace, _ = _split_legacy_key(
+                    key,
+                    _DISPOSABLE_HANDLER_KEY
+                )
+                names_key = _create_key(
+                    _NAMESPACE_KEY,
+                    legacy_namespace,
+                    _DISPOSABLE_HANDLER_KEY,
+                    _NAME_KEY
+                )
+            else:
+                legacy_namespace, _ = _split_legacy_key(
+                    key,
+                    _SUBSCRIBED_HANDLERS_KEY
+                )
+                names_key = _create_key(
+                    _NAMESPACE_KEY,
+                    legacy_namespace,
+                    _SUBSCRIBED_HANDLERS_KEY
+                )
+
+            if not redis_client.exists(names_key):
+                _remove_legacy_key(key, report)
+
+        if namespace:
+            namespaces.add(namespace)
+
+    for namespace in namespaces:
+        report["hash_memory"] += redis_client.memory_usage(
+            _create_namespace_key(namespace)
+        ) or 0
+
+    report["hash_keys"] = len(namespaces)
+    report["used_memory_after"] = redis_client.info("memory")["used_memory"]
+
+    return report
+
+
+# endregion
@@ -0,0 +1,215 @@
+"""
+Debouncing of status message edits.
+
+Status of uploading is logged to user by editing of same message.
+Intermediate statuses (for example, "in progress") are changed often
+and nobody reads them, but every edit consumes Telegram rate limit.
+So, edits of every message are coalesced:
+- at most one intermediate edit every
+`RUNTIME_STATUS_UPDATE_INTERVAL` seconds (first sending of
+message counts as edit, see `remember_sent_message()`);
+- intermediate edit that was skipped because of interval is
+deferred: caller should try it again as trailing edit when
+interval ends. Trailing edit is sent only if no newer status
+was sent or deferred in the meantime, so, latest status is
+never lost;
+- final state is always sent;
+- edit with same text (after normalization) is never sent.
+
+- state of every message is stored in Redis, so, edits are
+coalesced even if they are made by different processes (for
+example, by different jobs of operation tracker).
+- if Redis is disabled, then caller should keep state by itself.
+"""
+
+import re
+import html
+import hashlib
+from time import time
+from typing import Tuple, Union
+
+from flask import current_app
+
+from src.extensions import redis_client
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "status_updates"
+_MESSAGE_KEY = "message"
+
+# How long state of message is stored after last edit. In seconds
+_MESSAGE_EXPIRE = 60 * 60
+
+_HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# Kinds of edit
+_INTERMEDIATE = "intermediate"
+_FINAL = "final"
+_TRAILING = "trailing"
+
+# KEYS[1] - message key
+# ARGV[1] - digest of normalized text
+# ARGV[2] - current timestamp
+# ARGV[3] - minimal interval between edits
+# ARGV[4] - kind of edit (intermediate, final or trailing)
+# ARGV[5] - expire in seconds
+#
+# returns `{1, 0}` if edit should be sent, `{0, 0}` if edit should
+# be skipped, `{0, delay}` if edit was deferred for `delay` milliseconds
+_TAKE_SCRIPT = """
+local state = redis.call(
+    "HMGET", KEYS[1], "digest", "edited_at", "pending"
+)
+
+if ARGV[4] == "trailing" then
+    if state[3] ~= ARGV[1] then
+        return {0, 0}
+    end
+elseif state[1] == ARGV[1] then
+    redis.call("HDEL", KEYS[1], "pending")
+
+    return {0, 0}
+elseif (ARGV[4] == "intermediate") and state[2] then
+    local elapsed = tonumber(ARGV[2]) - tonumber(state[2])
+
+    if elapsed < tonumber(ARGV[3]) then
+        redis.call("HSET", KEYS[1], "pending", ARGV[1])
+        redis.call("EXPIRE", KEYS[1], ARGV[5])
+
+        return {0, math.ceil((tonumber(ARGV[3]) - elapsed) * 1000)}
+    end
+end
+
+redis.call("HMSET", KEYS[1], "digest", ARGV[1], "edited_at", ARGV[2])
+redis.call("HDEL", KEYS[1], "pending")
+redis.call("EXPIRE", KEYS[1], ARGV[5])
+
+return {1, 0}
+"""
+
+_take_script = None
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_message_key(chat_id: int, message_id: int) -> str:
+    return _create_key(_NAMESPACE_KEY, _MESSAGE_KEY, chat_id, message_id)
+
+
+def _get_take_script():
+    global _take_script
+
+    if _take_script is None:
+        _take_script = redis_client.register_script(_TAKE_SCRIPT)
+
+    return _take_script
+
+
+def status_updates_is_enabled() -> bool:
+    return redis_client.is_enabled
+
+
+def normalize_text(text: str, html_text=False) -> str:
+    """
+    :param text:
+    Text of message.
+    :param html_text:
+    `text` contains HTML markup.
+
+    :returns:
+    Text as Telegram will show it (and will return it
+    back in message object). Texts that look the same
+    for user will have same normalized text.
+    """
+    if html_text:
+        text = _HTML_TAG_PATTERN.sub("", text)
+        text = html.unescape(text)
+
+    lines = [line.rstrip() for line in text.strip().splitlines()]
+
+    return "\n".join(lines)
+
+
+def get_digest(normalized_text: str) -> str:
+    return hashlib.sha256(normalized_text.encode()).hexdigest()
+
+
+def remember_sent_message(
+    chat_id: int,
+    message_id: int,
+    normalized_text: str
+) -> None:
+    """
+    Remembers that message was just sent, so,
+    first edit will be debounced against it.
+
+    :param normalized_text:
+    Text of message, see `normalize_text()`.
+    """
+    key = _get_message_key(chat_id, message_id)
+    pipeline = redis_client.pipeline()
+
+    pipeline.hset(
+        key,
+        mapping={
+            "digest": get_digest(normalized_text),
+            "edited_at": time()
+        }
+    )
+    pipeline.expire(key, _MESSAGE_EXPIRE)
+
+    pipeline.execute(raise_on_error=True)
+
+
+def take_update_slot(
+    chat_id: int,
+    message_id: int,
+    normalized_text: str,
+    final=False,
+    trailing=False
+) -> Tuple[bool, Union[float, None]]:
+    """
+    Decides if message should be edited with new text.
+    If it should, then new text is remembered as sent.
+
+    :param normalized_text:
+    New text of message, see `normalize_text()`.
+    :param final:
+    It is final state of message.
+    :param trailing:
+    It is trailing edit of deferred text.
+
+    :returns:
+    `(edit, delay)`. `edit` is `True` if message should be
+    edited right now. `delay` is not `None` if edit was deferred,
+    then it should be tried again after `delay` seconds with
+    `trailing=True`.
+    """
+    if trailing:
+        kind = _TRAILING
+    elif final:
+        kind = _FINAL
+    else:
+        kind = _INTERMEDIATE
+
+    edit, delay = _get_take_script()(
+        keys=[_get_message_key(chat_id, message_id)],
+        args=[
+            get_digest(normalized_text),
+            time(),
+            current_app.config["RUNTIME_STATUS_UPDATE_INTERVAL"],
+            kind,
+            _MESSAGE_EXPIRE
+        ]
+    )
+
+    if (edit == 1):
+        return (True, None)
+
+    if (delay > 0):
+        return (False, delay / 1000)
+
+    return (False, None)
@@ -0,0 +1,104 @@
+"""
+Cache of Telegram files.
+
+Before uploading of attachment Telegram file should be requested
+(`getFile`) in order to get `file_path`. Same file is often sent
+again (forwarded to another chat, sent again after error, etc.),
+and `file_path` is valid for at least one hour, so, files are
+cached by `file_unique_id`.
+
+- `file_unique_id` is same for every chat, so, cached file
+can be reused by any handler. But `file_path` can be used
+only with token of bot that requested it, so, every bot
+has its own cache (key contains hash of bot token).
+- requires Redis to be enabled. If Redis is disabled,
+then nothing is cached.
+"""
+
+import json
+import hashlib
+from os import environ
+from typing import Union
+
+from flask import current_app
+
+from src.extensions import redis_client
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "telegram_file_cache"
+_FILE_KEY = "file"
+
+# Only these keys of Telegram file are cached
+_CACHED_KEYS = (
+    "file_unique_id",
+    "file_size",
+    "file_path"
+)
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_file_key(file_unique_id: str) -> str:
+    bot_token = environ["TELEGRAM_API_BOT_TOKEN"]
+    digest = hashlib.sha256(bot_token.encode()).hexdigest()
+
+    return _create_key(_NAMESPACE_KEY, digest, _FILE_KEY, file_unique_id)
+
+
+def telegram_file_cache_is_enabled() -> bool:
+    return (
+        (current_app.config["RUNTIME_TELEGRAM_FILE_CACHE_EXPIRE"] > 0) and
+        redis_client.is_enabled
+    )
+
+
+def get_file(file_unique_id: str) -> Union[dict, None]:
+    """
+    :returns:
+    Cached Telegram file with `file_unique_id`, `file_size`
+    (can be missing) and `file_path`. `None` if there is
+    no such file in cache.
+    """
+    if not telegram_file_cache_is_enabled():
+        return None
+
+    data = redis_client.get(
+        _get_file_key(file_unique_id)
+    )
+
+    if data is None:
+        return None
+
+    return json.loads(data)
+
+
+def set_file(file: dict) -> None:
+    """
+    Caches Telegram file.
+
+    :param file:
+    Telegram file from `getFile`.
+    See https://core.telegram.org/bots/api/#file
+    File without `file_path` will be not cached.
+    """
+    if (
+        not telegram_file_cache_is_enabled() or
+        not file.get("file_path")
+    ):
+        return
+
+    data = {
+        key: file[key]
+        for key in _CACHED_KEYS
+        if key in file
+    }
+
+    redis_client.set(
+        _get_file_key(file["file_unique_id"]),
+        json.dumps(data),
+        ex=current_app.config["RUNTIME_TELEGRAM_FILE_CACHE_EXPIRE"]
+    )
@@ -0,0 +1,133 @@
+"""
+Index of recent uploads of every user.
+
+Users often send same file again (same photo, same document,
+same URL). Every upload is remembered (source of upload -> uploaded
+element), so, if source is sent again, then already uploaded element
+can be shown to user instead of full uploading cycle.
+
+- source of upload is `file_unique_id` of Telegram file or URL.
+- index stores only path, size and md5 of uploaded element. Element
+can be changed or removed on Yandex.Disk at any time, so, caller
+should check that element still exists before using it.
+- requires Redis to be enabled. If Redis is disabled,
+then nothing is remembered.
+"""
+
+import json
+import hashlib
+from typing import Union
+
+from flask import current_app
+
+from src.extensions import redis_client
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "upload_index"
+_USER_KEY = "user"
+_SOURCE_KEY = "source"
+
+# Only these keys of element info are stored
+_STORED_KEYS = (
+    "path",
+    "size",
+    "md5"
+)
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_source_key(user_id: int, source: str) -> str:
+    # URL can be very long
+    digest = hashlib.sha256(source.encode()).hexdigest()
+
+    return _create_key(
+        _NAMESPACE_KEY,
+        _USER_KEY,
+        user_id,
+        _SOURCE_KEY,
+        digest
+    )
+
+
+def upload_index_is_enabled() -> bool:
+    return (
+        (current_app.config["RUNTIME_UPLOAD_INDEX_EXPIRE"] > 0) and
+        redis_client.is_enabled
+    )
+
+
+def get_upload(
+    user_id: int,
+    source: str
+) -> Union[dict, None]:
+    """
+    :param user_id:
+    Telegram ID of user.
+    :param source:
+    Source of upload.
+
+    :returns:
+    `path`, `size` (can be missing) and `md5` (can be missing)
+    of element that was uploaded from this source recently.
+    `None` if there is no such element.
+    """
+    if not upload_index_is_enabled():
+        return None
+
+    data = redis_client.get(
+        _get_source_key(user_id, source)
+    )
+
+    if data is None:
+        return None
+
+    return json.loads(data)
+
+
+def add_upload(
+    user_id: int,
+    source: str,
+    info: dict
+) -> None:
+    """
+    Remembers uploaded element.
+
+    :param user_id:
+    Telegram ID of user.
+    :param source:
+    Source of upload.
+    :param info:
+    Information about uploaded element from Yandex.Disk.
+    Element without `path` will be not remembered.
+    """
+    if (
+        not upload_index_is_enabled() or
+        not info.get("path")
+    ):
+        return
+
+    data = {
+        key: info[key]
+        for key in _STORED_KEYS
+        if key in info
+    }
+
+    redis_client.set(
+        _get_source_key(user_id, source),
+        json.dumps(data),
+        ex=current_app.config["RUNTIME_UPLOAD_INDEX_EXPIRE"]
+    )
+
+
+def remove_upload(user_id: int, source: str) -> None:
+    if not upload_index_is_enabled():
+        return
+
+    redis_client.delete(
+        _get_source_key(user_id, source)
+    )
@@ -1,11 +1,20 @@
-from time import sleep
-from typing import Generator, Deque
+from time import time, sleep
+from typing import Generator, Deque, Tuple, Union
 from collections import deque
 
 from flask import current_app
 
 from src.http import yandex
 from src.i18n import gettext
+from .operation_schedule import (
+    generate_check_delays,
+    record_throughput
+)
+from .known_folders import (
+    is_known_folder,
+    remember_folders,
+    forget_folders
+)
 
 
 # region Exceptions
@@ -231,6 +240,15 @@ def is_error_yandex_response(data: dict) -> bool:
     return ("error" in data)
 
 
+def is_path_not_found_yandex_response(data: dict) -> bool:
+    """
+    :returns:
+    Yandex response contains error which indicates
+    that some folder of requested path doesn't exists.
+    """
+    return (data.get("error") == "DiskPathDoesntExistsError")
+
+
 def yandex_operation_is_success(data: dict) -> bool:
     """
     :returns:
@@ -317,6 +335,9 @@ def create_folder(
     already exists, for example) from all folder names
     except last one.
 
+    - created folders will be remembered as known folders,
+    see `known_folders.py`.
+
     :returns:
     Last (for last folder name) HTTP Status code.
 
@@ -325,7 +346,7 @@ def create_folder(
     `YandexAPICreateFolderError`.
     """
     path = YandexDiskPath(folder_name)
-    resources = path.generate_absolute_path(True)
+    resources = list(path.generate_absolute_path(True))
     last_status_code = 201  # namespace always created
     allowed_errors = [409]
 
@@ -354,13 +375,48 @@ def create_folder(
         ):
             continue
 
+        # something is wrong with user folders,
+        # so, known folders can be wrong too
+        forget_folders(user_access_token)
+
         raise YandexAPICreateFolderError(
             create_yandex_error_text(response)
         )
 
+    remember_folders(user_access_token, resources)
+
     return last_status_code
 
 
+def ensure_folder_exists(
+    user_access_token: str,
+    folder_name: str
+) -> None:
+    """
+    Creates folder using Yandex API if it is not
+    known that folder already exists.
+
+    - use it when you don't need result of creation.
+
+    :raises:
+    `YandexAPIRequestError`,
+    `YandexAPICreateFolderError`.
+    """
+    path = YandexDiskPath(folder_name)
+
+    if is_known_folder(user_access_token, path.create_absolute_path()):
+        current_app.logger.debug(
+            f"{path} is known folder"
+        )
+
+        return
+
+    create_folder(
+        user_access_token=user_access_token,
+        folder_name=folder_name
+    )
+
+
 def publish_item(
     user_access_token: str,
     absolute_item_path: str
@@ -431,11 +487,141 @@ def unpublish_item(
         )
 
 
-def upload_file_with_url(
+def start_upload_file_with_url(
     user_access_token: str,
     folder_path: str,
     file_name: str,
     download_url: str
+) -> dict:
+    """
+    Starts uploading of a file to Yandex.Disk using file download url.
+
+    - before uploading creates a folder. Folder will not be created
+    if it is known that folder exists. If optimistic uploading is
+    enabled (`YANDEX_DISK_API_OPTIMISTIC_UPLOAD`), then folder will
+    be created only when uploading fails because of missing folder.
+    - it doesn't wait for uploading, use returned link
+    to check operation status.
+
+    :returns:
+    Yandex link to operation status. Pass it
+    to `check_operation_status()`.
+
+    :raises:
+    `YandexAPIRequestError`,
+    `YandexAPICreateFolderError`,
+    `YandexAPIUploadFileError`.
+    """
+    optimistic_upload = current_app.config[
+        "YANDEX_DISK_API_OPTIMISTIC_UPLOAD"
+    ]
+
+    if not optimistic_upload:
+        ensure_folder_exists(
+            user_access_token=user_access_token,
+            folder_name=folder_path
+        )
+
+    path = YandexDiskPath(folder_path, file_name)
+    absolute_path = path.create_absolute_path()
+
+    current_app.logger.debug(
+        f"Download URL: {download_url}"
+    )
+    current_app.logger.debug(
+        f"Final path: {absolute_path}"
+    )
+
+    def upload():
+        try:
+            response = yandex.upload_file_with_url(
+                user_access_token,
+                url=download_url,
+                path=absolute_path
+            )
+        except Exception as error:
+            raise YandexAPIRequestError(error)
+
+        return response["content"]
+
+    operation_status_link = upload()
+
+    # folder doesn't exists, although it was expected
+    # (optimistic uploading or outdated known folders)
+    if is_path_not_found_yandex_response(operation_status_link):
+        current_app.logger.debug(
+            f"{folder_path} doesn't exists, it will be created"
+        )
+
+        forget_folders(user_access_token)
+        create_folder(
+            user_access_token=user_access_token,
+            folder_name=folder_path
+        )
+
+        operation_status_link = upload()
+
+    is_error = is_error_yandex_response(operation_status_link)
+
+    if is_error:
+        raise YandexAPIUploadFileError(
+            create_yandex_error_text(operation_status_link)
+        )
+
+    return operation_status_link
+
+
+def check_operation_status(
+    user_access_token: str,
+    operation_status_link: dict
+) -> dict:
+    """
+    Checks status of Yandex.Disk operation once.
+
+    :param operation_status_link:
+    Result of `start_upload_file_with_url()`.
+
+    :returns:
+    `dict` with `success`, `failed`, `completed`, `status`.
+    See `upload_file_with_url()` documentation.
+
+    :raises:
+    `YandexAPIRequestError`,
+    `YandexAPIUploadFileError`.
+    """
+    try:
+        response = yandex.make_link_request(
+            data=operation_status_link,
+            user_token=user_access_token
+        )
+    except Exception as error:
+        raise YandexAPIRequestError(error)
+
+    operation_status = response["content"]
+
+    if is_error_yandex_response(operation_status):
+        raise YandexAPIUploadFileError(
+            create_yandex_error_text(operation_status)
+        )
+
+    is_success = yandex_operation_is_success(operation_status)
+    is_failed = yandex_operation_is_failed(operation_status)
+
+    return {
+        "success": is_success,
+        "failed": is_failed,
+        "completed": (is_success or is_failed),
+        "status": get_yandex_operation_text(operation_status)
+    }
+
+
+def upload_file_with_url(
+    user_access_token: str,
+    folder_path: str,
+    file_name: str,
+    download_url: str,
+    file_size: Union[int, None] = None,
+    time_budget: Union[float, None] = None
 ) -> Generator[dict, None, None]:
     """
     Uploads a file to Yandex.Disk using file download url.
@@ -444,6 +630,15 @@ def upload_file_with_url(
     - after uploading will monitor operation status according
     to app configuration. Because it is synchronous, it may
     take significant time to end this function!
+    - checks of operation status are scheduled according to
+    `file_size` and recent throughput of Yandex.Disk,
+    see `operation_schedule.py`.
+
+    :param file_size:
+    Size of file in bytes. `None` if size is unknown.
+    :param time_budget:
+    How long (in seconds) status of operation can be checked.
+    `None` to derive it from timeout of current job.
 
     :yields:
     `dict` with `success`, `failed`, `completed`, `status`.
@@ -464,94 +659,38 @@ def upload_file_with_url(
     `YandexAPIUploadFileError`,
     `YandexAPIExceededNumberOfStatusChecksError`
     """
-    create_folder(
+    operation_status_link = start_upload_file_with_url(
         user_access_token=user_access_token,
-        folder_name=folder_path
+        folder_path=folder_path,
+        file_name=file_name,
+        download_url=download_url
     )
+    started_at = time()
+    pending_seconds = None
 
-    path = YandexDiskPath(folder_path, file_name)
-    absolute_path = path.create_absolute_path()
-    response = None
+    for delay in generate_check_delays(file_size, time_budget):
+        sleep(delay)
 
-    current_app.logger.debug(
-        f"Download URL: {download_url}"
-    )
-    current_app.logger.debug(
-        f"Final path: {absolute_path}"
-    )
-
-    try:
-        response = yandex.upload_file_with_url(
+        status = check_operation_status(
             user_access_token,
-            url=download_url,
-            path=absolute_path
-        )
-    except Exception as error:
-        raise YandexAPIRequestError(error)
-
-    operation_status_link = response["content"]
-    is_error = is_error_yandex_response(operation_status_link)
-
-    if is_error:
-        raise YandexAPIUploadFileError(
-            create_yandex_error_text(operation_status_link)
+            operation_status_link
         )
 
-    operation_status = None
-    is_error = False
-    is_success = False
-    is_failed = False
-    is_completed = False
-    attempt = 0
-    max_attempts = current_app.config[
-        "YANDEX_DISK_API_CHECK_OPERATION_STATUS_MAX_ATTEMPTS"
-    ]
-    interval = current_app.config[
-        "YANDEX_DISK_API_CHECK_OPERATION_STATUS_INTERVAL"
-    ]
-    too_many_attempts = (attempt >= max_attempts)
-
-    while not (
-        is_error or
-        is_completed or
-        too_many_attempts
-    ):
-        sleep(interval)
-
-        try:
-            response = yandex.make_link_request(
-                data=operation_status_link,
-                user_token=user_access_token
+        if status["success"]:
+            record_throughput(
+                file_size,
+                pending_seconds,
+                time() - started_at
             )
-        except Exception as error:
-            raise YandexAPIRequestError(error)
+        elif not status["completed"]:
+            pending_seconds = time() - started_at
 
-        operation_status = response["content"]
-        is_error = is_error_yandex_response(operation_status)
-        is_success = yandex_operation_is_success(operation_status)
-        is_failed = yandex_operation_is_failed(operation_status)
-        is_completed = (is_success or is_failed)
-        operation_status_text = get_yandex_operation_text(operation_status)
-        attempt += 1
-        too_many_attempts = (attempt >= max_attempts)
-
-        if not is_error:
-            yield {
-                "success": is_success,
-                "failed": is_failed,
-                "completed": (is_success or is_failed),
-                "status": operation_status_text
-            }
+        yield status
 
-    if is_error:
-        raise YandexAPIUploadFileError(
-            create_yandex_error_text(operation_status)
-        )
-    elif (
-        too_many_attempts and
-        not is_completed
-    ):
-        raise YandexAPIExceededNumberOfStatusChecksError()
+        if status["completed"]:
+            return
+
+    raise YandexAPIExceededNumberOfStatusChecksError()
 
 
 def get_disk_info(user_access_token: str) -> dict:
@@ -590,7 +729,8 @@ def get_element_info(
     preview_crop=False,
     embedded_elements_limit=0,
     embedded_elements_offset=0,
-    embedded_elements_sort="name"
+    embedded_elements_sort="name",
+    fields=None
 ) -> dict:
     """
     - https://yandex.ru/dev/disk/api/reference/meta.html
@@ -623,6 +763,10 @@ def get_element_info(
     Possible values: `name`, `path`, `created`,
     `modified`, `size`. Append `-` for reverse
     order (example: `-name`).
+    :param fields:
+    Comma-separated list of keys that should be included
+    in normal info (for example, `public_key,public_url`).
+    `None` for all keys.
 
     :returns:
     Information about object.
@@ -646,7 +790,8 @@ def get_element_info(
             preview_size=preview_size,
             limit=embedded_elements_limit,
             offset=embedded_elements_offset,
-            sort=embedded_elements_sort
+            sort=embedded_elements_sort,
+            fields=fields
         )
     except Exception as error:
         raise YandexAPIRequestError(error)
@@ -694,4 +839,52 @@ def get_element_info(
     return response
 
 
+def publish_item_and_get_element_info(
+    user_access_token: str,
+    absolute_item_path: str,
+    **kwargs
+) -> Tuple[
+    Union[dict, None],
+    Union[Exception, None],
+    Union[Exception, None]
+]:
+    """
+    Publishes an item and gets information about it.
+
+    - information is requested only after publishing is ended,
+    because it should contain public fields. These requests
+    are not independent, so, they are not performed concurrently.
+    - information is requested even if publishing fails.
+
+    :param **kwargs:
+    Arguments for `get_element_info()`.
+
+    :returns:
+    `(information, publish error, information error)`.
+    Information is `None` if it can't be received.
+    Errors are `None` if there were no errors.
+    See `publish_item()` and `get_element_info()`
+    documentation for possible errors.
+    """
+    info = None
+    publish_error = None
+    info_error = None
+
+    try:
+        publish_item(user_access_token, absolute_item_path)
+    except Exception as error:
+        publish_error = error
+
+    try:
+        info = get_element_info(
+            user_access_token,
+            absolute_item_path,
+            **kwargs
+        )
+    except Exception as error:
+        info_error = error
+
+    return (info, publish_error, info_error)
+
+
 # endregion
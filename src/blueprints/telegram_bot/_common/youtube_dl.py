@@ -1,4 +1,37 @@
-import youtube_dl
+"""
+Extraction of direct URL with `youtube_dl`.
+
+Extraction makes requests to site of resource (it can be slow)
+and parses its pages (it is CPU heavy), so, it is performed in
+separate processes instead of process that handles requests:
+- every server (or RQ) worker has its own pool of extractor
+processes, size of pool is `RUNTIME_YOUTUBE_DL_PROCESSES`.
+Pool belongs to process that created it, forked process
+creates its own pool.
+- extractor processes are started by fork server (which has
+`youtube_dl` imported already), because fork of process with
+threads or greenlets can deadlock on locks that were held at
+time of fork. Single-threaded process (for example, work-horse
+of forking RQ worker) forks extractor directly, it is faster.
+See `src/rq/README.md` for which workers reuse pool between jobs.
+- extraction of one URL is interrupted after timeout, process of
+that extraction is killed and will be replaced by new one.
+- if caller is interrupted (for example, by timeout of job),
+then extraction is cancelled same way.
+- `youtube_dl` takes a while to import and uses a lot of memory,
+so, it is imported only by fork server and extractor processes.
+"""
+
+import os
+import signal
+import socket
+import threading
+import multiprocessing
+from time import monotonic
+from collections import deque
+from typing import Union
+
+from flask import current_app
 
 
 # region Exceptions
@@ -19,6 +52,15 @@ class UnsupportedURLError(CustomYoutubeDLError):
     pass
 
 
+class ExtractionFailedError(CustomYoutubeDLError):
+    """
+    URL can be supported by `youtube_dl`, but extraction
+    failed (network error, rate limit, geo restriction,
+    broken extractor, etc.). It can be temporary.
+    """
+    pass
+
+
 class UnexpectedError(CustomYoutubeDLError):
     """
     Some unexpected error occured.
@@ -26,6 +68,13 @@ class UnexpectedError(CustomYoutubeDLError):
     pass
 
 
+class ExtractionTimeoutError(CustomYoutubeDLError):
+    """
+    Extraction was not completed before timeout.
+    """
+    pass
+
+
 # endregion
 
 
@@ -52,43 +101,31 @@ class Logger:
 # region youtube_dl
 
 
-def extract_info(url: str) -> dict:
+def _extract_info(url: str) -> dict:
     """
-    Extracts info from URL.
-    This info can be used to download this resource.
-
-    - see this for supported sites -
-    https://github.com/ytdl-org/youtube-dl/blob/master/docs/supportedsites.md
-
-    :param url:
-    URL to resource.
-    You can safely pass any URL
-    (YouTube video, direct URL to JPG, plain page, etc.)
-
-    :returns:
-    `direct_url` - can be used to download resource,
-    `filename` - recommended filename.
-    If provided URL not supported, then error will be
-    raised. So, if result is successfully returned,
-    then it is 100% valid result which can be used to
-    download resource.
+    See `extract_info()`.
 
-    :raises:
-    `UnsupportedURLError`,
-    `UnexpectedError`.
+    - it is blocking function, it is executed
+    in extractor process.
     """
+    import youtube_dl
+
+    ydl = _get_ydl()
     result = {
         "direct_url": None,
         "filename": None
     }
     info = None
 
-    # TODO: implement execution timeout,
-    # because long requests blocks server requests
     try:
         info = ydl.extract_info(url)
     except youtube_dl.DownloadError as error:
-        raise UnsupportedURLError(str(error))
+        reason = (error.exc_info or (None, None, None))[1]
+
+        if isinstance(reason, youtube_dl.utils.UnsupportedError):
+            raise UnsupportedURLError(str(error))
+
+        raise ExtractionFailedError(str(error))
     except Exception as error:
         raise UnexpectedError(str(error))
 
@@ -109,6 +146,303 @@ def extract_info(url: str) -> dict:
     return result
 
 
+def _get_ydl():
+    """
+    :returns:
+    `youtube_dl.YoutubeDL` of current process.
+    It is created on first call.
+    """
+    global _ydl
+
+    if _ydl is None:
+        import youtube_dl
+
+        _ydl = youtube_dl.YoutubeDL(options)
+
+    return _ydl
+
+
+def _run_extractor(connection) -> None:
+    """
+    Main function of extractor process.
+
+    Receives URL, sends back `(result, error)`. Process is
+    stopped when connection is closed by parent process.
+    """
+    # SIGINT is sent to whole group of processes (Ctrl+C),
+    # parent process will stop this process by itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+        try:
+            url = connection.recv()
+        except (EOFError, OSError):
+            return
+
+        result = None
+        error = None
+
+        try:
+            result = _extract_info(url)
+        except CustomYoutubeDLError as exception:
+            error = exception
+
+        try:
+            connection.send((result, error))
+        except (EOFError, OSError):
+            return
+
+
+def _gevent_is_patched() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+
+    return monkey.is_module_patched("threading")
+
+
+def _wait_for_result(connection, timeout: Union[float, None]) -> bool:
+    """
+    :returns:
+    Result can be received from `connection`.
+    `False` if timeout is expired.
+    """
+    if not _gevent_is_patched():
+        return connection.poll(timeout)
+
+    # `poll()` will block whole gevent hub
+    from gevent.socket import wait_read
+
+    try:
+        wait_read(connection.fileno(), timeout)
+    except socket.timeout:
+        return False
+
+    return True
+
+
+def _get_context():
+    """
+    :returns:
+    `multiprocessing` context to start extractor process.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    can_fork = (
+        ("fork" in methods) and
+        not _gevent_is_patched() and
+        (threading.active_count() == 1)
+    )
+
+    if can_fork:
+        return multiprocessing.get_context("fork")
+
+    if "forkserver" not in methods:
+        return multiprocessing.get_context("spawn")
+
+    # it has effect only before fork server is started
+    multiprocessing.set_forkserver_preload(["youtube_dl", __name__])
+
+    return multiprocessing.get_context("forkserver")
+
+
+class ExtractorProcess:
+    """
+    Process that extracts info from URL.
+    """
+    def __init__(self):
+        context = _get_context()
+        parent_connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_run_extractor,
+            args=(child_connection,),
+            daemon=True
+        )
+
+        self.process.start()
+        child_connection.close()
+
+        self.connection = parent_connection
+
+    def extract_info(self, url: str, timeout: Union[float, None]) -> dict:
+        """
+        :raises:
+        `UnsupportedURLError`,
+        `ExtractionFailedError`,
+        `UnexpectedError`,
+        `ExtractionTimeoutError`.
+        Process should be killed in case of
+        `UnexpectedError` or `ExtractionTimeoutError`.
+        """
+        try:
+            self.connection.send(url)
+
+            if not _wait_for_result(self.connection, timeout):
+                raise ExtractionTimeoutError(
+                    f"Extraction exceeded timeout ({timeout} seconds)"
+                )
+
+            result, error = self.connection.recv()
+        except (EOFError, OSError) as error:
+            raise UnexpectedError(
+                f"Extractor process is not available: {error}"
+            )
+
+        if error is not None:
+            raise error
+
+        return result
+
+    def kill(self) -> None:
+        self.connection.close()
+        self.process.kill()
+        self.process.join()
+
+
+class ExtractorPool:
+    """
+    Pool of extractor processes.
+
+    - processes are started on demand and reused.
+    - if all processes are busy, then caller waits
+    for free process (waiting is included in timeout).
+    """
+    def __init__(self, size: int):
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = deque()
+
+    def extract_info(
+        self,
+        url: str,
+        timeout: Union[float, None] = None
+    ) -> dict:
+        """
+        See `extract_info()`.
+        """
+        deadline = None
+
+        if timeout is not None:
+            deadline = monotonic() + timeout
+
+        if not self._slots.acquire(timeout=timeout):
+            raise ExtractionTimeoutError(
+                "All extractor processes are busy"
+            )
+
+        extractor = None
+
+        try:
+            extractor = (
+                self._idle.pop() if self._idle else
+                ExtractorProcess()
+            )
+            remaining = None
+
+            # waiting for free process and starting of
+            # new process are included in timeout
+            if deadline is not None:
+                remaining = max(deadline - monotonic(), 0)
+
+            result = extractor.extract_info(url, remaining)
+        except (UnsupportedURLError, ExtractionFailedError):
+            self._idle.append(extractor)
+
+            raise
+        except BaseException:
+            # state of process is unknown (timeout,
+            # cancellation of caller, etc.), so,
+            # it can't be reused
+            if extractor is not None:
+                extractor.kill()
+
+            raise
+        else:
+            self._idle.append(extractor)
+
+            return result
+        finally:
+            self._slots.release()
+
+
+_pool: Union[ExtractorPool, None] = None
+_pool_pid: Union[int, None] = None
+
+
+def _get_pool() -> ExtractorPool:
+    global _pool
+    global _pool_pid
+
+    # processes of inherited pool belong to parent process
+    if (
+        (_pool is None) or
+        (_pool_pid != os.getpid())
+    ):
+        _pool = ExtractorPool(
+            current_app.config["RUNTIME_YOUTUBE_DL_PROCESSES"]
+        )
+        _pool_pid = os.getpid()
+
+    return _pool
+
+
+def prepare_extractors() -> None:
+    """
+    Creates pool of current process and starts fork server,
+    so, first extraction will not wait for import of `youtube_dl`.
+
+    - call it at start of long-lived process that
+    will extract info (for example, concurrent RQ worker).
+    - should be called within app context.
+    """
+    _get_pool()
+
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return
+
+    from multiprocessing import forkserver
+
+    multiprocessing.set_forkserver_preload(["youtube_dl", __name__])
+    forkserver.ensure_running()
+
+
+def extract_info(
+    url: str,
+    timeout: Union[float, None] = None
+) -> dict:
+    """
+    Extracts info from URL.
+    This info can be used to download this resource.
+
+    - see this for supported sites -
+    https://github.com/ytdl-org/youtube-dl/blob/master/docs/supportedsites.md
+    - extraction is performed in extractor process,
+    current thread (or greenlet) only waits for result.
+
+    :param url:
+    URL to resource.
+    You can safely pass any URL
+    (YouTube video, direct URL to JPG, plain page, etc.)
+    :param timeout:
+    Maximum time of extraction in seconds.
+    `None` for no timeout.
+
+    :returns:
+    `direct_url` - can be used to download resource,
+    `filename` - recommended filename.
+    If provided URL not supported, then error will be
+    raised. So, if result is successfully returned,
+    then it is 100% valid result which can be used to
+    download resource.
+
+    :raises:
+    `UnsupportedURLError`,
+    `ExtractionFailedError`,
+    `UnexpectedError`,
+    `ExtractionTimeoutError`.
+    """
+    return _get_pool().extract_info(url, timeout)
+
+
 # endregion
 
 
@@ -146,4 +480,4 @@ options = {
     "extract_flat": "in_playlist",
     "noplaylist": True
 }
-ydl = youtube_dl.YoutubeDL(options)
+_ydl = None
@@ -0,0 +1,278 @@
+"""
+Cache of `youtube_dl` extraction results.
+
+Same URL is often sent by many users (popular video, for example),
+and extraction of it takes a while, so, results of extraction
+are cached by normalized URL (see `normalize_url()`).
+
+- direct URL is often signed and valid only for limited time.
+If expiry of direct URL can be found in direct URL, then result
+is cached only while direct URL is valid (minus reserve for
+uploading), but no longer than `RUNTIME_YOUTUBE_DL_CACHE_EXPIRE`.
+- URL's that are not supported by `youtube_dl` are cached too
+(plain pages, direct URL's to files, etc.), so, they will be not
+extracted again for `RUNTIME_YOUTUBE_DL_CACHE_UNSUPPORTED_EXPIRE`.
+- failed extractions of URL's that can be supported (network error,
+rate limit, etc.) can be temporary, so, they are cached only for
+`RUNTIME_YOUTUBE_DL_CACHE_FAILED_EXPIRE`.
+- requires Redis to be enabled. If Redis is disabled,
+then nothing is cached.
+"""
+
+import json
+import hashlib
+from time import time
+from datetime import datetime, timezone
+from typing import Union
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from flask import current_app
+
+from src.extensions import redis_client
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "youtube_dl_cache"
+_URL_KEY = "url"
+
+# Direct URL should be valid for at least this time
+# after it was taken from cache, because Yandex.Disk
+# will download it later. In seconds
+_EXPIRE_RESERVE = 60 * 10
+
+# Query parameters that don't change resource
+_IGNORED_QUERY_KEYS = (
+    "fbclid",
+    "gclid",
+    "yclid",
+    "feature",
+    "si"
+)
+_IGNORED_QUERY_PREFIXES = (
+    "utm_",
+)
+
+_YOUTUBE_HOSTS = (
+    "youtube.com",
+    "m.youtube.com",
+    "music.youtube.com"
+)
+
+# Query parameters of signed URL with
+# expiry as UNIX timestamp
+_EXPIRES_QUERY_KEYS = (
+    "expire",
+    "expires",
+    "exp"
+)
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_url_key(url: str) -> str:
+    # URL can be very long
+    digest = hashlib.sha256(
+        normalize_url(url).encode()
+    ).hexdigest()
+
+    return _create_key(_NAMESPACE_KEY, _URL_KEY, digest)
+
+
+def youtube_dl_cache_is_enabled() -> bool:
+    return (
+        (current_app.config["RUNTIME_YOUTUBE_DL_CACHE_EXPIRE"] > 0) and
+        redis_client.is_enabled
+    )
+
+
+def normalize_url(url: str) -> str:
+    """
+    :returns:
+    URL in canonical form. URL's that lead to same
+    resource will most likely have same canonical form.
+
+    - scheme and host are lowercased, default port,
+    fragment and tracking query parameters are removed,
+    rest of query parameters are sorted.
+    - short, mobile and music YouTube URL's
+    are converted to `www.youtube.com`.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "")
+    path = parts.path
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if (
+            key.lower() not in _IGNORED_QUERY_KEYS and
+            not key.lower().startswith(_IGNORED_QUERY_PREFIXES)
+        )
+    ]
+
+    if host.startswith("www."):
+        host = host[len("www."):]
+
+    if host == "youtu.be":
+        host = "youtube.com"
+        query.append(("v", path.strip("/")))
+        path = "/watch"
+
+    if host in _YOUTUBE_HOSTS:
+        host = "www.youtube.com"
+
+    if (
+        (parts.port is not None) and
+        ((scheme, parts.port) not in (("http", 80), ("https", 443)))
+    ):
+        host = f"{host}:{parts.port}"
+
+    return urlunsplit((
+        scheme,
+        host,
+        path or "/",
+        urlencode(sorted(query)),
+        ""
+    ))
+
+
+def parse_expires_at(direct_url: str) -> Union[int, None]:
+    """
+    :returns:
+    UNIX timestamp when signed URL expires.
+    `None` if URL is not signed or expiry is unknown.
+    """
+    query = {
+        key.lower(): value
+        for key, value in parse_qsl(urlsplit(direct_url).query)
+    }
+
+    try:
+        for key in _EXPIRES_QUERY_KEYS:
+            if key in query:
+                return int(query[key])
+
+        # AWS signature version 4
+        if (
+            "x-amz-date" in query and
+            "x-amz-expires" in query
+        ):
+            signed_at = datetime.strptime(
+                query["x-amz-date"],
+                "%Y%m%dT%H%M%SZ"
+            ).replace(tzinfo=timezone.utc)
+
+            return (
+                int(signed_at.timestamp()) +
+                int(query["x-amz-expires"])
+            )
+    except ValueError:
+        pass
+
+    return None
+
+
+def get_info(url: str) -> Union[dict, None]:
+    """
+    :param url:
+    Input URL that was passed to `youtube_dl`.
+
+    :returns:
+    Cached result of extraction with `direct_url`, `filename`
+    and `expires_at` (can be `None`). If URL is not supported
+    by `youtube_dl`, then `{"unsupported": True}`. If extraction
+    failed recently, then `{"failed": True}`.
+    `None` if there is no such URL in cache.
+    """
+    if not youtube_dl_cache_is_enabled():
+        return None
+
+    data = redis_client.get(
+        _get_url_key(url)
+    )
+
+    if data is None:
+        return None
+
+    return json.loads(data)
+
+
+def set_info(url: str, info: dict) -> None:
+    """
+    Caches result of extraction.
+
+    :param url:
+    Input URL that was passed to `youtube_dl`.
+    :param info:
+    Result of `youtube_dl.extract_info()`. If direct URL
+    expires too soon, then it will be not cached.
+    """
+    if not youtube_dl_cache_is_enabled():
+        return
+
+    expire = current_app.config["RUNTIME_YOUTUBE_DL_CACHE_EXPIRE"]
+    expires_at = parse_expires_at(info["direct_url"])
+
+    if expires_at is not None:
+        expire = min(
+            expire,
+            int(expires_at - time() - _EXPIRE_RESERVE)
+        )
+
+    if expire <= 0:
+        return
+
+    data = {
+        "direct_url": info["direct_url"],
+        "filename": info.get("filename"),
+        "expires_at": expires_at
+    }
+
+    redis_client.set(
+        _get_url_key(url),
+        json.dumps(data),
+        ex=expire
+    )
+
+
+def set_unsupported(url: str) -> None:
+    """
+    Caches that URL is not supported by `youtube_dl`.
+    """
+    expire = current_app.config[
+        "RUNTIME_YOUTUBE_DL_CACHE_UNSUPPORTED_EXPIRE"
+    ]
+
+    if (
+        not youtube_dl_cache_is_enabled() or
+        (expire <= 0)
+    ):
+        return
+
+    redis_client.set(
+        _get_url_key(url),
+        json.dumps({"unsupported": True}),
+        ex=expire
+    )
+
+
+def set_failed(url: str) -> None:
+    """
+    Caches that extraction of URL failed recently.
+    """
+    expire = current_app.config["RUNTIME_YOUTUBE_DL_CACHE_FAILED_EXPIRE"]
+
+    if (
+        not youtube_dl_cache_is_enabled() or
+        (expire <= 0)
+    ):
+        return
+
+    redis_client.set(
+        _get_url_key(url),
+        json.dumps({"failed": True}),
+        ex=expire
+    )
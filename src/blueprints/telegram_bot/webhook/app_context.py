@@ -4,6 +4,7 @@ from src.database import (
     UserQuery,
     ChatQuery
 )
+from src.database.models import ChatType
 from src.blueprints.telegram_bot._common import telegram_interface
 from . import dispatcher
 
@@ -66,21 +67,34 @@ def init_app_context(
             # actual result than `update.callback_query.message.from`.
             g.telegram_user = callback_query.get_user()
 
+    # user, settings, token and chats are loaded by one query.
+    # Handlers should use these values instead of making
+    # new queries for same data
     if g.telegram_user:
-        g.db_user = UserQuery.get_user_by_telegram_id(
+        g.db_user = UserQuery.get_user_with_relationships(
             g.telegram_user.id
         )
 
-    if g.telegram_chat:
-        g.db_chat = ChatQuery.get_chat_by_telegram_id(
-            g.telegram_chat.id
-        )
-
     # if it is new user (not yet registered in DB), then
     # DB data will be `None` for that user
     if g.db_user:
-        g.db_private_chat = ChatQuery.get_private_chat(
-            g.db_user.id
+        for chat in g.db_user.chats:
+            if (
+                g.telegram_chat and
+                (chat.telegram_id == g.telegram_chat.id)
+            ):
+                g.db_chat = chat
+
+            if (chat.type == ChatType.PRIVATE):
+                g.db_private_chat = chat
+
+    # chat can belong to another user
+    if (
+        g.telegram_chat and
+        (g.db_chat is None)
+    ):
+        g.db_chat = ChatQuery.get_chat_by_telegram_id(
+            g.telegram_chat.id
         )
 
     current_app.logger.debug(
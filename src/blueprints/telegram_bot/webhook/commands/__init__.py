@@ -22,6 +22,9 @@ not object directly
 """
 
 
+from importlib import import_module
+from typing import Callable
+
 from .upload import (
     handle_photo as upload_photo_handler,
     handle_file as upload_file_handler,
@@ -37,15 +40,38 @@ from .upload import (
     handle_public_url as public_upload_url_handler,
 )
 from .unknown import handle as unknown_handler
-from .help import handle as help_handler
-from .about import handle as about_handler
-from .settings import handle as settings_handler
-from .yd_auth import handle as yd_auth_handler
-from .yd_revoke import handle as yd_revoke_handler
-from .create_folder import handle as create_folder_handler
-from .publish import handle as publish_handler
-from .unpublish import handle as unpublish_handler
 from .space_info import handle as space_info_handler
 from .element_info import handle as element_info_handler
-from .disk_info import handle as disk_info_handler
-from .commands_list import handle as commands_list_handler
+
+
+def _lazy_handler(module_name: str) -> Callable:
+    """
+    :returns:
+    Handler that imports module of command only when
+    it is called first time, so, rarely used commands
+    don't slow down start of every worker.
+
+    - modules that register background tasks (see
+    `register_task()`) should be imported as usual,
+    otherwise RQ worker will not know about these tasks.
+    """
+    def handler(*args, **kwargs):
+        module = import_module(f".{module_name}", __name__)
+
+        return module.handle(*args, **kwargs)
+
+    handler.__name__ = f"{module_name}_handler"
+
+    return handler
+
+
+help_handler = _lazy_handler("help")
+about_handler = _lazy_handler("about")
+settings_handler = _lazy_handler("settings")
+yd_auth_handler = _lazy_handler("yd_auth")
+yd_revoke_handler = _lazy_handler("yd_revoke")
+create_folder_handler = _lazy_handler("create_folder")
+publish_handler = _lazy_handler("publish")
+unpublish_handler = _lazy_handler("unpublish")
+disk_info_handler = _lazy_handler("disk_info")
+commands_list_handler = _lazy_handler("commands_list")
@@ -7,7 +7,6 @@ from src.i18n import gettext
 from src.extensions import db
 from src.database import (
     User,
-    UserQuery,
     Chat,
     ChatQuery,
     UserSettings
@@ -33,7 +32,8 @@ def register_guest(func):
 
         # TODO: check if user came from different chat,
         # then also register that chat in db.
-        if (UserQuery.exists(tg_user.id)):
+        # `g.db_user` already loaded by app context
+        if (g.db_user is not None):
             return func(*args, **kwargs)
 
         new_user = User(
@@ -77,9 +77,8 @@ def yd_access_token_required(func):
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
-        user = UserQuery.get_user_by_telegram_id(
-            g.telegram_user.id
-        )
+        # token already loaded together with user by app context
+        user = g.db_user
 
         # TODO: check if token is expired
         if (
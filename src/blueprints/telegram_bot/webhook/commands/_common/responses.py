@@ -4,6 +4,7 @@ from flask import current_app
 
 from src.http import telegram
 from src.i18n import gettext
+from src.blueprints.telegram_bot.webhook import webhook_response
 
 
 @unique
@@ -58,13 +59,13 @@ def abort_command(
             text=text
         )
     elif (reply_to_message is not None):
-        telegram.send_message(
+        webhook_response.send_message(
             chat_id=chat_telegram_id,
             reply_to_message_id=reply_to_message,
             text=text
         )
     else:
-        telegram.send_message(
+        webhook_response.send_message(
             chat_id=chat_telegram_id,
             text=text
         )
@@ -112,14 +113,14 @@ def cancel_command(
             reply_markup=reply_markup
         )
     elif (reply_to_message is not None):
-        telegram.send_message(
+        webhook_response.send_message(
             chat_id=chat_telegram_id,
             reply_to_message_id=reply_to_message,
             text=text,
             reply_markup=reply_markup
         )
     else:
-        telegram.send_message(
+        webhook_response.send_message(
             chat_id=chat_telegram_id,
             text=text,
             reply_markup=reply_markup
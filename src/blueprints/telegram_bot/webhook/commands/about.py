@@ -1,7 +1,7 @@
 from flask import g, current_app
 
-from src.http import telegram
 from src.i18n import gettext
+from src.blueprints.telegram_bot.webhook import webhook_response
 from src.blueprints._common.utils import absolute_url_for
 
 
@@ -9,7 +9,7 @@ def handle(*args, **kwargs):
     """
     Handles `/about` command.
     """
-    telegram.send_message(
+    webhook_response.send_message(
         chat_id=kwargs.get(
             "chat_id",
             g.telegram_chat.id
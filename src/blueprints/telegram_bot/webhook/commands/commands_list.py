@@ -2,7 +2,7 @@ from collections import deque
 
 from flask import g
 
-from src.http import telegram
+from src.blueprints.telegram_bot.webhook import webhook_response
 from ._common.commands_content import commands_html_content
 
 
@@ -16,7 +16,7 @@ def handle(*args, **kwargs):
     )
     text = create_commands_list_html_text()
 
-    telegram.send_message(
+    webhook_response.send_message(
         chat_id=chat_id,
         text=text,
         parse_mode="HTML"
@@ -1,6 +1,13 @@
+from typing import Union
+
 from flask import g, current_app
 
-from src.rq import task_queue, prepare_task, run_task
+from src.rq import (
+    background_tasks_is_enabled,
+    register_task,
+    enqueue_task,
+    TaskQueueName
+)
 from src.i18n import gettext
 from src.http import telegram
 from src.http.yandex import make_photo_preview_request
@@ -9,6 +16,9 @@ from src.blueprints.telegram_bot._common.yandex_disk import (
     YandexAPIGetElementInfoError,
     YandexAPIRequestError
 )
+from src.blueprints.telegram_bot._common.concurrency import (
+    run_concurrently
+)
 from src.blueprints.telegram_bot._common.stateful_chat import (
     stateful_chat_is_enabled,
     set_disposable_handler
@@ -113,51 +123,113 @@ def handle(*args, **kwargs):
             ]]
         }
 
-    # We will send message without preview,
-    # because it can take a while to download
-    # preview file and send it. We will
-    # send it later if it is available.
-    telegram.send_message(**params)
-
     preview_url = info.get("preview")
 
-    if preview_url:
-        filename = info.get("name", "preview.jpg")
-        arguments = (
-            preview_url,
-            filename,
-            access_token,
-            chat_id
+    if not preview_url:
+        telegram.send_message(**params)
+
+        return
+
+    filename = info.get("name", "preview.jpg")
+
+    if background_tasks_is_enabled():
+        # We will send message without preview,
+        # because it can take a while to download
+        # preview file and send it. We will
+        # send it later in background task.
+        telegram.send_message(**params)
+
+        job_timeout = current_app.config[
+            "RUNTIME_ELEMENT_INFO_WORKER_JOB_TIMEOUT"
+        ]
+        ttl = current_app.config[
+            "RUNTIME_ELEMENT_INFO_WORKER_TTL"
+        ]
+
+        enqueue_task(
+            TaskQueueName.PREVIEWS.value,
+            "element_info.send_preview",
+            {
+                "preview_url": preview_url,
+                "filename": filename,
+                "user_access_token": access_token,
+                "chat_id": chat_id
+            },
+            description=CommandName.ELEMENT_INFO.value,
+            job_timeout=job_timeout,
+            ttl=ttl,
+            result_ttl=0,
+            failure_ttl=0
         )
 
-        if task_queue.is_enabled:
-            job_timeout = current_app.config[
-                "RUNTIME_ELEMENT_INFO_WORKER_JOB_TIMEOUT"
-            ]
-            ttl = current_app.config[
-                "RUNTIME_ELEMENT_INFO_WORKER_TTL"
-            ]
-            prepare_data = prepare_task()
-
-            task_queue.enqueue(
-                run_task,
-                kwargs={
-                    "f": send_preview,
-                    "args": arguments,
-                    "prepare_data": prepare_data
-                },
-                description=CommandName.ELEMENT_INFO.value,
-                job_timeout=job_timeout,
-                ttl=ttl,
-                result_ttl=0,
-                failure_ttl=0
-            )
-        else:
-            # NOTE: current thread will
-            # be blocked for a while
-            send_preview(*arguments)
+        return
 
+    # Preview will be downloaded while message is sending.
+    # NOTE: current thread will be blocked for a while
+    (
+        (_, message_error),
+        (preview, preview_error)
+    ) = run_concurrently(
+        [
+            lambda: telegram.send_message(**params),
+            lambda: download_preview(preview_url, access_token)
+        ],
+        current_app.config["YANDEX_DISK_API_CONCURRENT_TIMEOUT"]
+    )
+
+    if message_error:
+        raise message_error
+
+    if preview_error:
+        current_app.logger.error(preview_error)
+    elif preview:
+        send_photo(preview, filename, chat_id)
 
+
+def download_preview(
+    preview_url: str,
+    user_access_token: str
+) -> Union[bytes, None]:
+    """
+    Downloads preview from Yandex.Disk.
+
+    - requires user Yandex.Disk access token to
+    download preview file.
+
+    :returns:
+    Content of preview, `None` if it can't be downloaded.
+    """
+    result = make_photo_preview_request(
+        preview_url,
+        user_access_token
+    )
+
+    if not result["ok"]:
+        return None
+
+    return result["content"]
+
+
+def send_photo(
+    data: bytes,
+    filename: str,
+    chat_id: int
+) -> None:
+    """
+    Sends downloaded preview to user.
+    """
+    telegram.send_photo(
+        chat_id=chat_id,
+        photo=(
+            filename,
+            data,
+            "image/jpeg"
+        ),
+        disable_notification=True
+    )
+
+
+@register_task("element_info.send_preview")
 def send_preview(
     preview_url: str,
     filename: str,
@@ -170,20 +242,7 @@ def send_preview(
     - requires user Yandex.Disk access token to
     download preview file.
     """
-    result = make_photo_preview_request(
-        preview_url,
-        user_access_token
-    )
+    data = download_preview(preview_url, user_access_token)
 
-    if result["ok"]:
-        data = result["content"]
-
-        telegram.send_photo(
-            chat_id=chat_id,
-            photo=(
-                filename,
-                data,
-                "image/jpeg"
-            ),
-            disable_notification=True
-        )
+    if data is not None:
+        send_photo(data, filename, chat_id)
@@ -2,8 +2,8 @@ from collections import deque
 
 from flask import g, current_app
 
-from src.http import telegram
 from src.i18n import gettext
+from src.blueprints.telegram_bot.webhook import webhook_response
 from src.blueprints.telegram_bot._common.command_names import (
     CommandName
 )
@@ -22,7 +22,7 @@ def handle(*args, **kwargs):
         g.telegram_chat.id
     )
     text = create_help_html_text()
-    telegram.send_message(
+    webhook_response.send_message(
         chat_id=chat_id,
         parse_mode="HTML",
         text=text,
@@ -2,11 +2,9 @@ from flask import g, current_app
 
 from src.http import telegram
 from src.blueprints.telegram_bot._common.yandex_disk import (
-    publish_item,
-    get_element_info,
+    publish_item_and_get_element_info,
     YandexAPIGetElementInfoError,
-    YandexAPIPublishItemError,
-    YandexAPIRequestError
+    YandexAPIPublishItemError
 )
 from src.blueprints.telegram_bot._common.stateful_chat import (
     stateful_chat_is_enabled,
@@ -76,31 +74,27 @@ def handle(*args, **kwargs):
     user = g.db_user
     access_token = user.yandex_disk_token.get_access_token()
 
-    try:
-        publish_item(access_token, path)
-    except YandexAPIRequestError as error:
-        cancel_command(chat_id)
-        raise error
-    except YandexAPIPublishItemError as error:
-        send_yandex_disk_error(chat_id, str(error))
+    info, publish_error, info_error = publish_item_and_get_element_info(
+        access_token,
+        path
+    )
 
-        # it is expected error and should be
-        # logged only to user
-        return
+    for error in (publish_error, info_error):
+        if error is None:
+            continue
 
-    info = None
+        if isinstance(
+            error,
+            (YandexAPIPublishItemError, YandexAPIGetElementInfoError)
+        ):
+            send_yandex_disk_error(chat_id, str(error))
+
+            # it is expected error and should be
+            # logged only to user
+            return
 
-    try:
-        info = get_element_info(access_token, path)
-    except YandexAPIRequestError as error:
         cancel_command(chat_id)
         raise error
-    except YandexAPIGetElementInfoError as error:
-        send_yandex_disk_error(chat_id, str(error))
-
-        # it is expected error and should be
-        # logged only to user
-        return
 
     text = create_element_info_html_text(info, False)
 
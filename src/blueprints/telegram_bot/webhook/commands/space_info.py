@@ -3,7 +3,12 @@ from datetime import datetime, timezone
 
 from flask import g, current_app
 
-from src.rq import task_queue, prepare_task, run_task
+from src.rq import (
+    background_tasks_is_enabled,
+    register_task,
+    enqueue_task,
+    TaskQueueName
+)
 from src.http import telegram
 from src.i18n import gettext
 from src.blueprints._common.utils import get_current_iso_datetime
@@ -21,16 +26,12 @@ from ._common.decorators import (
 
 
 # `plotly` uses too much RAM.
-# Disabled at the moment, will be refactored in future
+# Disabled at the moment, will be refactored in future.
+# `plotly` (with `kaleido`, `pandas` and `numpy`) is
+# imported only when chart is created, see `create_space_chart()`
 USE_GRAPH = False
 
 
-if USE_GRAPH:
-    from plotly.graph_objects import Pie, Figure
-    from plotly.express import colors
-    from plotly.io import to_image
-
-
 @yd_access_token_required
 def handle(*args, **kwargs):
     """
@@ -160,12 +161,60 @@ def handle_with_graph(*args, **kwargs):
 
         raise error
 
-    current_utc_date = get_current_utc_datetime()
-    current_iso_date = get_current_iso_datetime()
+    # chart is created in background task, so,
+    # only sizes are passed instead of image
+    arguments = {
+        "total_space": disk_info["total_space"],
+        "used_space": disk_info["used_space"],
+        "trash_size": disk_info["trash_size"],
+        "current_utc_date": get_current_utc_datetime(),
+        "current_iso_date": get_current_iso_datetime(),
+        "chat_id": chat_id,
+        "sended_message_id": sended_message_id
+    }
+
+    if background_tasks_is_enabled():
+        job_timeout = current_app.config[
+            "RUNTIME_SPACE_INFO_WORKER_TIMEOUT"
+        ]
+
+        enqueue_task(
+            TaskQueueName.CHARTS.value,
+            "space_info.send_space_chart",
+            arguments,
+            description=CommandName.SPACE_INFO.value,
+            job_timeout=job_timeout,
+            result_ttl=0,
+            failure_ttl=0
+        )
+    else:
+        send_space_chart(**arguments)
+
+
+@register_task("space_info.send_space_chart")
+def send_space_chart(
+    total_space: int,
+    used_space: int,
+    trash_size: int,
+    current_utc_date: str,
+    current_iso_date: str,
+    chat_id: int,
+    sended_message_id: int
+) -> None:
+    """
+    Creates Yandex.Disk space chart and sends it to user.
+
+    :param current_utc_date:
+    Date of request for chart caption.
+    :param current_iso_date:
+    Date of request for file name.
+    :param sended_message_id:
+    Message that will be deleted after sending.
+    """
     jpeg_image = create_space_chart(
-        total_space=disk_info["total_space"],
-        used_space=disk_info["used_space"],
-        trash_size=disk_info["trash_size"],
+        total_space=total_space,
+        used_space=used_space,
+        trash_size=trash_size,
         caption=current_utc_date
     )
     filename = f"{to_filename(current_iso_date)}.jpg"
@@ -173,7 +222,8 @@ def handle_with_graph(*args, **kwargs):
         "Yandex.Disk space at %(current_utc_date)s",
         current_utc_date=current_utc_date
     )
-    arguments = (
+
+    send_photo(
         jpeg_image,
         filename,
         file_caption,
@@ -181,27 +231,6 @@ def handle_with_graph(*args, **kwargs):
         sended_message_id
     )
 
-    if task_queue.is_enabled:
-        job_timeout = current_app.config[
-            "RUNTIME_SPACE_INFO_WORKER_TIMEOUT"
-        ]
-        prepare_data = prepare_task()
-
-        task_queue.enqueue(
-            run_task,
-            kwargs={
-                "f": send_photo,
-                "args": arguments,
-                "prepare_data": prepare_data
-            },
-            description=CommandName.SPACE_INFO.value,
-            job_timeout=job_timeout,
-            result_ttl=0,
-            failure_ttl=0
-        )
-    else:
-        send_photo(*arguments)
-
 
 def create_space_chart(
     total_space: int,
@@ -218,6 +247,12 @@ def create_space_chart(
 
     :returns: JPEG image as bytes.
     """
+    # takes a while and uses a lot of memory,
+    # so, it is imported only when it is needed
+    from plotly.graph_objects import Pie, Figure
+    from plotly.express import colors
+    from plotly.io import to_image
+
     free_space = b_to_gb(total_space - used_space - trash_size)
     total_space = b_to_gb(total_space)
     used_space = b_to_gb(used_space)
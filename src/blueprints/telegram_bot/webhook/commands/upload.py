@@ -1,30 +1,66 @@
+import os
+import math
+from time import time
 from abc import ABCMeta, abstractmethod
-from typing import Union, Set
+from typing import List, Union, Set, Tuple
 from collections import deque
+from functools import partial
 from urllib.parse import urlparse
 
 from flask import g, current_app
 
 from src.http import telegram
 from src.i18n import gettext
-from src.rq import task_queue, prepare_task, run_task
+from src.rq import (
+    background_tasks_is_enabled,
+    register_task,
+    enqueue_task,
+    TaskQueueName
+)
 from src.blueprints._common.utils import get_current_iso_datetime
-from src.blueprints.telegram_bot._common import youtube_dl
+from src.blueprints.telegram_bot._common import (
+    youtube_dl,
+    youtube_dl_cache,
+    telegram_file_cache,
+    upload_index,
+    media_groups,
+    status_updates
+)
 from src.blueprints.telegram_bot._common.telegram_interface import (
     Message as TelegramMessage
 )
 from src.blueprints.telegram_bot._common.command_names import (
     CommandName
 )
+from src.blueprints.telegram_bot._common.reply_markup import (
+    create_callback_data
+)
 from src.blueprints.telegram_bot._common.yandex_disk import (
+    YandexDiskPath,
+    ensure_folder_exists,
     upload_file_with_url,
+    start_upload_file_with_url,
     get_element_info,
     publish_item,
+    publish_item_and_get_element_info,
     YandexAPIRequestError,
     YandexAPICreateFolderError,
     YandexAPIUploadFileError,
     YandexAPIExceededNumberOfStatusChecksError
 )
+from src.blueprints.telegram_bot._common.operation_tracker import (
+    operation_tracker_is_enabled,
+    track_operation,
+    take_callback_turn,
+    load_error
+)
+from src.blueprints.telegram_bot._common.operation_schedule import (
+    get_time_budget
+)
+from src.blueprints.telegram_bot._common.concurrency import (
+    run_concurrently,
+    run_later
+)
 from src.blueprints.telegram_bot._common.stateful_chat import (
     stateful_chat_is_enabled,
     set_disposable_handler
@@ -46,6 +82,30 @@ from ._common.utils import (
 )
 
 
+# Payload of callback query of "Upload again" button
+UPLOAD_AGAIN_PAYLOAD = 1
+
+# Maximum number of messages in media group.
+# See https://core.telegram.org/bots/api#sendmediagroup
+MEDIA_GROUP_MAX_SIZE = 10
+
+# Keys of element info that are needed to show already
+# uploaded element (see `create_element_info_html_text`)
+UPLOADED_ELEMENT_FIELDS = ",".join((
+    "name",
+    "path",
+    "type",
+    "media_type",
+    "mime_type",
+    "size",
+    "md5",
+    "created",
+    "modified",
+    "public_key",
+    "public_url"
+))
+
+
 class MessageHealth:
     """
     Health status of Telegram message.
@@ -80,6 +140,31 @@ class AttachmentHandler(metaclass=ABCMeta):
         # than sending new message every time again
         self.sended_message: Union[TelegramMessage, None] = None
 
+        # Telegram ID of user who uploads
+        self.user_id: Union[int, None] = None
+
+        # Source of upload for upload index.
+        # See `get_upload_source()` documentation
+        self.upload_source: Union[str, None] = None
+
+        # When sended message was edited last time.
+        # Used only if Redis is disabled, otherwise
+        # see `status_updates.py`
+        self.sended_message_edited_at: Union[float, None] = None
+
+        # Digest of deferred text of sended message.
+        # Used only if Redis is disabled, otherwise
+        # see `status_updates.py`
+        self.pending_text_digest: Union[str, None] = None
+
+        # Trailing edit of sended message, which sends
+        # latest deferred status. See `reply_to_message()`
+        self.trailing_edit = None
+
+        # Content is uploaded again by "Upload again"
+        # button, so, name of file should be unique
+        self.upload_again = False
+
     @staticmethod
     @abstractmethod
     def handle(*args, **kwargs) -> None:
@@ -277,6 +362,74 @@ class AttachmentHandler(metaclass=ABCMeta):
 
         return result
 
+    def get_task_state(self) -> dict:
+        """
+        :returns:
+        State of this handler that is needed to continue
+        uploading in background task. See `restore_handler()`.
+        """
+        sended_message = None
+
+        if self.sended_message is not None:
+            sended_message = {
+                "message_id": self.sended_message.message_id,
+                "text": self.sended_message.get_text()
+            }
+
+        return {
+            "command": self.telegram_command,
+            "user_id": self.user_id,
+            "upload_source": self.upload_source,
+            "sended_message": sended_message,
+            "sended_message_edited_at": self.sended_message_edited_at,
+            "upload_again": self.upload_again
+        }
+
+    def set_task_state(self, state: dict) -> None:
+        """
+        :param state:
+        Result of `get_task_state()`.
+        """
+        self.user_id = state["user_id"]
+        self.upload_source = state["upload_source"]
+        self.sended_message_edited_at = state["sended_message_edited_at"]
+        # jobs that were enqueued before don't have it
+        self.upload_again = state.get("upload_again", False)
+
+        if state["sended_message"] is not None:
+            self.sended_message = TelegramMessage(
+                state["sended_message"]
+            )
+
+    def get_upload_source(
+        self,
+        attachment: Union[dict, str]
+    ) -> Union[str, None]:
+        """
+        :param attachment:
+        Not `None` value from `self.get_attachment()`.
+
+        :returns:
+        Value which identifies same content that was sent
+        again (same file, same URL, etc.). Used as a key in
+        upload index. `None` if content can't be identified.
+        """
+        if isinstance(attachment, str):
+            return attachment
+
+        return attachment.get("file_unique_id")
+
+    def create_unique_file_name(self, file_name: str) -> str:
+        """
+        :returns:
+        Name of file that will not conflict with
+        already uploaded file with `file_name` name.
+        """
+        name, extension = os.path.splitext(file_name)
+        date = get_current_iso_datetime(sep=" ")
+
+        return f"{name} ({date}){extension}"
+
     def is_too_big_file(self, file: dict) -> bool:
         """
         Checks if size of file exceeds limit size of upload.
@@ -361,6 +514,32 @@ class AttachmentHandler(metaclass=ABCMeta):
             "message",
             g.telegram_message
         )
+        callback_query = kwargs.get("callback_query")
+
+        # "Upload again" button was clicked, the button
+        # is attached to reply to message that should be
+        # uploaded again
+        upload_again = (
+            (callback_query is not None) and
+            (kwargs.get("callback_query_data") == UPLOAD_AGAIN_PAYLOAD)
+        )
+
+        if upload_again:
+            telegram.answer_callback_query(
+                callback_query_id=callback_query.id
+            )
+
+            button_message = callback_query.get_message()
+            raw_message = (
+                button_message and
+                button_message.get("reply_to_message")
+            )
+
+            if not raw_message:
+                return abort_command(chat_id, AbortReason.NO_SUITABLE_DATA)
+
+            message = TelegramMessage(raw_message)
+
         attachment = self.get_attachment(message)
         message_health = self.check_message_health(attachment)
 
@@ -380,6 +559,24 @@ class AttachmentHandler(metaclass=ABCMeta):
             else:
                 return abort_command(chat_id, reason)
 
+        user = g.db_user
+        user_access_token = user.yandex_disk_token.get_access_token()
+        folder_path = (user.settings.default_upload_folder or "/")
+        self.user_id = user.telegram_id
+        self.upload_source = self.get_upload_source(attachment)
+        self.upload_again = upload_again
+
+        if (
+            not upload_again and
+            self.send_uploaded_element(
+                user_access_token,
+                folder_path,
+                chat_id,
+                message.message_id
+            )
+        ):
+            return
+
         try:
             telegram.send_chat_action(
                 chat_id=chat_id,
@@ -391,39 +588,60 @@ class AttachmentHandler(metaclass=ABCMeta):
 
         download_url = None
         file = None
+        file_size = None
 
         if isinstance(attachment, str):
             current_app.logger.debug("Provided direct URL")
             download_url = attachment
         else:
-            current_app.logger.debug("Will fetch direct URL from Telegram")
-            result = None
+            file = telegram_file_cache.get_file(
+                attachment["file_unique_id"]
+            )
 
-            try:
-                result = telegram.get_file(
-                    file_id=attachment["file_id"]
+            if file is None:
+                current_app.logger.debug(
+                    "Will fetch direct URL from Telegram"
+                )
+                result = None
+
+                try:
+                    result = telegram.get_file(
+                        file_id=attachment["file_id"]
+                    )
+                except Exception as error:
+                    cancel_command(chat_id)
+                    raise error
+
+                file = result["content"]
+
+                telegram_file_cache.set_file(file)
+            else:
+                current_app.logger.debug(
+                    "Direct URL was taken from cache"
                 )
-            except Exception as error:
-                cancel_command(chat_id)
-                raise error
 
-            file = result["content"]
             download_url = telegram.create_file_download_url(
                 file["file_path"]
             )
+            file_size = (
+                file.get("file_size") or
+                attachment.get("file_size")
+            )
 
         message_id = message.message_id
-        user = g.db_user
         file_name = self.create_file_name(attachment, file)
-        user_access_token = user.yandex_disk_token.get_access_token()
-        folder_path = (user.settings.default_upload_folder or "/")
+
+        if upload_again:
+            file_name = self.create_unique_file_name(file_name)
+
         arguments = (
             folder_path,
             file_name,
             download_url,
             user_access_token,
             chat_id,
-            message_id
+            message_id,
+            file_size
         )
 
         current_app.logger.debug(
@@ -433,6 +651,27 @@ class AttachmentHandler(metaclass=ABCMeta):
             f"Name: {file_name}"
         )
 
+        media_group_id = message.get("media_group_id")
+
+        if (
+            media_group_id and
+            not upload_again and
+            media_groups.media_groups_is_enabled()
+        ):
+            return self.buffer_media_group_item(
+                media_group_id,
+                folder_path,
+                user_access_token,
+                chat_id,
+                {
+                    "message_id": message_id,
+                    "file_name": file_name,
+                    "download_url": download_url,
+                    "file_size": file_size,
+                    "upload_source": self.upload_source
+                }
+            )
+
         # Everything is fine by this moment.
         # Because task workers can be busy,
         # it can take a while to start uploading.
@@ -446,39 +685,339 @@ class AttachmentHandler(metaclass=ABCMeta):
             False
         )
 
-        if task_queue.is_enabled:
-            job_timeout = current_app.config[
-                "RUNTIME_UPLOAD_WORKER_JOB_TIMEOUT"
-            ]
-            ttl = current_app.config[
-                "RUNTIME_UPLOAD_WORKER_UPLOAD_TTL"
-            ]
-            result_ttl = current_app.config[
-                "RUNTIME_UPLOAD_WORKER_RESULT_TTL"
-            ]
-            failure_ttl = current_app.config[
-                "RUNTIME_UPLOAD_WORKER_FAILURE_TTL"
-            ]
-            task_data = prepare_task()
-
-            task_queue.enqueue(
-                run_task,
-                kwargs={
-                    "f": self.start_upload,
-                    "args": arguments,
-                    "prepare_data": task_data
-                },
-                description=self.telegram_command,
-                job_timeout=job_timeout,
-                ttl=ttl,
-                result_ttl=result_ttl,
-                failure_ttl=failure_ttl
+        if background_tasks_is_enabled():
+            self.enqueue_upload(
+                "upload.start_upload",
+                arguments,
+                self.get_upload_job_timeout()
             )
         else:
             # NOTE: current thread will
             # be blocked for a long time
             self.start_upload(*arguments)
 
+    def get_upload_job_timeout(self) -> int:
+        """
+        :returns:
+        Timeout (in seconds) of job that performs `start_upload()`.
+        """
+        return current_app.config["RUNTIME_UPLOAD_WORKER_JOB_TIMEOUT"]
+
+    def enqueue_upload(
+        self,
+        task_name: str,
+        arguments: tuple,
+        job_timeout: int
+    ) -> None:
+        """
+        Enqueues upload job into task queue.
+
+        :param task_name:
+        Name of registered task that calls method of
+        this handler (see tasks at the end of module).
+        :param arguments:
+        Positional arguments for method of this handler.
+        Should be serializable to JSON.
+        :param job_timeout:
+        Timeout of job in seconds.
+        """
+        ttl = current_app.config[
+            "RUNTIME_UPLOAD_WORKER_UPLOAD_TTL"
+        ]
+        result_ttl = current_app.config[
+            "RUNTIME_UPLOAD_WORKER_RESULT_TTL"
+        ]
+        failure_ttl = current_app.config[
+            "RUNTIME_UPLOAD_WORKER_FAILURE_TTL"
+        ]
+
+        enqueue_task(
+            TaskQueueName.UPLOADS.value,
+            task_name,
+            {
+                "handler": self.get_task_state(),
+                "args": list(arguments)
+            },
+            description=self.telegram_command,
+            job_timeout=job_timeout,
+            ttl=ttl,
+            result_ttl=result_ttl,
+            failure_ttl=failure_ttl
+        )
+
+    def buffer_media_group_item(
+        self,
+        media_group_id: str,
+        folder_path: str,
+        user_access_token: str,
+        chat_id: int,
+        item: dict
+    ) -> None:
+        """
+        Adds message of media group into buffer. First message
+        of media group will start batch uploading of all
+        messages of that media group, see
+        `start_media_group_upload()`.
+
+        :param item:
+        Data that is needed to upload message: `message_id`,
+        `file_name`, `download_url`, `file_size`, `upload_source`.
+        """
+        is_leader = media_groups.add_to_media_group(
+            chat_id,
+            media_group_id,
+            self.telegram_command,
+            item
+        )
+
+        if not is_leader:
+            return
+
+        self.reply_to_message(
+            item["message_id"],
+            chat_id,
+            gettext("Status: pending"),
+            False
+        )
+
+        config = current_app.config
+        chunks_count = math.ceil(
+            MEDIA_GROUP_MAX_SIZE /
+            config["YANDEX_DISK_API_MEDIA_GROUP_CONCURRENCY"]
+        )
+        job_timeout = (
+            config["RUNTIME_UPLOAD_WORKER_JOB_TIMEOUT"] * chunks_count +
+            config["RUNTIME_MEDIA_GROUP_MAX_WAIT"]
+        )
+
+        self.enqueue_upload(
+            "upload.start_media_group_upload",
+            (
+                media_group_id,
+                folder_path,
+                user_access_token,
+                chat_id
+            ),
+            job_timeout
+        )
+
+    def start_media_group_upload(
+        self,
+        media_group_id: str,
+        folder_path: str,
+        user_access_token: str,
+        chat_id: int
+    ) -> None:
+        """
+        Uploads all messages of media group as one batch.
+
+        - it waits for the rest of media group, so, it
+        should be called only by task queue.
+        - at most `YANDEX_DISK_API_MEDIA_GROUP_CONCURRENCY`
+        files are uploaded at the same time.
+        - single status message (reply to first message of
+        media group) is used for whole batch, and it is
+        edited only after every part of batch.
+
+        :raises:
+        Raises error if occurs.
+        """
+        items = media_groups.take_media_group(
+            chat_id,
+            media_group_id,
+            self.telegram_command
+        )
+
+        if not items:
+            return
+
+        message_id = items[0]["message_id"]
+        count = len(items)
+        concurrency = current_app.config[
+            "YANDEX_DISK_API_MEDIA_GROUP_CONCURRENCY"
+        ]
+        chunks = [
+            items[i:i + concurrency]
+            for i in range(0, count, concurrency)
+        ]
+        time_budget = get_time_budget() / len(chunks)
+        results = []
+
+        try:
+            ensure_folder_exists(user_access_token, folder_path)
+        except Exception as error:
+            return self.handle_upload_error(
+                error,
+                folder_path,
+                user_access_token,
+                chat_id,
+                message_id
+            )
+
+        for chunk in chunks:
+            self.reply_to_message(
+                message_id,
+                chat_id,
+                gettext(
+                    "Status: uploaded %(uploaded)s of %(count)s",
+                    uploaded=len(results),
+                    count=count
+                ),
+                False
+            )
+
+            results.extend(
+                run_concurrently([
+                    partial(
+                        self.upload_media_group_item,
+                        item,
+                        folder_path,
+                        user_access_token,
+                        time_budget
+                    )
+                    for item in chunk
+                ])
+            )
+
+        self.reply_to_message(
+            message_id,
+            chat_id,
+            self.create_media_group_report(items, results),
+            False,
+            final=True
+        )
+
+    def upload_media_group_item(
+        self,
+        item: dict,
+        folder_path: str,
+        user_access_token: str,
+        time_budget: float
+    ) -> dict:
+        """
+        Uploads single message of media group.
+
+        - intermediate statuses are not logged to user.
+
+        :returns:
+        Information about uploaded element.
+        Can be empty if information is not available.
+
+        :raises:
+        Raises error if uploading is failed.
+        """
+        full_path = f"{folder_path}/{item['file_name']}"
+        status = None
+
+        for status in upload_file_with_url(
+            user_access_token=user_access_token,
+            folder_path=folder_path,
+            file_name=item["file_name"],
+            download_url=item["download_url"],
+            file_size=item["file_size"],
+            time_budget=time_budget
+        ):
+            pass
+
+        # unknown error of Yandex.Disk
+        if not (status and status["success"]):
+            raise YandexAPIUploadFileError()
+
+        info = None
+        info_error = None
+
+        if self.public_upload:
+            (
+                info,
+                publish_error,
+                info_error
+            ) = publish_item_and_get_element_info(
+                user_access_token,
+                full_path,
+                get_public_info=False
+            )
+
+            if publish_error:
+                current_app.logger.error(publish_error)
+        else:
+            try:
+                info = get_element_info(
+                    user_access_token,
+                    full_path,
+                    get_public_info=False
+                )
+            except Exception as error:
+                info_error = error
+
+        if info_error:
+            current_app.logger.error(info_error)
+
+        if info and item["upload_source"]:
+            upload_index.add_upload(
+                self.user_id,
+                item["upload_source"],
+                info
+            )
+
+        return (info or {})
+
+    def create_media_group_report(
+        self,
+        items: List[dict],
+        results: List[Tuple[Union[dict, None], Union[Exception, None]]]
+    ) -> str:
+        """
+        :param items:
+        Items of media group.
+        :param results:
+        Result of `upload_media_group_item()` for every item.
+
+        :returns:
+        Text with result of uploading of every item.
+        """
+        uploaded_count = 0
+        text_content = deque()
+
+        for item, (info, error) in zip(items, results):
+            name = item["file_name"]
+
+            if error is None:
+                uploaded_count += 1
+                public_url = info.get("public_url")
+                text_content.append(
+                    f"{name}: {public_url}" if public_url else name
+                )
+
+                continue
+
+            if isinstance(
+                error,
+                (YandexAPICreateFolderError, YandexAPIUploadFileError)
+            ):
+                error_text = str(error) or gettext(
+                    "unknown Yandex.Disk error"
+                )
+            elif isinstance(error, YandexAPIExceededNumberOfStatusChecksError):
+                error_text = gettext(
+                    "unknown status, check it later"
+                )
+            else:
+                current_app.logger.error(error)
+                error_text = gettext("unknown error")
+
+            text_content.append(f"{name}: {error_text}")
+
+        text_content.appendleft("")
+        text_content.appendleft(
+            gettext(
+                "Uploaded %(uploaded)s of %(count)s.",
+                uploaded=uploaded_count,
+                count=len(items)
+            )
+        )
+
+        return "\n".join(text_content)
+
     def start_upload(
         self,
         folder_path: str,
@@ -486,7 +1025,8 @@ class AttachmentHandler(metaclass=ABCMeta):
         download_url: str,
         user_access_token: str,
         chat_id: int,
-        message_id: int
+        message_id: int,
+        file_size: Union[int, None] = None
     ) -> None:
         """
         Starts uploading of provided URL.
@@ -496,9 +1036,11 @@ class AttachmentHandler(metaclass=ABCMeta):
         See app configuration for monitoring config.
 
         NOTE:
-        This function requires long time to complete.
-        And because it is sync function, it will block
-        your thread.
+        If operation tracker is disabled, then this function
+        requires long time to complete. And because it is sync
+        function, it will block your thread. If tracker is enabled,
+        then monitoring will be continued by tracker in
+        `continue_upload()`.
 
         :param folder_path:
         Yandex.Disk path where to put file.
@@ -514,104 +1056,243 @@ class AttachmentHandler(metaclass=ABCMeta):
         ID of incoming Telegram message.
         This message will be reused to edit this message
         with new status instead of sending it every time.
+        :param file_size:
+        Size of file in bytes. `None` if size is unknown.
+        It is used to schedule checks of operation status.
 
         :raises:
         Raises error if occurs.
         """
         full_path = f"{folder_path}/{file_name}"
+        arguments = (
+            full_path,
+            user_access_token,
+            chat_id,
+            message_id
+        )
 
         try:
+            if operation_tracker_is_enabled():
+                operation_status_link = start_upload_file_with_url(
+                    user_access_token=user_access_token,
+                    folder_path=folder_path,
+                    file_name=file_name,
+                    download_url=download_url
+                )
+
+                track_operation(
+                    user_access_token,
+                    operation_status_link,
+                    "upload.continue_upload",
+                    task_kwargs={
+                        "handler": self.get_task_state(),
+                        "args": list(arguments)
+                    },
+                    file_size=file_size
+                )
+
+                return
+
             for status in upload_file_with_url(
                 user_access_token=user_access_token,
                 folder_path=folder_path,
                 file_name=file_name,
-                download_url=download_url
+                download_url=download_url,
+                file_size=file_size
             ):
-                success = status["success"]
-                text_content = deque()
-                is_html_text = False
-
-                if success:
-                    is_private_message = (not self.public_upload)
-
-                    if self.public_upload:
-                        try:
-                            publish_item(
-                                user_access_token,
-                                full_path
-                            )
-                        except Exception as error:
-                            current_app.logger.error(error)
-                            message = gettext(
-                                "\n"
-                                "Failed to publish. Type to do it:"
-                                "\n"
-                                "%(publish_command)s %(full_path)s",
-                                publish_command=CommandName.PUBLISH.value,
-                                full_path=full_path
-                            )
-                            text_content.append(message)
-
-                    info = None
-
-                    try:
-                        info = get_element_info(
-                            user_access_token,
-                            full_path,
-                            get_public_info=False
-                        )
-                    except Exception as error:
-                        current_app.logger.error(error)
-                        message = gettext(
-                            "\n"
-                            "Failed to get information. Type to do it:"
-                            "\n"
-                            "%(element_info_command)s %(full_path)s",
-                            element_info_command=CommandName.ELEMENT_INFO.value, # noqa
-                            full_path=full_path
-                        )
-                        text_content.append(message)
-
-                    if text_content:
-                        message = gettext(
-                            "It is successfully uploaded, "
-                            "but i failed to perform some actions. "
-                            "You need to execute them manually."
-                        )
-                        text_content.append(message)
-                        text_content.reverse()
-
-                    if info:
-                        # extra line before info
-                        if text_content:
-                            text_content.append("")
-
-                        is_html_text = True
-                        info_text = create_element_info_html_text(
-                            info,
-                            include_private_info=is_private_message
-                        )
-                        text_content.append(info_text)
-                else:
-                    # You shouldn't use HTML for this,
-                    # because `upload_status` can be a same
-                    upload_status = status["status"]
-                    text_content.append(
-                        gettext(
-                            "Status: %(upload_status)s",
-                            upload_status=upload_status
-                        )
+                self.handle_upload_status(status, *arguments)
+        except Exception as error:
+            return self.handle_upload_error(error, *arguments)
+
+    def continue_upload(
+        self,
+        operation_id: str,
+        sequence: int,
+        status: Union[dict, None],
+        error: Union[dict, None],
+        full_path: str,
+        user_access_token: str,
+        chat_id: int,
+        message_id: int
+    ) -> None:
+        """
+        Continues uploading that was started by `start_upload()`.
+
+        - it is callback of operation tracker, see
+        `track_operation()` documentation for arguments.
+        - errors of intermediate statuses will be only logged,
+        because next statuses should be handled anyway.
+        - outdated statuses (newer one was already handled)
+        will be skipped.
+        """
+        if not take_callback_turn(operation_id, sequence):
+            current_app.logger.debug(
+                f"Outdated status of operation {operation_id} skipped"
+            )
+
+            return
+
+        arguments = (
+            full_path,
+            user_access_token,
+            chat_id,
+            message_id
+        )
+        error = load_error(error)
+
+        try:
+            if error is not None:
+                raise error
+
+            self.handle_upload_status(status, *arguments)
+        except Exception as exception:
+            if status and not status["completed"]:
+                current_app.logger.exception(
+                    "Unable to handle upload status"
+                )
+
+                return
+
+            return self.handle_upload_error(exception, *arguments)
+
+    def handle_upload_status(
+        self,
+        status: dict,
+        full_path: str,
+        user_access_token: str,
+        chat_id: int,
+        message_id: int
+    ) -> None:
+        """
+        Logs to user current status of uploading.
+        If uploading is successfully ended, then
+        publishes an item (if needed) and logs
+        information about uploaded item.
+
+        :param status:
+        Status of Yandex.Disk operation.
+        See `upload_file_with_url()` documentation.
+
+        :raises:
+        Raises error if occurs.
+        """
+        success = status["success"]
+        text_content = deque()
+        is_html_text = False
+
+        if success:
+            is_private_message = (not self.public_upload)
+            info = None
+            publish_error = None
+            info_error = None
+
+            if self.public_upload:
+                (
+                    info,
+                    publish_error,
+                    info_error
+                ) = publish_item_and_get_element_info(
+                    user_access_token,
+                    full_path,
+                    get_public_info=False
+                )
+            else:
+                try:
+                    info = get_element_info(
+                        user_access_token,
+                        full_path,
+                        get_public_info=False
                     )
+                except Exception as error:
+                    info_error = error
+
+            if publish_error:
+                current_app.logger.error(publish_error)
+                message = gettext(
+                    "\n"
+                    "Failed to publish. Type to do it:"
+                    "\n"
+                    "%(publish_command)s %(full_path)s",
+                    publish_command=CommandName.PUBLISH.value,
+                    full_path=full_path
+                )
+                text_content.append(message)
+
+            if info_error:
+                current_app.logger.error(info_error)
+                message = gettext(
+                    "\n"
+                    "Failed to get information. Type to do it:"
+                    "\n"
+                    "%(element_info_command)s %(full_path)s",
+                    element_info_command=CommandName.ELEMENT_INFO.value,
+                    full_path=full_path
+                )
+                text_content.append(message)
+
+            if text_content:
+                message = gettext(
+                    "It is successfully uploaded, "
+                    "but i failed to perform some actions. "
+                    "You need to execute them manually."
+                )
+                text_content.append(message)
+                text_content.reverse()
+
+            if info and self.upload_source:
+                upload_index.add_upload(
+                    self.user_id,
+                    self.upload_source,
+                    info
+                )
 
-                text = "\n".join(text_content)
+            if info:
+                # extra line before info
+                if text_content:
+                    text_content.append("")
 
-                self.reply_to_message(
-                    message_id,
-                    chat_id,
-                    text,
-                    is_html_text
+                is_html_text = True
+                info_text = create_element_info_html_text(
+                    info,
+                    include_private_info=is_private_message
                 )
-        except YandexAPICreateFolderError as error:
+                text_content.append(info_text)
+        else:
+            # You shouldn't use HTML for this,
+            # because `upload_status` can be a same
+            upload_status = status["status"]
+            text_content.append(
+                gettext(
+                    "Status: %(upload_status)s",
+                    upload_status=upload_status
+                )
+            )
+
+        text = "\n".join(text_content)
+
+        self.reply_to_message(
+            message_id,
+            chat_id,
+            text,
+            is_html_text,
+            final=status["completed"]
+        )
+
+    def handle_upload_error(
+        self,
+        error: Exception,
+        full_path: str,
+        user_access_token: str,
+        chat_id: int,
+        message_id: int
+    ) -> None:
+        """
+        Logs to user an error of uploading.
+
+        :raises:
+        Raises `error` if it is unexpected error.
+        """
+        if isinstance(error, YandexAPICreateFolderError):
             error_text = str(error) or gettext(
                 "I can't create default upload folder "
                 "due to an unknown Yandex.Disk error."
@@ -622,7 +1303,7 @@ class AttachmentHandler(metaclass=ABCMeta):
                 error_text,
                 message_id
             )
-        except YandexAPIUploadFileError as error:
+        elif isinstance(error, YandexAPIUploadFileError):
             error_text = str(error) or gettext(
                 "I can't upload this due "
                 "to an unknown Yandex.Disk error."
@@ -633,7 +1314,7 @@ class AttachmentHandler(metaclass=ABCMeta):
                 error_text,
                 message_id
             )
-        except YandexAPIExceededNumberOfStatusChecksError:
+        elif isinstance(error, YandexAPIExceededNumberOfStatusChecksError):
             error_text = gettext(
                 "I can't track operation status of "
                 "this anymore. It can be uploaded "
@@ -647,21 +1328,133 @@ class AttachmentHandler(metaclass=ABCMeta):
             return self.reply_to_message(
                 message_id,
                 chat_id,
-                error_text
+                error_text,
+                final=True
+            )
+
+        if self.sended_message is None:
+            cancel_command(
+                chat_id,
+                reply_to_message=message_id
+            )
+        else:
+            cancel_command(
+                chat_id,
+                edit_message=self.sended_message.message_id
+            )
+
+        raise error
+
+    def send_uploaded_element(
+        self,
+        user_access_token: str,
+        folder_path: str,
+        chat_id: int,
+        message_id: int
+    ) -> bool:
+        """
+        Sends information about element that was uploaded
+        from same source recently (see `upload_index.py`).
+        Message will have "Upload again" button, so, user
+        still can upload it again with another name.
+
+        - element should be in same folder and should have
+        same size and md5, otherwise it will be not used.
+
+        :returns:
+        `True` if information was sent and uploading shouldn't
+        be performed, `False` if uploading should be performed.
+        """
+        if self.upload_source is None:
+            return False
+
+        uploaded = upload_index.get_upload(
+            self.user_id,
+            self.upload_source
+        )
+
+        if uploaded is None:
+            return False
+
+        uploaded_folder = YandexDiskPath(uploaded["path"]).get_absolute_path()
+        uploaded_folder.pop()
+        expected_folder = YandexDiskPath(folder_path).get_absolute_path()
+
+        if (list(uploaded_folder) != list(expected_folder)):
+            return False
+
+        try:
+            info = get_element_info(
+                user_access_token,
+                uploaded["path"],
+                fields=UPLOADED_ELEMENT_FIELDS
             )
         except Exception as error:
-            if self.sended_message is None:
-                cancel_command(
-                    chat_id,
-                    reply_to_message=message_id
-                )
-            else:
-                cancel_command(
-                    chat_id,
-                    edit_message=self.sended_message.message_id
-                )
+            current_app.logger.debug(
+                f"Uploaded element is not available: {error}"
+            )
+            upload_index.remove_upload(self.user_id, self.upload_source)
 
-            raise error
+            return False
+
+        is_same_element = all(
+            info.get(key) == uploaded.get(key)
+            for key in ("size", "md5")
+        )
+
+        if not is_same_element:
+            upload_index.remove_upload(self.user_id, self.upload_source)
+
+            return False
+
+        if (
+            self.public_upload and
+            ("public_url" not in info)
+        ):
+            try:
+                publish_item(user_access_token, uploaded["path"])
+                info = {
+                    **info,
+                    **get_element_info(
+                        user_access_token,
+                        uploaded["path"],
+                        fields="public_key,public_url"
+                    )
+                }
+            except Exception as error:
+                current_app.logger.error(error)
+
+                return False
+
+        text = "\n".join((
+            gettext("It is already uploaded."),
+            "",
+            create_element_info_html_text(
+                info,
+                include_private_info=(not self.public_upload)
+            )
+        ))
+        reply_markup = {
+            "inline_keyboard": [[
+                {
+                    "text": gettext("Upload again"),
+                    "callback_data": create_callback_data(
+                        [CommandName(self.telegram_command)],
+                        UPLOAD_AGAIN_PAYLOAD
+                    )
+                }
+            ]]
+        }
+
+        self.reply_to_message(
+            message_id,
+            chat_id,
+            text,
+            True,
+            reply_markup
+        )
+
+        return True
 
     def send_html_message(
         self,
@@ -683,25 +1476,33 @@ class AttachmentHandler(metaclass=ABCMeta):
         incoming_message_id: int,
         chat_id: int,
         text: str,
-        html_text=False
+        html_text=False,
+        reply_markup: Union[dict, None] = None,
+        final=False
     ) -> None:
         """
         Sends reply message to Telegram user.
 
         - if message already was sent, then sent
         message will be updated with new text.
-        - NOTE: using HTML text may lead to error,
-        because text should be compared with already
-        sended text, but already sended text will not
-        contain HTML tags (even if they was before sending),
-        and `text` will, so, comparing already sended HTML
-        text and `text` always will results to `False`.
+        - edits are debounced, see `take_edit_slot()`.
+        Deferred edit will be sent in background as trailing
+        edit, unless newer status will be sent before.
+        Use `wait_trailing_edit()` before end of job.
+
+        :param final:
+        It is final state of message, so, it should
+        be sent even if previous edit was made recently.
         """
         enabled_html = {}
 
         if html_text:
             enabled_html["parse_mode"] = "HTML"
 
+        if reply_markup:
+            enabled_html["reply_markup"] = reply_markup
+
+        normalized_text = status_updates.normalize_text(text, html_text)
         result = None
 
         if self.sended_message is None:
@@ -713,15 +1514,40 @@ class AttachmentHandler(metaclass=ABCMeta):
                 disable_web_page_preview=True,
                 **enabled_html
             )
-        elif (text != self.sended_message.get_text()):
-            result = telegram.edit_message_text(
-                message_id=self.sended_message.message_id,
-                chat_id=chat_id,
-                text=text,
-                disable_web_page_preview=True,
-                **enabled_html
+
+            if result["ok"]:
+                self.remember_sent_message(
+                    chat_id,
+                    result["content"]["message_id"],
+                    normalized_text
+                )
+        else:
+            edit, delay = self.take_edit_slot(
+                chat_id,
+                normalized_text,
+                final
             )
 
+            if edit:
+                self.cancel_trailing_edit()
+                result = self.edit_sended_message(
+                    chat_id,
+                    text,
+                    enabled_html
+                )
+            elif delay is not None:
+                self.cancel_trailing_edit()
+                self.trailing_edit = run_later(
+                    delay,
+                    partial(
+                        self.send_trailing_edit,
+                        chat_id,
+                        text,
+                        normalized_text,
+                        enabled_html
+                    )
+                )
+
         new_message_sended = (
             (result is not None) and
             result["ok"]
@@ -732,6 +1558,143 @@ class AttachmentHandler(metaclass=ABCMeta):
                 result["content"]
             )
 
+    def edit_sended_message(
+        self,
+        chat_id: int,
+        text: str,
+        enabled_html: dict
+    ) -> dict:
+        return telegram.edit_message_text(
+            message_id=self.sended_message.message_id,
+            chat_id=chat_id,
+            text=text,
+            disable_web_page_preview=True,
+            **enabled_html
+        )
+
+    def send_trailing_edit(
+        self,
+        chat_id: int,
+        text: str,
+        normalized_text: str,
+        enabled_html: dict
+    ) -> None:
+        """
+        Sends deferred edit if there were no newer edits.
+        """
+        edit, _ = self.take_edit_slot(
+            chat_id,
+            normalized_text,
+            trailing=True
+        )
+
+        if not edit:
+            return
+
+        result = self.edit_sended_message(chat_id, text, enabled_html)
+
+        if result["ok"]:
+            self.sended_message = TelegramMessage(
+                result["content"]
+            )
+
+    def cancel_trailing_edit(self) -> None:
+        if self.trailing_edit is not None:
+            self.trailing_edit.cancel()
+            self.trailing_edit = None
+
+    def wait_trailing_edit(self) -> None:
+        """
+        Waits for trailing edit (if any), so, it will be
+        not lost when process of job exits.
+        """
+        if self.trailing_edit is not None:
+            self.trailing_edit.join()
+            self.trailing_edit = None
+
+    def remember_sent_message(
+        self,
+        chat_id: int,
+        message_id: int,
+        normalized_text: str
+    ) -> None:
+        """
+        Remembers time of sending, so, first edit
+        of sended message will be debounced against it.
+        """
+        if status_updates.status_updates_is_enabled():
+            return status_updates.remember_sent_message(
+                chat_id,
+                message_id,
+                normalized_text
+            )
+
+        self.sended_message_edited_at = time()
+
+    def take_edit_slot(
+        self,
+        chat_id: int,
+        normalized_text: str,
+        final=False,
+        trailing=False
+    ) -> Tuple[bool, Union[float, None]]:
+        """
+        - edit with same text (as user will see it) is skipped.
+        - intermediate edit is deferred if previous edit was made
+        less than `RUNTIME_STATUS_UPDATE_INTERVAL` seconds ago.
+        - final edit is never skipped (if text is different).
+        - trailing edit is sent only if there were no newer edits.
+
+        :param normalized_text:
+        New text of sended message, see `normalize_text()`.
+
+        :returns:
+        See `status_updates.take_update_slot()`.
+        """
+        message_id = self.sended_message.message_id
+
+        if status_updates.status_updates_is_enabled():
+            return status_updates.take_update_slot(
+                chat_id,
+                message_id,
+                normalized_text,
+                final,
+                trailing
+            )
+
+        digest = status_updates.get_digest(normalized_text)
+
+        if trailing:
+            if (digest != self.pending_text_digest):
+                return (False, None)
+        else:
+            sended_text = status_updates.normalize_text(
+                self.sended_message.get_text()
+            )
+
+            if (normalized_text == sended_text):
+                self.pending_text_digest = None
+
+                return (False, None)
+
+            interval = current_app.config["RUNTIME_STATUS_UPDATE_INTERVAL"]
+            edited_at = self.sended_message_edited_at
+            now = time()
+
+            if (
+                not final and
+                edited_at and
+                (now - edited_at < interval)
+            ):
+                self.pending_text_digest = digest
+
+                return (False, interval - (now - edited_at))
+
+        self.pending_text_digest = None
+        self.sended_message_edited_at = time()
+
+        return (True, None)
+
 
 class PhotoHandler(AttachmentHandler):
     """
@@ -1117,7 +2080,6 @@ class IntellectualURLHandler(DirectURLHandler):
         super().__init__()
 
         self.input_url = None
-        self.youtube_dl_info = None
 
     @staticmethod
     def handle(*args, **kwargs):
@@ -1156,21 +2118,66 @@ class IntellectualURLHandler(DirectURLHandler):
         return text
 
     def get_attachment(self, message: TelegramMessage):
+        # direct URL will be extracted when uploading
+        # is started, see `start_upload()`
         self.input_url = super().get_attachment(message)
 
-        if not self.input_url:
-            return None
+        return self.input_url
+
+    def get_upload_source(self, attachment):
+        # direct URL from `youtube_dl` can be
+        # different for same input URL
+        return self.input_url
+
+    def get_upload_job_timeout(self):
+        return (
+            super().get_upload_job_timeout() +
+            current_app.config["RUNTIME_YOUTUBE_DL_EXTRACT_TIMEOUT"]
+        )
+
+    def extract_info(self, url: str) -> Union[dict, None]:
+        """
+        :returns:
+        Result of `youtube_dl.extract_info()`.
+        `None` if URL should be treated as direct URL.
+        """
+        cached_info = youtube_dl_cache.get_info(url)
 
-        best_url = self.input_url
+        if cached_info is not None:
+            current_app.logger.debug("youtube_dl result was taken from cache")
+
+            if (
+                cached_info.get("unsupported") or
+                cached_info.get("failed")
+            ):
+                return None
+
+            return cached_info
+
+        timeout = current_app.config["RUNTIME_YOUTUBE_DL_EXTRACT_TIMEOUT"]
 
         try:
-            self.youtube_dl_info = youtube_dl.extract_info(
-                self.input_url
-            )
+            info = youtube_dl.extract_info(url, timeout)
+
+            youtube_dl_cache.set_info(url, info)
+
+            return info
         except youtube_dl.UnsupportedURLError:
             # Unsupported URL's is expected here,
             # let's treat them as direct URL's to files
             current_app.logger.debug("Unsupported youtube_dl URL")
+            youtube_dl_cache.set_unsupported(url)
+        except youtube_dl.ExtractionFailedError as error:
+            # it can be temporary error, so,
+            # it is cached for short time
+            current_app.logger.warning(
+                f"youtube_dl extraction failed: {error}"
+            )
+            youtube_dl_cache.set_failed(url)
+        except youtube_dl.ExtractionTimeoutError as error:
+            current_app.logger.warning(
+                f"youtube_dl extraction interrupted: {error}"
+            )
         except youtube_dl.UnexpectedError as error:
             # TODO:
             # Something goes wrong in `youtube_dl`.
@@ -1181,34 +2188,51 @@ class IntellectualURLHandler(DirectURLHandler):
             # At the moment there is no best way for UX, so,
             # let's just print this information in logs.
             current_app.logger.error(
-                "Unexpected youtube_dl error: " +
-                error
+                f"Unexpected youtube_dl error: {error}"
             )
 
-        if self.youtube_dl_info:
-            best_url = self.youtube_dl_info["direct_url"]
-            current_app.logger.debug("youtube_dl was used to get direct URL")
+        return None
 
-        return best_url
+    def start_upload(
+        self,
+        folder_path: str,
+        file_name: str,
+        download_url: str,
+        *args,
+        **kwargs
+    ) -> None:
+        """
+        Extracts direct URL from input URL (`download_url`)
+        and starts uploading of it.
+
+        - extraction can take a while, so, it is performed
+        here (i.e. in background task, if it is enabled)
+        instead of handling of incoming message.
+        - if nothing was extracted, then input URL
+        is uploaded as direct URL.
+        """
+        youtube_dl_info = self.extract_info(download_url)
 
-    def create_file_name(self, attachment, file):
-        input_filename = super().create_file_name(
-            self.input_url,
-            file
-        )
-        youtube_dl_filename = None
+        if youtube_dl_info:
+            current_app.logger.debug("youtube_dl was used to get direct URL")
 
-        if self.youtube_dl_info:
-            youtube_dl_filename = self.youtube_dl_info.get(
-                "filename"
-            )
+            download_url = youtube_dl_info["direct_url"]
+            youtube_dl_filename = youtube_dl_info.get("filename")
 
-        best_filename = (
-            youtube_dl_filename or
-            input_filename
-        )
+            if youtube_dl_filename:
+                file_name = (
+                    self.create_unique_file_name(youtube_dl_filename)
+                    if self.upload_again else
+                    youtube_dl_filename
+                )
 
-        return best_filename
+        super().start_upload(
+            folder_path,
+            file_name,
+            download_url,
+            *args,
+            **kwargs
+        )
 
 
 class PublicHandler:
@@ -1332,3 +2356,82 @@ handle_public_audio = PublicAudioHandler.handle
 handle_public_video = PublicVideoHandler.handle
 handle_public_voice = PublicVoiceHandler.handle
 handle_public_url = PublicIntellectualURLHandler.handle
+
+
+HANDLER_CLASSES = (
+    PhotoHandler,
+    FileHandler,
+    AudioHandler,
+    VideoHandler,
+    VoiceHandler,
+    IntellectualURLHandler,
+    PublicPhotoHandler,
+    PublicFileHandler,
+    PublicAudioHandler,
+    PublicVideoHandler,
+    PublicVoiceHandler,
+    PublicIntellectualURLHandler
+)
+
+
+def restore_handler(state: dict) -> AttachmentHandler:
+    """
+    :param state:
+    Result of `AttachmentHandler.get_task_state()`.
+
+    :returns:
+    Handler that is associated with same command
+    and has same state.
+    """
+    for handler_class in HANDLER_CLASSES:
+        handler = handler_class()
+
+        if (handler.telegram_command == state["command"]):
+            handler.set_task_state(state)
+
+            return handler
+
+    raise ValueError(f"Unknown upload handler: {state['command']}")
+
+
+@register_task("upload.start_upload")
+def start_upload_task(handler: dict, args: list) -> None:
+    upload_handler = restore_handler(handler)
+
+    try:
+        upload_handler.start_upload(*args)
+    finally:
+        upload_handler.wait_trailing_edit()
+
+
+@register_task("upload.continue_upload")
+def continue_upload_task(
+    handler: dict,
+    args: list,
+    operation_id: str,
+    sequence: int,
+    status: Union[dict, None],
+    error: Union[dict, None]
+) -> None:
+    upload_handler = restore_handler(handler)
+
+    try:
+        upload_handler.continue_upload(
+            operation_id,
+            sequence,
+            status,
+            error,
+            *args
+        )
+    finally:
+        upload_handler.wait_trailing_edit()
+
+
+@register_task("upload.start_media_group_upload")
+def start_media_group_upload_task(handler: dict, args: list) -> None:
+    upload_handler = restore_handler(handler)
+
+    try:
+        upload_handler.start_media_group_upload(*args)
+    finally:
+        upload_handler.wait_trailing_edit()
@@ -9,11 +9,13 @@ import traceback
 from flask import current_app, g
 from src.blueprints.telegram_bot._common.stateful_chat import (
     stateful_chat_is_enabled,
-    get_disposable_handler,
-    delete_disposable_handler,
-    get_subscribed_handlers,
+    route_handlers,
     set_user_chat_data,
-    get_user_chat_data
+    get_user_chat_data,
+    ROUTE_DISPOSABLE_HANDLER,
+    ROUTE_SUBSCRIBED_HANDLERS,
+    ROUTE_DIRECT_HANDLER,
+    ROUTE_DATA_HANDLER
 )
 from src.blueprints.telegram_bot._common.telegram_interface import (
     Update as TelegramUpdate,
@@ -29,6 +31,15 @@ from .dispatcher_interface import (
 )
 
 
+# Maps stateful chat routes to route sources
+STATEFUL_CHAT_ROUTE_SOURCES = {
+    ROUTE_DISPOSABLE_HANDLER: RouteSource.DISPOSABLE_HANDLER,
+    ROUTE_SUBSCRIBED_HANDLERS: RouteSource.SUBSCRIBED_HANDLER,
+    ROUTE_DIRECT_HANDLER: RouteSource.DIRECT_COMMAND,
+    ROUTE_DATA_HANDLER: RouteSource.SAME_DATE_COMMAND
+}
+
+
 class IntellectualDispatchResult:
     """
     Result of intellectual dispatch that can be used
@@ -197,7 +208,10 @@ def message_dispatch(
     5) guessing of command that user assumed based on
     content of message
 
-    If stateful chat not enabled, then № 1 and № 2 will be skipped.
+    If stateful chat not enabled, then № 1, № 2 and № 4 will be skipped.
+    Otherwise № 1 - № 4 are performed atomically by single Redis call,
+    so, disposable handler will be called only for one message even
+    if multiple messages are handled at the same time.
 
     Events matching:
     - if at least one event matched, then that handler will be
@@ -219,131 +233,48 @@ def message_dispatch(
     user_id = message.get_user().id
     chat_id = message.get_chat().id
     message_date = int(message.get_date().timestamp())
-    is_stateful_chat = stateful_chat_is_enabled()
-    disposable_handler = None
-    subscribed_handlers = None
-
-    if is_stateful_chat:
-        disposable_handler = get_disposable_handler(user_id, chat_id)
-        subscribed_handlers = get_subscribed_handlers(user_id, chat_id)
-
-    current_app.logger.debug(
-        f"Disposable handler: {disposable_handler}"
-    )
-    current_app.logger.debug(
-        f"Subscribed handlers: {subscribed_handlers}"
-    )
-
-    message_events = (
-        detect_message_events(message) if (
-            disposable_handler or
-            subscribed_handlers
-        ) else None
-    )
+    message_events = detect_message_events(message)
+    command = message.get_entity_value("bot_command")
     result = IntellectualDispatchResult()
 
     current_app.logger.debug(
         f"Message events: {message_events}"
     )
-
-    if disposable_handler:
-        match = match_events(
-            message_events,
-            disposable_handler["events"]
-        )
-
-        current_app.logger.debug(
-            f"Disposable handler matches: {match}"
-        )
-
-        if match:
-            result.route_source = RouteSource.DISPOSABLE_HANDLER
-            result.handler_names.append(disposable_handler["name"])
-
-            delete_disposable_handler(user_id, chat_id)
-
-    if (
-        subscribed_handlers and
-        not result.handler_names
-    ):
-        for handler in subscribed_handlers:
-            match = match_events(
-                message_events,
-                handler["events"]
-            )
-
-            current_app.logger.debug(
-                f"Subscribed handler {handler['name']} matches: {match}"
-            )
-
-            if match:
-                result.route_source = RouteSource.SUBSCRIBED_HANDLER
-                result.handler_names.append(handler["name"])
-
-    if not result.handler_names:
-        command = message.get_entity_value("bot_command")
-
-        current_app.logger.debug(
-            f"Direct command: {command}"
-        )
-
-        if command:
-            result.route_source = RouteSource.DIRECT_COMMAND
-            result.handler_names.append(command)
-
-    should_bind_command_to_date = (
-        is_stateful_chat and
-        (
-            result.route_source in
-            (
-                RouteSource.DISPOSABLE_HANDLER,
-                RouteSource.DIRECT_COMMAND
-            )
-        )
-    )
-    should_get_command_by_date = (
-        is_stateful_chat and
-        not result.handler_names
+    current_app.logger.debug(
+        f"Direct command: {command}"
     )
 
-    if should_bind_command_to_date:
-        # we expect only one active command
-        command = result.handler_names[0]
-
-        # we need to handle cases when user forwards
+    if stateful_chat_is_enabled():
+        # № 1 - № 4 in single Redis call.
+        # We also bind `RouteSource.DISPOSABLE_HANDLER` to date
+        # because we need to handle cases when user forwards
         # many separate messages (one with direct command and
         # others without any command but with some attachments).
         # These messages will be sended by Telegram one by one
         # (it is means we got separate direct command and
         # separate attachments without that any commands).
-        # We also using `RouteSource.DISPOSABLE_HANDLER`
-        # because user can start command without any attachments,
+        # Also user can start command without any attachments,
         # but forward multiple attachments at once or send
         # media group (media group messages have same date).
-        bind_command_to_date(
+        route, handler_names = route_handlers(
             user_id,
             chat_id,
-            message_date,
-            command
-        )
-
-        current_app.logger.debug(
-            f"Command {command} binded to date"
-        )
-    elif should_get_command_by_date:
-        command = get_command_by_date(
-            user_id,
-            chat_id,
-            message_date
+            message_events,
+            command,
+            create_date_command_key(message_date),
+            current_app.config["RUNTIME_SAME_DATE_COMMAND_EXPIRE"]
         )
 
         current_app.logger.debug(
-            f"Same date command: {command}"
+            f"Stateful chat route: {route}, handlers: {handler_names}"
         )
 
-        if command:
-            result.route_source = RouteSource.SAME_DATE_COMMAND
-            result.handler_names.append(command)
+        if handler_names:
+            result.route_source = STATEFUL_CHAT_ROUTE_SOURCES[route]
+            result.handler_names.extend(handler_names)
+    elif command:
+        result.route_source = RouteSource.DIRECT_COMMAND
+        result.handler_names.append(command)
 
     if not result.handler_names:
         result.route_source = RouteSource.GUESSED_COMMAND
@@ -619,6 +550,15 @@ def match_events(a: Set[str], b: Set[str]) -> bool:
     return any(x in b for x in a)
 
 
+def create_date_command_key(date: int) -> str:
+    """
+    :returns:
+    Key of user chat data that stores command
+    which is binded to date.
+    """
+    return f"dispatcher:date:{date}:command"
+
+
 def bind_command_to_date(
     user_id: int,
     chat_id: int,
@@ -633,7 +573,7 @@ def bind_command_to_date(
 
     - stateful chat should be enabled.
     """
-    key = f"dispatcher:date:{date}:command"
+    key = create_date_command_key(date)
     expire = current_app.config[
         "RUNTIME_SAME_DATE_COMMAND_EXPIRE"
     ]
@@ -658,7 +598,7 @@ def get_command_by_date(
     :returns:
     Value that was set using `bind_command_to_date()`.
     """
-    key = f"dispatcher:date:{date}:command"
+    key = create_date_command_key(date)
 
     return get_user_chat_data(
         user_id,
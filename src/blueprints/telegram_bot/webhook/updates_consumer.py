@@ -0,0 +1,446 @@
+"""
+Consumer of stream of incoming Telegram updates.
+See `updates_stream.py` for more.
+"""
+
+import os
+import math
+import signal
+import socket
+from threading import Thread, Event
+from typing import Union, Dict
+
+from flask import Flask
+
+from src.blueprints.telegram_bot._common import telegram_interface
+from .views import handle_update
+from .updates_idempotency import UpdateInProgressError
+from .updates_stream import (
+    get_partitions_count,
+    create_consumer_group,
+    read_updates,
+    claim_pending_updates,
+    acknowledge_update,
+    register_consumer,
+    unregister_consumer,
+    acquire_partition,
+    renew_partition,
+    release_partition
+)
+
+
+# How many new updates will be read at once
+READ_COUNT = 10
+
+# How long to wait (in seconds) after unexpected
+# error (for example, Redis is not available)
+ERROR_INTERVAL = 1
+
+# How long to wait (in seconds) before next attempt to handle
+# update that is handled right now by previous owner of partition
+IN_PROGRESS_INTERVAL = 1
+
+
+class PartitionWorker(Thread):
+    """
+    Handles updates of single partition one by one in order.
+
+    - partition should be owned before starting of worker.
+    - worker doesn't renew lease of partition, it should
+    be done by creator of worker. Renewal should continue
+    until worker exits, even after `stop()` was called.
+    - worker releases lease by itself when it exits, so,
+    creator of worker never have to wait for it.
+    """
+    def __init__(
+        self,
+        app: Flask,
+        partition: int,
+        consumer_name: str
+    ) -> None:
+        super(PartitionWorker, self).__init__(daemon=True)
+
+        self.app = app
+        self.partition = partition
+        self.consumer_name = consumer_name
+        self.stop_event = Event()
+        self.lost = False
+
+    def stop(self, lost: bool = False) -> None:
+        """
+        Asks worker to stop after handling of current update.
+
+        :param lost:
+        Lease was already lost. Worker will not try to
+        release it and owner should not renew it anymore.
+        """
+        self.lost = self.lost or lost
+        self.stop_event.set()
+
+    def run(self) -> None:
+        try:
+            self.consume_partition()
+        finally:
+            self.release()
+
+    def consume_partition(self) -> None:
+        config = self.app.config
+        block = config["RUNTIME_UPDATES_STREAM_BLOCK"] * 1000
+        pending_consumed = False
+
+        while not self.stop_event.is_set():
+            try:
+                # previous owner can leave unhandled updates,
+                # they should be handled before new ones
+                if not pending_consumed:
+                    with self.app.app_context():
+                        create_consumer_group(self.partition)
+                        pending_entries = claim_pending_updates(
+                            self.partition,
+                            self.consumer_name
+                        )
+
+                    self.consume_entries(pending_entries)
+
+                    pending_consumed = True
+
+                with self.app.app_context():
+                    new_entries = read_updates(
+                        self.partition,
+                        self.consumer_name,
+                        READ_COUNT,
+                        block
+                    )
+
+                self.consume_entries(
+                    (entry_id, raw_data, 0)
+                    for entry_id, raw_data in new_entries
+                )
+            except Exception:
+                self.app.logger.exception(
+                    f"Unable to read partition {self.partition}"
+                )
+                self.stop_event.wait(ERROR_INTERVAL)
+
+    def release(self) -> None:
+        """
+        Releases lease of partition if it wasn't lost.
+
+        - release is compare-and-delete, so, lease that
+        already belongs to another consumer stays untouched.
+        """
+        if self.lost:
+            return
+
+        try:
+            with self.app.app_context():
+                release_partition(self.partition, self.consumer_name)
+        except Exception:
+            self.app.logger.exception(
+                f"Unable to release partition {self.partition}"
+            )
+
+    def consume_entries(self, entries) -> None:
+        """
+        Handles entries one by one.
+
+        - remaining entries will be not handled if worker was
+        stopped. They will stay unacknowledged, so, next owner
+        of partition will handle them.
+        """
+        for entry_id, raw_data, deliveries in entries:
+            if self.stop_event.is_set():
+                break
+
+            consume_entry(
+                self.app,
+                self.partition,
+                entry_id,
+                raw_data,
+                deliveries,
+                self.stop_event
+            )
+
+
+def run_consumer(
+    app: Flask,
+    name: Union[str, None] = None,
+    max_partitions: Union[int, None] = None
+) -> None:
+    """
+    Runs consumer of updates stream and blocks
+    until SIGINT or SIGTERM will be received.
+
+    Consumer registers itself, owns fair share of partitions
+    (number of partitions divided by number of alive consumers)
+    and handles every owned partition in separate thread.
+    When consumers join or leave, partitions will be rebalanced.
+
+    - if you want to use gevent, then monkey patching
+    should be applied before calling this function.
+    - every update will be handled in clean app context,
+    so, `g` from one update will not intersects with `g`
+    from another update.
+    - request context is not available.
+
+    :param app:
+    Flask app that will be used to handle updates.
+    :param name:
+    Name of consumer. Should be unique among all running
+    processes. Defaults to hostname and PID.
+    :param max_partitions:
+    Maximum number of partitions that can be owned by
+    consumer (i.e., how many updates can be handled at the
+    same time). `None` for no limit.
+    """
+    if name is None:
+        name = f"{socket.gethostname()}:{os.getpid()}"
+
+    lease_time = app.config["RUNTIME_UPDATES_STREAM_LEASE_TIME"] * 1000
+    stop_event = Event()
+    workers: Dict[int, PartitionWorker] = {}
+    stopping: Dict[int, PartitionWorker] = {}
+
+    def stop(*args):
+        app.logger.info("Stopping updates consumer")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    app.logger.info(f"Started updates consumer ({name})")
+
+    with app.app_context():
+        partitions_count = get_partitions_count()
+
+        while not stop_event.is_set():
+            try:
+                rebalance(
+                    app,
+                    name,
+                    workers,
+                    stopping,
+                    partitions_count,
+                    max_partitions,
+                    lease_time
+                )
+            except Exception:
+                app.logger.exception("Unable to rebalance partitions")
+
+            # lease should be renewed several times
+            # before it will expire
+            stop_event.wait(lease_time / 1000 / 3)
+
+        for partition in list(workers.keys()):
+            stop_partition(workers, stopping, partition)
+
+        # workers can finish current updates only while
+        # their partitions are still owned by this consumer
+        while stopping:
+            try:
+                renew_stopping(app, name, stopping, lease_time)
+            except Exception:
+                app.logger.exception("Unable to renew partitions")
+
+            for worker in list(stopping.values()):
+                worker.join(lease_time / 1000 / 3 / len(stopping))
+
+        unregister_consumer(name)
+
+
+def rebalance(
+    app: Flask,
+    consumer_name: str,
+    workers: Dict[int, PartitionWorker],
+    stopping: Dict[int, PartitionWorker],
+    partitions_count: int,
+    max_partitions: Union[int, None],
+    lease_time: int
+) -> None:
+    """
+    Renews leases of owned partitions, releases partitions
+    that exceed fair share and owns free partitions.
+
+    - should be called within app context.
+    - never waits for workers. Stopped workers are moved to
+    `stopping`, their leases are renewed until they exit.
+    """
+    # leases of all partitions should be renewed first,
+    # nothing below should delay them
+    lost_partitions = [
+        partition
+        for partition in list(workers.keys())
+        if not renew_partition(partition, consumer_name, lease_time)
+    ]
+
+    renew_stopping(app, consumer_name, stopping, lease_time)
+
+    for partition in list(workers.keys()):
+        lost = (partition in lost_partitions)
+
+        if lost or not workers[partition].is_alive():
+            app.logger.warning(
+                f"Partition {partition} was lost by {consumer_name}"
+            )
+            stop_partition(workers, stopping, partition, lost)
+
+    consumers_count = register_consumer(consumer_name, lease_time)
+    fair_share = math.ceil(partitions_count / consumers_count)
+
+    if max_partitions is not None:
+        fair_share = min(fair_share, max_partitions)
+
+    while (len(workers) > fair_share):
+        partition = max(workers.keys())
+
+        app.logger.info(
+            f"Partition {partition} was released by {consumer_name}"
+        )
+        stop_partition(workers, stopping, partition)
+
+    if (len(workers) >= fair_share):
+        return
+
+    # different consumers start from different partitions
+    # in order to not compete for same partitions
+    offset = hash(consumer_name) % partitions_count
+
+    for i in range(partitions_count):
+        if (len(workers) >= fair_share):
+            break
+
+        partition = (offset + i) % partitions_count
+
+        # previous worker of partition is still running,
+        # it will release lease by itself
+        if (partition in workers) or (partition in stopping):
+            continue
+
+        if not acquire_partition(partition, consumer_name, lease_time):
+            continue
+
+        worker = PartitionWorker(app, partition, consumer_name)
+        workers[partition] = worker
+
+        worker.start()
+
+        app.logger.info(
+            f"Partition {partition} was owned by {consumer_name}"
+        )
+
+
+def renew_stopping(
+    app: Flask,
+    consumer_name: str,
+    stopping: Dict[int, PartitionWorker],
+    lease_time: int
+) -> None:
+    """
+    Forgets exited workers and renews leases of workers
+    that are still finishing their current updates.
+
+    - should be called within app context.
+    """
+    for partition in list(stopping.keys()):
+        worker = stopping[partition]
+
+        if not worker.is_alive():
+            stopping.pop(partition)
+
+            continue
+
+        if worker.lost:
+            continue
+
+        # worker can release lease at same time,
+        # it is fine, renewal will just fail
+        if not renew_partition(partition, consumer_name, lease_time):
+            if worker.is_alive():
+                app.logger.warning(
+                    f"Partition {partition} was lost by "
+                    f"{consumer_name} while stopping"
+                )
+
+            worker.stop(lost=True)
+
+
+def stop_partition(
+    workers: Dict[int, PartitionWorker],
+    stopping: Dict[int, PartitionWorker],
+    partition: int,
+    lost: bool = False
+) -> None:
+    """
+    Asks worker of partition to stop without waiting for it.
+
+    - worker releases lease by itself when it exits,
+    otherwise two consumers can handle same partition.
+    Until then lease should be renewed (see `renew_stopping`).
+    """
+    worker = workers.pop(partition)
+
+    worker.stop(lost)
+
+    stopping[partition] = worker
+
+
+def consume_entry(
+    app: Flask,
+    partition: int,
+    entry_id: str,
+    raw_data: Union[dict, None],
+    deliveries: int,
+    stop_event: Event
+) -> None:
+    """
+    Handles single entry of the stream.
+
+    - if handling fails, then it will be repeated until
+    `RUNTIME_UPDATES_STREAM_MAX_DELIVERIES` is reached.
+    After that entry will be removed, because next updates
+    of partition can't wait forever.
+    - if update is handled right now by someone else (previous
+    owner of partition was stopped, but its handler is still
+    running), then handling will be repeated until claim of
+    that handler expires. It is not counted as delivery.
+    - if `stop_event` is set while waiting for such update,
+    then entry stays unacknowledged, so, next owner
+    of partition will handle it.
+    """
+    max_deliveries = app.config["RUNTIME_UPDATES_STREAM_MAX_DELIVERIES"]
+
+    while (deliveries < max_deliveries) and (raw_data is not None):
+        deliveries += 1
+
+        app.logger.debug(f"Raw data: {raw_data}")
+
+        with app.app_context():
+            update = telegram_interface.Update(raw_data)
+
+            try:
+                handle_update(update)
+            except UpdateInProgressError:
+                deliveries -= 1
+
+                if stop_event.wait(IN_PROGRESS_INTERVAL):
+                    return
+
+                continue
+            except Exception:
+                app.logger.exception(
+                    f"Unable to handle update {entry_id} "
+                    f"(attempt {deliveries})"
+                )
+
+                continue
+
+        break
+    else:
+        if raw_data is not None:
+            app.logger.error(
+                f"Update {entry_id} was removed from stream, "
+                f"because it can't be handled: {raw_data}"
+            )
+
+    with app.app_context():
+        acknowledge_update(partition, entry_id)
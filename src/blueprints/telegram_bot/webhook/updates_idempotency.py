@@ -0,0 +1,244 @@
+"""
+Protection against repeated handling of same Telegram update.
+
+Telegram sends same update again if webhook responds slowly
+or with error. Also, updates stream can deliver same update
+again if consumer crashes. Every update have unique `update_id`,
+so, before handling update should be claimed using that ID.
+
+States of update:
+- claimed: update is handled right now. Replays should be
+retried later, not dropped, because handler can crash. This
+state expires after `RUNTIME_UPDATE_CLAIM_EXPIRE`, so, if
+worker crashes while handling update, then update can be
+handled again.
+- done: update was handled. Replays will be dropped until
+`RUNTIME_UPDATE_DONE_EXPIRE`.
+- failed: handling of update was failed with unexpected error.
+Update can be claimed again.
+
+Replies that were delivered while handling of failed update
+can be remembered (see `remember_reply()`), so, they will be
+not sent again when update is handled again.
+
+- requires Redis to be enabled. If Redis is disabled,
+then every update always can be claimed.
+"""
+
+import json
+import hashlib
+from typing import Union
+
+from flask import current_app
+
+from src.extensions import redis_client
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "updates_idempotency"
+_UPDATE_KEY = "update"
+_REPLIES_KEY = "replies"
+
+# States
+STATE_CLAIMED = "claimed"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+# Results of claim
+CLAIM_CLAIMED = 1
+CLAIM_DONE = 0
+CLAIM_IN_PROGRESS = -1
+
+# Claims update if it is not claimed or done.
+# KEYS[1] - update key.
+# ARGV[1] - claimed state.
+# ARGV[2] - failed state.
+# ARGV[3] - done state.
+# ARGV[4] - expiration of claimed state in milliseconds.
+# Returns `1` if update was claimed, `0` if update
+# is done, `-1` if update is claimed by someone else.
+_CLAIM_SCRIPT = """
+local state = redis.call("GET", KEYS[1])
+
+if (not state) or (state == ARGV[2]) then
+    redis.call("SET", KEYS[1], ARGV[1], "PX", ARGV[4])
+
+    return 1
+end
+
+if state == ARGV[3] then
+    return 0
+end
+
+return -1
+"""
+
+_claim_script = None
+
+
+class UpdateInProgressError(Exception):
+    """
+    Update is handled right now by someone else.
+    It should be handled again later.
+    """
+    pass
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_update_key(update_id: int) -> str:
+    return _create_key(_NAMESPACE_KEY, _UPDATE_KEY, update_id)
+
+
+def _get_replies_key(update_id: int) -> str:
+    return _create_key(_NAMESPACE_KEY, _REPLIES_KEY, update_id)
+
+
+def _get_reply_digest(method_call: dict) -> str:
+    data = json.dumps(method_call, sort_keys=True)
+
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _get_claim_script():
+    global _claim_script
+
+    if _claim_script is None:
+        _claim_script = redis_client.register_script(_CLAIM_SCRIPT)
+
+    return _claim_script
+
+
+def _set_state(
+    update_id: Union[int, None],
+    state: str,
+    expire: int
+) -> None:
+    if (
+        (update_id is None) or
+        not idempotency_is_enabled()
+    ):
+        return
+
+    redis_client.set(
+        _get_update_key(update_id),
+        state,
+        ex=expire
+    )
+
+
+def idempotency_is_enabled() -> bool:
+    return (
+        current_app.config["RUNTIME_UPDATE_IDEMPOTENCY_ENABLED"] and
+        redis_client.is_enabled
+    )
+
+
+def claim_update(update_id: Union[int, None]) -> int:
+    """
+    Atomically claims update for handling.
+
+    :param update_id:
+    `update_id` of Telegram update. If `None`,
+    then update always will be claimed.
+
+    :returns:
+    `CLAIM_CLAIMED` if update should be handled by caller.
+    `CLAIM_DONE` if update already handled, i.e. it is
+    a replay and should be dropped.
+    `CLAIM_IN_PROGRESS` if update is handled right now by
+    someone else. It shouldn't be dropped, because handler
+    can crash, so, it should be claimed again later.
+    """
+    if (
+        (update_id is None) or
+        not idempotency_is_enabled()
+    ):
+        return CLAIM_CLAIMED
+
+    script = _get_claim_script()
+    expire = current_app.config["RUNTIME_UPDATE_CLAIM_EXPIRE"]
+
+    return int(
+        script(
+            keys=[_get_update_key(update_id)],
+            args=[STATE_CLAIMED, STATE_FAILED, STATE_DONE, expire * 1000]
+        )
+    )
+
+
+def finish_update(update_id: Union[int, None]) -> None:
+    """
+    Marks claimed update as done.
+    """
+    _set_state(
+        update_id,
+        STATE_DONE,
+        current_app.config["RUNTIME_UPDATE_DONE_EXPIRE"]
+    )
+
+
+def fail_update(update_id: Union[int, None]) -> None:
+    """
+    Marks claimed update as failed. It can be claimed again.
+    """
+    _set_state(
+        update_id,
+        STATE_FAILED,
+        current_app.config["RUNTIME_UPDATE_DONE_EXPIRE"]
+    )
+
+
+def remember_reply(
+    update_id: Union[int, None],
+    method_call: dict
+) -> None:
+    """
+    Remembers that reply to update was delivered.
+
+    :param method_call:
+    Telegram method call (`method` key with method
+    name and method parameters).
+    """
+    if (
+        (update_id is None) or
+        not idempotency_is_enabled()
+    ):
+        return
+
+    key = _get_replies_key(update_id)
+    pipeline = redis_client.pipeline()
+
+    pipeline.sadd(key, _get_reply_digest(method_call))
+    pipeline.expire(
+        key,
+        current_app.config["RUNTIME_UPDATE_DONE_EXPIRE"]
+    )
+
+    pipeline.execute(raise_on_error=True)
+
+
+def reply_is_delivered(
+    update_id: Union[int, None],
+    method_call: dict
+) -> bool:
+    """
+    :returns:
+    Same reply to update was already delivered,
+    see `remember_reply()`.
+    """
+    if (
+        (update_id is None) or
+        not idempotency_is_enabled()
+    ):
+        return False
+
+    return bool(
+        redis_client.sismember(
+            _get_replies_key(update_id),
+            _get_reply_digest(method_call)
+        )
+    )
@@ -0,0 +1,451 @@
+"""
+Stream of incoming Telegram updates.
+
+When this stream is enabled, webhook doesn't handle incoming
+updates by itself. Instead, webhook only validates an update,
+appends it to Redis stream and immediately responds to Telegram.
+Updates from that stream are handled by separate consumers
+(see `updates_consumer.py`) using same dispatcher.
+
+Dispatcher expects that updates of same chat are handled one by one
+in order (see `stateful_chat.py`), so, stream is splitted into
+partitions. Chat always goes to same partition. Every partition
+is owned by only one consumer at a time (lease with expiration),
+and that consumer handles updates of partition in order.
+Different partitions are handled in parallel by different
+consumers (threads, processes, machines).
+
+- requires Redis to be enabled. Use `updates_stream_is_enabled()`
+to check if stream is enabled and can be used.
+- when consumer crashes or stops, its lease will expire and
+partition will be owned by another consumer. Updates that
+weren't acknowledged by old owner will be handled again.
+"""
+
+import json
+import zlib
+from time import time
+from typing import List, Tuple, Union
+
+from flask import current_app
+from redis.exceptions import ResponseError
+
+from src.extensions import redis_client
+from src.blueprints.telegram_bot._common import telegram_interface
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "updates_stream"
+_PARTITION_KEY = "partition"
+_STREAM_KEY = "updates"
+_OWNER_KEY = "owner"
+_CONSUMERS_KEY = "consumers"
+_GROUP_NAME = "consumers"
+_UPDATE_FIELD = "update"
+
+# How many pending entries will be claimed at once
+_CLAIM_COUNT = 100
+
+# Prolongs lease if it is still owned by given consumer.
+# KEYS[1] - owner key.
+# ARGV[1] - consumer name.
+# ARGV[2] - lease time in milliseconds.
+# Returns `1` if lease was prolonged, `0` otherwise.
+_RENEW_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+
+return 0
+"""
+
+# Removes lease if it is still owned by given consumer.
+# KEYS[1] - owner key.
+# ARGV[1] - consumer name.
+_RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+
+return 0
+"""
+
+_renew_script = None
+_release_script = None
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_stream_key(partition: int) -> str:
+    return _create_key(
+        _NAMESPACE_KEY,
+        _PARTITION_KEY,
+        partition,
+        _STREAM_KEY
+    )
+
+
+def _get_owner_key(partition: int) -> str:
+    return _create_key(
+        _NAMESPACE_KEY,
+        _PARTITION_KEY,
+        partition,
+        _OWNER_KEY
+    )
+
+
+def _get_consumers_key() -> str:
+    return _create_key(_NAMESPACE_KEY, _CONSUMERS_KEY)
+
+
+def _get_renew_script():
+    global _renew_script
+
+    if _renew_script is None:
+        _renew_script = redis_client.register_script(_RENEW_SCRIPT)
+
+    return _renew_script
+
+
+def _get_release_script():
+    global _release_script
+
+    if _release_script is None:
+        _release_script = redis_client.register_script(_RELEASE_SCRIPT)
+
+    return _release_script
+
+
+def _get_current_time() -> int:
+    """
+    :returns:
+    Current time in milliseconds.
+    """
+    return int(time() * 1000)
+
+
+def _decode_update(fields: dict) -> Union[dict, None]:
+    try:
+        return json.loads(fields[_UPDATE_FIELD])
+    except (KeyError, TypeError, ValueError):
+        current_app.logger.error(
+            f"Invalid update in stream: {fields}"
+        )
+
+        return None
+
+
+def _get_partition_key(update: telegram_interface.Update) -> str:
+    """
+    :returns:
+    Key which determines order of handling of update.
+    Updates with same key will be handled in order.
+    """
+    message = update.get_message()
+    callback_query = update.get_callback_query()
+
+    if callback_query:
+        message = callback_query.get_message()
+
+    if message:
+        return str(message.get_chat().id)
+
+    if callback_query:
+        return str(callback_query.get_user().id)
+
+    return ""
+
+
+def updates_stream_is_enabled() -> bool:
+    return (
+        current_app.config["RUNTIME_UPDATES_STREAM_ENABLED"] and
+        redis_client.is_enabled
+    )
+
+
+def get_partitions_count() -> int:
+    return current_app.config["RUNTIME_UPDATES_STREAM_PARTITIONS"]
+
+
+def get_partition(update: telegram_interface.Update) -> int:
+    """
+    :returns:
+    Partition of the stream that should be used for update.
+    Updates of same chat always have same partition.
+    """
+    key = _get_partition_key(update)
+
+    # built-in `hash()` is randomized between processes
+    return zlib.crc32(key.encode()) % get_partitions_count()
+
+
+def add_update(update: telegram_interface.Update) -> str:
+    """
+    Appends Telegram update to the stream.
+
+    - stream is capped (see `RUNTIME_UPDATES_STREAM_MAX_LENGTH`),
+    so, oldest updates will be removed when stream is full.
+
+    :param update:
+    Valid Telegram update.
+
+    :returns:
+    ID of entry in the stream.
+    """
+    return redis_client.xadd(
+        _get_stream_key(get_partition(update)),
+        {
+            _UPDATE_FIELD: json.dumps(update.raw_data, separators=(",", ":"))
+        },
+        maxlen=current_app.config["RUNTIME_UPDATES_STREAM_MAX_LENGTH"],
+        approximate=True
+    )
+
+
+def create_consumer_group(partition: int) -> None:
+    """
+    Creates group of consumers for partition if it doesn't exists.
+    """
+    try:
+        redis_client.xgroup_create(
+            _get_stream_key(partition),
+            _GROUP_NAME,
+            id="0",
+            mkstream=True
+        )
+    except ResponseError as error:
+        if "BUSYGROUP" not in str(error):
+            raise error
+
+
+def read_updates(
+    partition: int,
+    consumer_name: str,
+    count: int,
+    block: int
+) -> List[Tuple[str, Union[dict, None]]]:
+    """
+    Reads new updates of partition that weren't delivered
+    to any consumer.
+
+    :param partition:
+    Partition that is owned by consumer.
+    :param consumer_name:
+    Unique name of consumer.
+    :param count:
+    Maximum number of updates to read.
+    :param block:
+    How long (in milliseconds) to wait for new updates.
+
+    :returns:
+    List of `(entry ID, raw data of update)` in order of adding.
+    Raw data will be `None` if entry is invalid, but you still
+    should acknowledge such entry.
+    """
+    response = redis_client.xreadgroup(
+        _GROUP_NAME,
+        consumer_name,
+        {
+            _get_stream_key(partition): ">"
+        },
+        count=count,
+        block=block
+    )
+    result = []
+
+    for _, entries in (response or []):
+        for entry_id, fields in entries:
+            result.append(
+                (entry_id, _decode_update(fields))
+            )
+
+    return result
+
+
+def claim_pending_updates(
+    partition: int,
+    consumer_name: str
+) -> List[Tuple[str, Union[dict, None], int]]:
+    """
+    Claims all updates of partition that were delivered
+    to previous owners of partition but weren't acknowledged.
+    Most probably previous owner crashed while handling these
+    updates. These updates should be handled before new ones.
+
+    - call it only after partition lease was acquired.
+
+    :param partition:
+    Partition that is owned by consumer.
+    :param consumer_name:
+    Unique name of consumer that will own claimed updates.
+
+    :returns:
+    List of `(entry ID, raw data of update, number of deliveries)`
+    in order of adding. Number of deliveries tells how many times
+    previous owners tried to handle update. See `read_updates()`
+    documentation for more.
+    """
+    stream_key = _get_stream_key(partition)
+    start = "-"
+    result = []
+
+    while True:
+        pending = redis_client.xpending_range(
+            stream_key,
+            _GROUP_NAME,
+            start,
+            "+",
+            _CLAIM_COUNT
+        )
+
+        if not pending:
+            break
+
+        deliveries = {
+            entry["message_id"]: entry["times_delivered"]
+            for entry in pending
+        }
+        entries = redis_client.xclaim(
+            stream_key,
+            _GROUP_NAME,
+            consumer_name,
+            0,
+            list(deliveries.keys())
+        )
+
+        for entry_id, fields in entries:
+            # entry can be trimmed from stream,
+            # but still be presented in pending list
+            if not fields:
+                acknowledge_update(partition, entry_id)
+                continue
+
+            result.append((
+                entry_id,
+                _decode_update(fields),
+                deliveries[entry_id]
+            ))
+
+        if (len(pending) < _CLAIM_COUNT):
+            break
+
+        # exclusive range is not supported by old
+        # Redis versions, so, increment last ID manually
+        last_time, last_sequence = pending[-1]["message_id"].split("-")
+        start = f"{last_time}-{int(last_sequence) + 1}"
+
+    return result
+
+
+def acknowledge_update(partition: int, entry_id: str) -> None:
+    """
+    Marks update as handled. It will be not delivered again.
+    """
+    stream_key = _get_stream_key(partition)
+    pipeline = redis_client.pipeline()
+
+    pipeline.xack(stream_key, _GROUP_NAME, entry_id)
+    pipeline.xdel(stream_key, entry_id)
+
+    pipeline.execute(raise_on_error=True)
+
+
+def register_consumer(consumer_name: str, lease_time: int) -> int:
+    """
+    Marks consumer as alive and removes consumers which
+    weren't registered again within lease time.
+
+    - should be called periodically (more often than lease time).
+
+    :param consumer_name:
+    Unique name of consumer.
+    :param lease_time:
+    In milliseconds.
+
+    :returns:
+    Number of alive consumers (including given one).
+    """
+    key = _get_consumers_key()
+    now = _get_current_time()
+    pipeline = redis_client.pipeline()
+
+    pipeline.zadd(key, {consumer_name: now})
+    pipeline.zremrangebyscore(key, "-inf", now - lease_time)
+    pipeline.zcard(key)
+    pipeline.pexpire(key, lease_time)
+
+    result = pipeline.execute(raise_on_error=True)
+
+    return result[2]
+
+
+def unregister_consumer(consumer_name: str) -> None:
+    redis_client.zrem(_get_consumers_key(), consumer_name)
+
+
+def acquire_partition(
+    partition: int,
+    consumer_name: str,
+    lease_time: int
+) -> bool:
+    """
+    Tries to own partition.
+
+    :param partition:
+    Partition to own.
+    :param consumer_name:
+    Unique name of consumer.
+    :param lease_time:
+    In milliseconds. Lease should be renewed before
+    this time is up, otherwise partition will be free.
+
+    :returns:
+    `True` if partition is owned by consumer now,
+    `False` if it is owned by another consumer.
+    """
+    return bool(
+        redis_client.set(
+            _get_owner_key(partition),
+            consumer_name,
+            px=lease_time,
+            nx=True
+        )
+    )
+
+
+def renew_partition(
+    partition: int,
+    consumer_name: str,
+    lease_time: int
+) -> bool:
+    """
+    Prolongs lease of partition.
+
+    :returns:
+    `True` if partition is still owned by consumer,
+    `False` if lease was lost.
+    """
+    script = _get_renew_script()
+
+    return bool(
+        script(
+            keys=[_get_owner_key(partition)],
+            args=[consumer_name, lease_time]
+        )
+    )
+
+
+def release_partition(partition: int, consumer_name: str) -> None:
+    """
+    Removes lease of partition, so, another consumer
+    can own it immediately.
+    """
+    script = _get_release_script()
+
+    script(
+        keys=[_get_owner_key(partition)],
+        args=[consumer_name]
+    )
@@ -10,6 +10,23 @@ from src.blueprints.telegram_bot import telegram_bot_blueprint as bp
 from src.blueprints.telegram_bot._common import telegram_interface
 from .dispatcher import intellectual_dispatch
 from .app_context import init_app_context
+from .updates_stream import (
+    updates_stream_is_enabled,
+    add_update
+)
+from .updates_idempotency import (
+    CLAIM_DONE,
+    CLAIM_IN_PROGRESS,
+    UpdateInProgressError,
+    claim_update,
+    finish_update,
+    fail_update
+)
+from .webhook_response import (
+    init_webhook_response,
+    take_webhook_response,
+    flush_webhook_response
+)
 
 
 # `os.getenv` should be used instead of `current_app.config`,
@@ -29,6 +46,9 @@ def webhook():
     - for Webhook we always should return 200 to indicate
     that we successfully got an update, otherwise Telegram
     will flood the server. So, not use `abort()` or anything.
+    The only exception is update that is handled right now by
+    someone else: it should be sent again, because that handling
+    can crash.
     """
     raw_data = request.get_json(
         force=True,
@@ -43,24 +63,104 @@ def webhook():
 
     update = telegram_interface.Update(raw_data)
 
-    init_app_context(update)
+    if updates_stream_is_enabled():
+        # Update will be handled by consumer of stream.
+        # Here we only check that it looks like valid update
+        if not update.is_valid():
+            return make_error_response()
+
+        add_update(update)
+
+        return make_success_response()
+
+    # short replies of handler can be
+    # carried by response of this request
+    init_webhook_response(update.get("update_id"))
 
-    handler = intellectual_dispatch(update)
+    try:
+        handled = handle_update(update)
+    except UpdateInProgressError:
+        # Telegram will send this update again later,
+        # so, it will be not lost if current handler crashes
+        return make_retry_response()
 
-    if not handler:
+    if not handled:
         return make_error_response()
 
-    # We call this handler and do not handle any errors.
-    # We assume that all errors already was handeld by
-    # handlers, loggers, etc.
-    # WARNING: in case of any exceptions there will be
-    # 500 from a server. Telegram will send user message
-    # again and again until it get 200 from a server.
-    # So, it is important to always return 200 or return
-    # 500 and expect same message again
-    handler()
+    return make_success_response(
+        take_webhook_response()
+    )
 
-    return make_success_response()
+
+def handle_update(update: telegram_interface.Update) -> bool:
+    """
+    Handles single Telegram update: initializes app context,
+    dispatches update and calls handler.
+
+    - `g` should be clean, i.e. app context shouldn't
+    be used for another update before.
+    - replays of same update (Telegram resends update if
+    response was slow or failed) will be dropped before
+    any work. See `updates_idempotency.py` for more.
+
+    :returns:
+    `True` if handler was found and called (or update is
+    a replay), `False` otherwise.
+
+    :raises:
+    `UpdateInProgressError` if same update is handled right
+    now by someone else. Update should be handled again later.
+    """
+    update_id = update.get("update_id")
+    claim = claim_update(update_id)
+
+    if claim == CLAIM_DONE:
+        current_app.logger.info(
+            f"Update {update_id} was dropped as a replay"
+        )
+
+        return True
+    elif claim == CLAIM_IN_PROGRESS:
+        current_app.logger.info(
+            f"Update {update_id} is handled right now, "
+            "it will be handled again later"
+        )
+
+        raise UpdateInProgressError()
+
+    try:
+        init_app_context(update)
+
+        handler = intellectual_dispatch(update)
+
+        # We call this handler and do not handle any errors.
+        # We assume that all errors already was handeld by
+        # handlers, loggers, etc.
+        # WARNING: in case of any exceptions there will be
+        # 500 from a server. Telegram will send user message
+        # again and again until it get 200 from a server.
+        # So, it is important to always return 200 or return
+        # 500 and expect same message again
+        if handler:
+            handler()
+    except Exception as error:
+        # update should be handled again
+        fail_update(update_id)
+
+        # there will be 500 from a server, so, reply
+        # that was put in response will be not sent
+        try:
+            flush_webhook_response()
+        except Exception:
+            current_app.logger.exception(
+                "Unable to send webhook response"
+            )
+
+        raise error
+
+    finish_update(update_id)
+
+    return bool(handler)
 
 
 def make_error_response():
@@ -76,10 +176,35 @@ def make_error_response():
     ))
 
 
-def make_success_response():
+def make_retry_response():
+    """
+    Creates response that asks Telegram
+    to send same update again later.
+    """
+    return make_response((
+        {
+            "ok": False,
+            "error_code": 429
+        },
+        429
+    ))
+
+
+def make_success_response(method_call: dict = None):
     """
     Creates success response for Telegram Webhook.
+
+    :param method_call:
+    Telegram method call that will be performed by Telegram
+    (`method` key with method name and method parameters).
+    See `webhook_response.py` for more.
     """
+    if method_call:
+        return make_response((
+            method_call,
+            200
+        ))
+
     return make_response((
         {
             "ok": True
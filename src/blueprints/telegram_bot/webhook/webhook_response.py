@@ -0,0 +1,164 @@
+"""
+Telegram method call in webhook response.
+
+Telegram allows to perform one method call by returning
+it as response to webhook request (see "Making requests
+when getting updates" in https://core.telegram.org/bots/api).
+Most of short interactions (`/help`, `/about`, abort of command,
+etc.) consist of exactly one `sendMessage` call, so, instead of
+separate outbound request that call is returned in webhook response.
+
+- only one call can be carried by response. Next calls
+will be made as usual requests.
+- call in response is made by Telegram after all other calls
+of handler. So, if handler makes usual request after call
+was put in response, then that call is made as usual request
+first, otherwise messages will be reordered.
+- result of call is not available (Telegram doesn't tell it),
+so, use it only when result is not needed.
+- available only while webhook request is handled. In background
+tasks, in consumer of updates stream, etc. usual request is made.
+"""
+
+from typing import Union
+
+from flask import g, current_app, has_request_context
+
+from src.http import telegram
+from src.http.telegram import rate_limiter
+from src.http.telegram.requests import (
+    make_request,
+    register_before_request
+)
+from .updates_idempotency import (
+    remember_reply,
+    reply_is_delivered
+)
+
+
+def webhook_response_is_available() -> bool:
+    """
+    :returns:
+    Method call can be put in webhook response.
+    """
+    return (
+        current_app.config["TELEGRAM_API_WEBHOOK_RESPONSE_ENABLED"] and
+        has_request_context() and
+        g.get("webhook_response_available", False) and
+        (g.get("webhook_response") is None)
+    )
+
+
+def init_webhook_response(update_id: Union[int, None] = None) -> None:
+    """
+    Allows to put method call in response to current webhook request.
+
+    - should be called only by webhook view.
+
+    :param update_id:
+    `update_id` of Telegram update that is handled.
+    """
+    g.webhook_response_available = True
+    g.webhook_response = None
+    g.webhook_response_update_id = update_id
+
+
+def send_message(**kwargs) -> None:
+    """
+    https://core.telegram.org/bots/api/#sendmessage
+
+    - if possible, then message will be sent in
+    webhook response, otherwise usual request is made.
+    - result of sending is not returned.
+    - message that was already delivered while previous
+    (failed) handling of same update will be not sent again.
+    """
+    if not webhook_response_is_available():
+        telegram.send_message(**kwargs)
+
+        return
+
+    data = {
+        "method": "sendMessage",
+        **kwargs
+    }
+
+    if reply_is_delivered(g.webhook_response_update_id, data):
+        current_app.logger.debug(
+            "Reply was already delivered, it will be not sent again"
+        )
+
+        return
+
+    g.webhook_response = data
+
+
+def take_webhook_response() -> Union[dict, None]:
+    """
+    Takes method call that should be returned in webhook response.
+
+    - call is rate limited same way as usual request.
+
+    :returns:
+    JSON data of webhook response.
+    `None` if there is no method call.
+    """
+    if not has_request_context():
+        return None
+
+    data = g.get("webhook_response")
+    g.webhook_response = None
+
+    if data is not None:
+        rate_limiter.acquire(
+            data["method"],
+            data.get("chat_id")
+        )
+
+    return data
+
+
+def flush_webhook_response() -> None:
+    """
+    Makes method call from webhook response as usual request.
+
+    - use it when webhook response will be not successful
+    (for example, 500 because of an error), so, Telegram
+    will not perform that call.
+    - call is remembered as delivered, so, it will be not
+    sent again when Telegram repeats the update.
+    """
+    if not has_request_context():
+        return
+
+    g.webhook_response_available = False
+
+    make_delayed_call()
+
+
+def make_delayed_call() -> None:
+    """
+    Makes method call from webhook response as usual request,
+    but new call still can be put in webhook response.
+
+    - it is called before every usual request, so, call from
+    webhook response will be made before next calls of handler.
+    """
+    if not has_request_context():
+        return
+
+    data = g.get("webhook_response")
+    g.webhook_response = None
+
+    if data is None:
+        return
+
+    method_call = dict(data)
+    method_name = method_call.pop("method")
+
+    make_request(method_name, method_call)
+
+    remember_reply(g.get("webhook_response_update_id"), data)
+
+
+register_before_request(make_delayed_call)
@@ -4,9 +4,11 @@ Configurations of the Flask app for specific environments.
 
 import os
 import logging
+import multiprocessing
 from enum import Enum, auto
 
 from dotenv import load_dotenv
+from sqlalchemy.pool import NullPool
 
 
 def load_env():
@@ -50,6 +52,105 @@ class YandexOAuthAPIMethod(Enum):
     CONSOLE_CLIENT = auto()
 
 
+class SQLAlchemyPoolMode(Enum):
+    """
+    How connections to database should be pooled.
+    """
+    # Every request and every background task will open
+    # new connection and close it after usage.
+    # Safe, but slow (connection and authentication
+    # every time). Also can be used with external pooler
+    # in "session" mode
+    DISABLED = auto()
+
+    # Every process (gunicorn worker, RQ worker) will keep
+    # opened connections for reuse. Size of pool is derived
+    # from maximum number of connections for the app and
+    # number of processes, so, total number of connections
+    # will not exceed that maximum. Greenlets will wait for
+    # free connection when all connections are busy
+    INTERNAL = auto()
+
+    # Connections are pooled by external pooler (for example,
+    # PgBouncer in "transaction" mode) which is placed between
+    # the app and database. The app will open connection to
+    # pooler for every request, it is cheap. Session-level
+    # features (prepared statements, `SET`, advisory locks, etc.)
+    # shouldn't be used in that mode
+    EXTERNAL = auto()
+
+
+def create_sqlalchemy_engine_options(
+    pool_mode: SQLAlchemyPoolMode,
+    database_url: str
+) -> dict:
+    """
+    :returns:
+    Options for `sqlalchemy.create_engine()`.
+    """
+    is_sqlite = database_url.startswith("sqlite")
+
+    if (
+        (pool_mode != SQLAlchemyPoolMode.INTERNAL) or
+        is_sqlite
+    ):
+        return {
+            "poolclass": NullPool
+        }
+
+    # maximum number of connections that can be
+    # opened by all processes of the app
+    max_connections = int(
+        # empty value (for example, from `.env`) means default
+        os.getenv("SQLALCHEMY_MAX_CONNECTIONS") or
+        20
+    )
+    # number of processes of the app that
+    # are connected to database
+    processes = int(
+        os.getenv("SQLALCHEMY_POOL_PROCESSES") or
+        -1
+    )
+    # number of greenlets in every process
+    worker_connections = int(
+        os.getenv("GUNICORN_WORKER_CONNECTIONS") or
+        1024
+    )
+
+    # same as in gunicorn config
+    if (processes == -1):
+        processes = int(
+                os.getenv("GUNICORN_WORKERS") or
+            -1
+        )
+
+    if (processes == -1):
+        processes = (multiprocessing.cpu_count() * 2 + 1)
+
+    connections_per_process = max(
+        1,
+        min(
+            max_connections // max(processes, 1),
+            worker_connections
+        )
+    )
+    # half of connections will be kept opened,
+    # another half will be opened only on peak load
+    pool_size = max(1, connections_per_process // 2)
+    max_overflow = connections_per_process - pool_size
+
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        # how long greenlet will wait for free connection
+        "pool_timeout": 10,
+        # database can close idle connection,
+        # so, check connection before usage
+        "pool_pre_ping": True,
+        "pool_recycle": 60 * 30
+    }
+
+
 class Config:
     """
     Notes:
@@ -140,14 +241,27 @@ class Config:
     # Also depends on `REDIS_URL`
     RUNTIME_RQ_ENABLED = True
 
+    # In-process executor of background tasks. It is used
+    # instead of RQ if RQ is disabled, so, long tasks
+    # (uploading, etc.) don't block handling of request.
+    # Every server worker has its own executor.
+    # Maximum number of tasks that are executed
+    # at the same time in one server worker.
+    # `0` disables executor, i.e. tasks are executed
+    # in request that created them
+    RUNTIME_LOCAL_EXECUTOR_CONCURRENCY = 4
+
+    # Maximum number of tasks that wait for execution
+    # in one server worker. If it is exceeded, then
+    # task is executed in request that created it
+    RUNTIME_LOCAL_EXECUTOR_QUEUE_SIZE = 20
+
     # Maximum runtime of uploading process in `/upload`
     # before it’s interrupted. In seconds.
-    # This value shouldn't be less than
-    # `YANDEX_DISK_API_CHECK_OPERATION_STATUS_MAX_ATTEMPTS` *
-    # `YANDEX_DISK_API_CHECK_OPERATION_STATUS_INTERVAL`.
-    # This timeout should be used only for force quit if
-    # uploading function start behave incorrectly.
-    # Use `MAX_ATTEMPTS` and `INTERVAL` for expected quit.
+    # Checks of operation status should fit into this time, so,
+    # this value also determines how long operation status
+    # will be checked (see
+    # `YANDEX_DISK_API_CHECK_OPERATION_STATUS_RESERVE`).
     # Applied only if task queue (RQ, for example) is enabled
     RUNTIME_UPLOAD_WORKER_JOB_TIMEOUT = 30
 
@@ -187,6 +301,44 @@ class Config:
     # This value is for `/space_info` worker.
     RUNTIME_SPACE_INFO_WORKER_TIMEOUT = 5
 
+    # Maximum time of extraction of direct URL from URL
+    # to resource (YouTube video, for example) with
+    # `youtube_dl`. In seconds. Extraction is interrupted
+    # after that and URL is uploaded as direct URL.
+    # This time is added to `RUNTIME_UPLOAD_WORKER_JOB_TIMEOUT`
+    # for uploading of such URL
+    RUNTIME_YOUTUBE_DL_EXTRACT_TIMEOUT = 15
+
+    # Number of processes that extract direct URL
+    # with `youtube_dl`. Every server worker (and RQ
+    # worker) has its own processes. They are
+    # started on demand
+    RUNTIME_YOUTUBE_DL_PROCESSES = 2
+
+    # Results of `youtube_dl` extraction are cached by
+    # normalized URL, so, same URL will be not extracted
+    # again. How long result will be cached. In seconds.
+    # Direct URL's are often signed, so, if expiry of
+    # direct URL is known, then result will be cached only
+    # while direct URL is valid. YouTube signs URL's for
+    # ~6 hours, so, this value should be less than that.
+    # Set to 0 to disable caching.
+    # Applied only if Redis is enabled
+    RUNTIME_YOUTUBE_DL_CACHE_EXPIRE = 60 * 60
+
+    # How long URL's that are not supported by `youtube_dl`
+    # (plain pages, direct URL's to files, etc.) are cached.
+    # In seconds. Set to 0 to disable.
+    # Applied only if Redis is enabled
+    RUNTIME_YOUTUBE_DL_CACHE_UNSUPPORTED_EXPIRE = 60 * 60 * 24
+
+    # How long URL's are cached after failed extraction that
+    # can be temporary (network error, rate limit, geo block,
+    # etc.). Extraction of such URL's will be not tried again,
+    # they will be treated as direct URL's. In seconds.
+    # Set to 0 to disable. Applied only if Redis is enabled
+    RUNTIME_YOUTUBE_DL_CACHE_FAILED_EXPIRE = 60 * 5
+
     # After what time `/settings` handler should forget
     # about user last action.
     # For example, user called `/settings` command, then
@@ -201,6 +353,150 @@ class Config:
     # Applied only if Redis is enabled
     RUNTIME_SETTINGS_LAST_ACTION_EXPIRE = 60 * 60 * 24 * 1
 
+    # Telegram sends same update again if webhook responds
+    # slowly or with error. If `True`, then every update will be
+    # claimed by `update_id` before handling, and replays will
+    # be dropped before any DB or Yandex.Disk work.
+    # Applied only if Redis is enabled
+    RUNTIME_UPDATE_IDEMPOTENCY_ENABLED = True
+
+    # How long update can be handled. If update is not handled
+    # within this time (for example, worker crashed), then
+    # update can be handled again. Until then replays of update
+    # will be retried, not dropped. Should be greater than
+    # maximum time of handling of one update (long work is done
+    # by background tasks). Must be less than
+    # `RUNTIME_UPDATES_STREAM_LEASE_TIME`, otherwise new owner of
+    # partition can't handle update of crashed owner. In seconds
+    RUNTIME_UPDATE_CLAIM_EXPIRE = 20
+
+    # How long handled update will be remembered in order
+    # to drop its replays. In seconds
+    RUNTIME_UPDATE_DONE_EXPIRE = 60 * 60 * 24
+
+    # If `True`, then webhook will not handle incoming updates.
+    # Instead, webhook will put updates in Redis stream and
+    # immediately respond to Telegram. Updates from that stream
+    # should be handled by separate consumers, so, don't forget
+    # to run them (`python manage.py run-updates-consumer`).
+    # Applied only if Redis is enabled
+    RUNTIME_UPDATES_STREAM_ENABLED = False
+
+    # Maximum number of updates in every partition of the stream.
+    # When partition is full, oldest updates will be removed.
+    # This value is approximate, actual number can be little bigger
+    RUNTIME_UPDATES_STREAM_MAX_LENGTH = 10000
+
+    # Stream is splitted into partitions. Updates of same chat
+    # always go to same partition and will be handled in order.
+    # Different partitions are handled in parallel, so, this
+    # value is maximum number of updates that can be handled
+    # at the same time by all consumers.
+    # WARNING: don't change this value while stream contains
+    # unhandled updates, otherwise order of updates of same
+    # chat can be broken
+    RUNTIME_UPDATES_STREAM_PARTITIONS = 16
+
+    # Partition is owned by only one consumer. Owner should
+    # prolong ownership within this time, otherwise partition
+    # will be owned by another consumer. So, this is how long
+    # partition will be not handled when consumer crashes.
+    # Also, when consumers join or leave, partitions will be
+    # rebalanced within this time. In seconds
+    RUNTIME_UPDATES_STREAM_LEASE_TIME = 30
+
+    # How long consumer will wait for new updates of partition
+    # before next check of partition ownership. In seconds.
+    # Should be less than `RUNTIME_UPDATES_STREAM_LEASE_TIME`
+    RUNTIME_UPDATES_STREAM_BLOCK = 2
+
+    # How many times consumers will try to handle update.
+    # If update can't be handled after all attempts,
+    # then it will be removed from the stream
+    RUNTIME_UPDATES_STREAM_MAX_DELIVERIES = 3
+
+    # Telegram files (`file_path` for downloading) are cached
+    # by `file_unique_id`, so, same file will be not requested
+    # again. How long file will be cached. In seconds.
+    # Telegram guarantees that `file_path` is valid for at least
+    # 1 hour, so, this value should be less than 1 hour.
+    # Set to 0 to disable caching.
+    # Applied only if Redis is enabled
+    RUNTIME_TELEGRAM_FILE_CACHE_EXPIRE = 60 * 50
+
+    # Intermediate statuses of uploading (for example,
+    # "in progress") are edited in status message at most
+    # once in this interval. Final status is always sent.
+    # In seconds. Set to 0 to disable debouncing
+    RUNTIME_STATUS_UPDATE_INTERVAL = 5
+
+    # Recent uploads are remembered (source of upload -> uploaded
+    # element), so, if same file or URL is sent again, then
+    # already uploaded element will be shown instead of
+    # uploading again. How long upload will be remembered.
+    # In seconds. Set to 0 to disable.
+    # Applied only if Redis is enabled
+    RUNTIME_UPLOAD_INDEX_EXPIRE = 60 * 60 * 24 * 30
+
+    # Messages of media group (album) are buffered and uploaded
+    # as one batch with single status message. Batch is uploaded
+    # when no new messages of media group were received during
+    # this window. In seconds. Set to 0 to disable buffering.
+    # Applied only if Redis and RQ are enabled
+    RUNTIME_MEDIA_GROUP_WINDOW = 1.5
+
+    # Maximum time of waiting for the rest of media group.
+    # In seconds
+    RUNTIME_MEDIA_GROUP_MAX_WAIT = 10
+
+    # If `True`, then upload job will only start uploading
+    # on Yandex.Disk and pass operation to operation tracker.
+    # Tracker will check status of operation and enqueue
+    # follow-up jobs, so, RQ workers will be not blocked while
+    # Yandex.Disk downloads a file. Don't forget to run tracker
+    # (`python manage.py run-operation-tracker`).
+    # Applied only if Redis and RQ are enabled
+    RUNTIME_OPERATION_TRACKER_ENABLED = False
+
+    # Maximum number of operations that tracker takes at once
+    RUNTIME_OPERATION_TRACKER_BATCH_SIZE = 100
+
+    # How many operations tracker checks at the same time
+    RUNTIME_OPERATION_TRACKER_CONCURRENCY = 10
+
+    # How long (in seconds after start of operation) tracker
+    # checks status of operation. If operation is not completed
+    # within this time, then it is treated as failed. Tracker
+    # doesn't hold RQ workers, so, unlike upload job, operation
+    # is not limited by `RUNTIME_UPLOAD_WORKER_JOB_TIMEOUT`
+    RUNTIME_OPERATION_TRACKER_MAX_DURATION = 60 * 5
+
+    # endregion
+
+    # region HTTP
+
+    # Outgoing HTTP requests (Telegram, Yandex, etc.) reuse
+    # keep-alive connections. Every process (gunicorn worker,
+    # RQ worker, etc.) creates one connection pool for every
+    # upstream host. This value tells how many connections
+    # to single host can be kept opened for reuse.
+    # Use env variable to set different values for
+    # different processes (gunicorn and RQ, for example)
+    HTTP_POOL_MAXSIZE = int(
+        os.getenv("HTTP_POOL_MAXSIZE") or
+        10
+    )
+
+    # If `True`, then request will wait for free connection
+    # when all `HTTP_POOL_MAXSIZE` connections are busy.
+    # If `False`, then new connection will be opened and
+    # closed after request (it will not be saved in a pool).
+    # Use `1`, `true` or `yes` to enable it
+    HTTP_POOL_BLOCK = (
+        os.getenv("HTTP_POOL_BLOCK", "").strip().lower() in
+        ("1", "true", "yes")
+    )
+
     # endregion
 
     # region Flask
@@ -220,6 +516,25 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = os.getenv("SQLALCHEMY_ECHO")
 
+    # See `SQLAlchemyPoolMode` for more.
+    # Use name of mode as env variable value.
+    # For `INTERNAL` mode see also `SQLALCHEMY_MAX_CONNECTIONS`
+    # and `SQLALCHEMY_POOL_PROCESSES` env variables.
+    # For `EXTERNAL` mode `DATABASE_URL` should point to pooler
+    SQLALCHEMY_POOL_MODE = SQLAlchemyPoolMode[(
+        os.getenv("SQLALCHEMY_POOL_MODE") or
+        "DISABLED"
+    ).upper()]
+    SQLALCHEMY_ENGINE_OPTIONS = create_sqlalchemy_engine_options(
+        SQLALCHEMY_POOL_MODE,
+        SQLALCHEMY_DATABASE_URI
+    )
+
+    # If `True` and app is running with gevent (monkey patching
+    # was applied), then psycopg2 will not block other greenlets
+    # while waiting for database response
+    SQLALCHEMY_COOPERATIVE_DRIVER = True
+
     # endregion
 
     # region Babel
@@ -256,6 +571,12 @@ class Config:
     # after a given number of seconds
     TELEGRAM_API_TIMEOUT = 5
 
+    # Short replies (`/help`, abort of command, etc.) will be
+    # sent in response to webhook request instead of separate
+    # request to Telegram. Applied only for webhook requests
+    # that are handled immediately (not by updates consumer)
+    TELEGRAM_API_WEBHOOK_RESPONSE_ENABLED = True
+
     # maximum file size in bytes that bot
     # can handle by itself.
     # It is Telegram limit, not bot.
@@ -266,6 +587,32 @@ class Config:
     # to create exactly 20M file
     TELEGRAM_API_MAX_FILE_SIZE = 20 * 1024 * 1024
 
+    # Telegram limits how fast bot can send messages.
+    # All processes (gunicorn and RQ workers) will share
+    # these limits and delay requests to not exceed them.
+    # Applied only if Redis is enabled.
+    # See https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this # noqa
+    TELEGRAM_API_RATE_LIMITER_ENABLED = True
+
+    # Maximum number of messages per second for all chats
+    TELEGRAM_API_GLOBAL_RATE_LIMIT = 30
+
+    # Maximum number of messages per second for single chat
+    TELEGRAM_API_CHAT_RATE_LIMIT = 1
+
+    # Maximum number of messages per minute for single group
+    TELEGRAM_API_GROUP_RATE_LIMIT = 20
+
+    # Maximum time in seconds that single request can be
+    # delayed by rate limiter or by `retry_after` from
+    # Telegram error response. Keep in mind that request
+    # can block webhook response, so, don't use big values
+    TELEGRAM_API_RATE_LIMITER_MAX_WAIT = 10
+
+    # How many times request will be repeated when
+    # Telegram responds with `retry_after`
+    TELEGRAM_API_MAX_RETRIES = 1
+
     # endregion
 
     # region Yandex OAuth API
@@ -295,16 +642,59 @@ class Config:
     # after a given number of seconds
     YANDEX_DISK_API_TIMEOUT = 5
 
-    # maximum number of checks of operation status
-    # (for example, if file is downloaded by Yandex.Disk).
-    # It is blocks request until check ending!
-    YANDEX_DISK_API_CHECK_OPERATION_STATUS_MAX_ATTEMPTS = 5
-
-    # interval in seconds between checks of operation status.
-    # It is blocks request until check ending!
-    # For example, if max. attempts is 5 and interval is 2,
-    # then request will be blocked maximum for (5 * 2) seconds.
-    YANDEX_DISK_API_CHECK_OPERATION_STATUS_INTERVAL = 2
+    # independent requests to Yandex (for example, uploading
+    # of media group items) are performed concurrently.
+    # Stop waiting for all of them after a given number of seconds
+    YANDEX_DISK_API_CONCURRENT_TIMEOUT = 10
+
+    # How many files of media group can be
+    # uploaded to Yandex.Disk at the same time
+    YANDEX_DISK_API_MEDIA_GROUP_CONCURRENCY = 3
+
+    # Status of operation (for example, if file is downloaded
+    # by Yandex.Disk) is checked until operation is completed.
+    # It is blocks request until check ending (if operation
+    # tracker is disabled, see `RUNTIME_OPERATION_TRACKER_ENABLED`)!
+    # First check is made when file is expected to be downloaded
+    # (according to file size and recent Yandex.Disk throughput),
+    # next checks are made with exponential backoff.
+    # All checks should fit into `RUNTIME_UPLOAD_WORKER_JOB_TIMEOUT`
+    # minus this reserve (time for other actions of uploading,
+    # for example, publishing). In seconds
+    YANDEX_DISK_API_CHECK_OPERATION_STATUS_RESERVE = 10
+
+    # minimum interval in seconds between checks of operation status
+    YANDEX_DISK_API_CHECK_OPERATION_STATUS_MIN_INTERVAL = 0.5
+
+    # maximum interval in seconds between checks of operation status
+    YANDEX_DISK_API_CHECK_OPERATION_STATUS_MAX_INTERVAL = 8
+
+    # interval between checks of operation status
+    # will be multiplied by this value after every check
+    YANDEX_DISK_API_CHECK_OPERATION_STATUS_BACKOFF = 2
+
+    # expected throughput (bytes per second) of Yandex.Disk
+    # downloads when there is no recently observed throughput
+    YANDEX_DISK_API_DEFAULT_THROUGHPUT = 2 * 1024 * 1024
+
+    # throughput of files smaller than this (in bytes) is not
+    # recorded, because their downloading time is mostly
+    # latency of Yandex.Disk API and interval between checks
+    YANDEX_DISK_API_THROUGHPUT_MIN_FILE_SIZE = 1024 * 1024
+
+    # Folders that were confirmed to exist are remembered for
+    # every user, so, they will be not created again before every
+    # upload. How long they will be remembered. In seconds.
+    # Set to 0 to disable remembering.
+    # Applied only if Redis is enabled
+    YANDEX_DISK_API_KNOWN_FOLDERS_EXPIRE = 60 * 60 * 24
+
+    # If `True`, then upload folder will be not created before
+    # uploading. It will be created only when Yandex.Disk responds
+    # that folder doesn't exists, and then uploading will be repeated.
+    # It saves requests when folder exists (most of the time), but
+    # costs one extra request when folder doesn't exists
+    YANDEX_DISK_API_OPTIMISTIC_UPLOAD = False
 
     # endregion
 
@@ -1,5 +1,6 @@
 from typing import List, Union, NewType
 
+from sqlalchemy.orm import joinedload
 from sqlalchemy.sql.expression import func
 
 from src.database import User, YandexDiskToken
@@ -36,6 +37,23 @@ def get_user_by_telegram_id(telegram_id: int) -> UserOrNone:
     return User.query.filter(User.telegram_id == telegram_id).first()
 
 
+def get_user_with_relationships(telegram_id: int) -> UserOrNone:
+    """
+    Returns user with specified telegram id.
+
+    - all relationships (settings, Yandex.Disk token, chats)
+    are loaded in same query, so, accessing them will not
+    cause additional queries.
+    """
+    return User.query.options(
+        joinedload(User.settings),
+        joinedload(User.yandex_disk_token),
+        joinedload(User.chats)
+    ).filter(
+        User.telegram_id == telegram_id
+    ).first()
+
+
 def exists(telegram_id: int) -> bool:
     """
     Checks if user exists in DB.
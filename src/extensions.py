@@ -7,6 +7,7 @@ These extensions extracted in separate module in order
 to avoid circular imports.
 """
 
+import os
 from typing import (
     Union
 )
@@ -15,21 +16,87 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_babel import Babel
-from sqlalchemy.pool import NullPool
+from sqlalchemy import event, exc
+from sqlalchemy.pool import Pool
 import redis
 from rq import Queue as RQ
 
 
 # Database
 
-db = SQLAlchemy(
-    engine_options={
-        # pooling will be disabled until that
-        # https://stackoverflow.com/questions/61197228/flask-gunicorn-gevent-sqlalchemy-postgresql-too-many-connections
-        # will be resolved
-        "poolclass": NullPool
-    }
-)
+# Pooling is configured by `SQLALCHEMY_ENGINE_OPTIONS`.
+# See `SQLALCHEMY_POOL_MODE` in app config
+db = SQLAlchemy()
+
+
+@event.listens_for(Pool, "connect")
+def _on_pool_connect(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+
+@event.listens_for(Pool, "checkout")
+def _on_pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    """
+    Connections can't be shared between processes. RQ worker
+    forks itself for every job, so, forked process shouldn't
+    use connections that were opened by parent process.
+
+    - https://docs.sqlalchemy.org/en/13/core/pooling.html#using-connection-pools-with-multiprocessing # noqa
+    """
+    pid = os.getpid()
+
+    if (connection_record.info["pid"] != pid):
+        connection_record.connection = None
+        connection_proxy.connection = None
+
+        raise exc.DisconnectionError(
+            "Connection record belongs to "
+            f"{connection_record.info['pid']} pid, "
+            f"attempting to check out in {pid} pid"
+        )
+
+
+def make_psycopg2_cooperative() -> bool:
+    """
+    Makes psycopg2 cooperative with gevent, i.e. other
+    greenlets will run while psycopg2 waits for database.
+    Without this psycopg2 blocks entire process, because
+    it uses C library for networking, not Python sockets.
+
+    - should be called only once.
+    - does nothing if gevent monkey patching wasn't applied.
+
+    :returns:
+    `True` if psycopg2 is cooperative now, `False` otherwise.
+    """
+    try:
+        from gevent import monkey
+        from gevent.socket import wait_read, wait_write
+        from psycopg2 import extensions, OperationalError
+    except ImportError:
+        return False
+
+    if not monkey.is_module_patched("socket"):
+        return False
+
+    def wait_callback(connection, timeout=None):
+        while True:
+            state = connection.poll()
+
+            if (state == extensions.POLL_OK):
+                break
+            elif (state == extensions.POLL_READ):
+                wait_read(connection.fileno(), timeout=timeout)
+            elif (state == extensions.POLL_WRITE):
+                wait_write(connection.fileno(), timeout=timeout)
+            else:
+                raise OperationalError(
+                    f"Bad result from poll: {state}"
+                )
+
+    extensions.set_wait_callback(wait_callback)
+
+    return True
 
 
 # Migration
@@ -91,8 +158,14 @@ redis_client: Union[redis.Redis, FlaskRedis] = FlaskRedis()
 # Redis Queue
 
 class RedisQueue:
+    """
+    - `enqueue()` and other methods of `rq.Queue`
+    are applied to "default" queue.
+    - use `get_queue()` to get specific named queue.
+    """
     def __init__(self):
         self._queue = None
+        self._queues = {}
 
     def __getattr__(self, name):
         return getattr(self._queue, name)
@@ -125,6 +198,25 @@ class RedisQueue:
             connection=redis_connection,
             name="default"
         )
+        self._queues = {
+            self._queue.name: self._queue
+        }
+
+    def get_queue(self, name: str) -> RQ:
+        """
+        :param name:
+        Name of queue. See `TaskQueueName` in `src/rq`.
+
+        :returns:
+        Queue with that name.
+        """
+        if name not in self._queues:
+            self._queues[name] = RQ(
+                connection=self._queue.connection,
+                name=name
+            )
+
+        return self._queues[name]
 
 
 task_queue: Union[RQ, RedisQueue] = RedisQueue()
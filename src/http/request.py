@@ -1,6 +1,11 @@
+import os
 import typing
+from threading import Lock
+from urllib.parse import urlparse
+from http.cookiejar import DefaultCookiePolicy
 
 import requests
+from requests.adapters import HTTPAdapter
 from flask import current_app
 
 
@@ -23,6 +28,77 @@ class RequestResult(typing.TypedDict):
     content: typing.Any
 
 
+# Sessions that were created by current process.
+# Key is an upstream (`scheme://host:port`), value is a session
+# with connection pool for that upstream
+_sessions: typing.Dict[str, requests.Session] = {}
+# PID of process that owns `_sessions`. Connections can't be
+# shared between parent and forked child (RQ worker forks
+# a child for every job), so, child will create its own sessions
+_sessions_pid: typing.Union[int, None] = None
+# `threading.Lock` will be patched by `gevent`, so,
+# it is also safe for greenlets
+_sessions_lock = Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Returns HTTP session for upstream of `url`.
+
+    - every upstream host has its own session with separate
+    pool of keep-alive connections. So, subsequent requests to
+    same host will reuse already opened connection (TCP and TLS
+    handshakes will be skipped).
+    - session is stateless (cookies are disabled), i.e.
+    it can be safely shared between different users.
+    - pool size depends on `HTTP_POOL_MAXSIZE` and
+    `HTTP_POOL_BLOCK` app configuration.
+
+    :param url:
+    Full URL of request.
+    """
+    global _sessions_pid
+
+    parse_result = urlparse(url)
+    upstream = f"{parse_result.scheme}://{parse_result.netloc}"
+    pid = os.getpid()
+
+    with _sessions_lock:
+        if (_sessions_pid != pid):
+            _sessions.clear()
+            _sessions_pid = pid
+
+        session = _sessions.get(upstream)
+
+        if session is None:
+            session = create_session()
+            _sessions[upstream] = session
+
+    return session
+
+
+def create_session() -> requests.Session:
+    """
+    Creates new HTTP session according to app configuration.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        # session is created for single upstream,
+        # so, only one pool is needed
+        pool_connections=1,
+        pool_maxsize=current_app.config["HTTP_POOL_MAXSIZE"],
+        pool_block=current_app.config["HTTP_POOL_BLOCK"]
+    )
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.cookies.set_policy(
+        DefaultCookiePolicy(allowed_domains=[])
+    )
+
+    return session
+
+
 def request(
     raise_for_status=False,
     content_type: CONTENT_TYPE = "none",
@@ -37,6 +113,8 @@ def request(
     How to decode response content.
     :param **kwargs:
     See https://requests.readthedocs.io/en/master/api/#requests.request
+    Keep-alive connection will be reused if possible,
+    see `get_session()` documentation.
 
     :returns:
     Result of request.
@@ -53,7 +131,8 @@ def request(
         f"{kwargs.get('method')} {kwargs.get('url')}"
     )
 
-    response = requests.request(**kwargs)
+    session = get_session(kwargs["url"])
+    response = session.request(**kwargs)
 
     if (raise_for_status):
         response.raise_for_status()
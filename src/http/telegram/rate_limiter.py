@@ -0,0 +1,423 @@
+"""
+Shared rate limiter for Telegram Bot API requests.
+
+Telegram limits how fast bot can send messages:
+- about 30 messages per second for all chats;
+- about 1 message per second for single chat;
+- about 20 messages per minute for single group.
+
+See https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this # noqa
+
+Requests are made from different processes (gunicorn workers,
+RQ workers), so, state of limiter is stored in Redis. Every limit
+is implemented as a token bucket. Request will be delayed (not
+rejected) until all needed buckets have a token.
+
+- requires Redis to be enabled. If Redis is disabled, then
+requests will be not limited, but `retry_after` from error
+responses still will be respected.
+"""
+
+import math
+from time import time, sleep
+from typing import Union, List, Tuple
+
+from flask import current_app
+
+from src.extensions import redis_client
+
+
+# Namespaces
+_SEPARATOR = ":"
+_NAMESPACE_KEY = "telegram_rate_limiter"
+_BUCKET_KEY = "bucket"
+_GLOBAL_KEY = "global"
+_CHAT_KEY = "chat"
+_GROUP_KEY = "group"
+_METRICS_KEY = "metrics"
+
+# Methods which are counted as sent messages.
+# Only these methods are limited by chat and group limits
+MESSAGE_METHODS = (
+    "sendMessage",
+    "editMessageText",
+    "sendPhoto"
+)
+
+# All methods which are limited by global limit
+LIMITED_METHODS = (
+    *MESSAGE_METHODS,
+    "sendChatAction",
+    "deleteMessage"
+)
+
+# Takes one token from every bucket if all buckets have
+# at least one token. Otherwise nothing will be taken.
+# KEYS - bucket keys.
+# ARGV[1] - current time in milliseconds.
+# ARGV[2 * i], ARGV[2 * i + 1] - capacity of bucket and
+# interval (milliseconds) of refilling of one token for KEYS[i].
+# Returns `0` if tokens were taken, otherwise number of
+# milliseconds to wait before next attempt.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait = 0
+local tokens = {}
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local interval = tonumber(ARGV[i * 2 + 1])
+    local data = redis.call(
+        "HMGET", key, "tokens", "timestamp", "blocked_until"
+    )
+    local value = tonumber(data[1]) or capacity
+    local timestamp = tonumber(data[2]) or now
+    local blocked_until = tonumber(data[3]) or 0
+
+    value = math.min(capacity, value + math.max(0, now - timestamp) / interval)
+    tokens[i] = value
+
+    if blocked_until > now then
+        wait = math.max(wait, blocked_until - now)
+    elseif value < 1 then
+        wait = math.max(wait, (1 - value) * interval)
+    end
+end
+
+if wait > 0 then
+    return math.ceil(wait)
+end
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local interval = tonumber(ARGV[i * 2 + 1])
+
+    redis.call("HMSET", key, "tokens", tokens[i] - 1, "timestamp", now)
+    redis.call("PEXPIRE", key, math.ceil(capacity * interval) + 1000)
+end
+
+return 0
+"""
+
+# Blocks bucket until given time.
+# KEYS[1] - bucket key.
+# ARGV[1] - current time in milliseconds.
+# ARGV[2] - for how long (milliseconds) bucket should be blocked.
+_BLOCK_SCRIPT = """
+local now = tonumber(ARGV[1])
+local duration = tonumber(ARGV[2])
+local blocked_until = tonumber(
+    redis.call("HGET", KEYS[1], "blocked_until")
+) or 0
+
+blocked_until = math.max(blocked_until, now + duration)
+
+redis.call("HSET", KEYS[1], "blocked_until", blocked_until)
+
+if redis.call("PTTL", KEYS[1]) < duration then
+    redis.call("PEXPIRE", KEYS[1], duration + 1000)
+end
+
+return blocked_until
+"""
+
+_acquire_script = None
+_block_script = None
+
+
+def _create_key(*args) -> str:
+    return _SEPARATOR.join(map(str, args))
+
+
+def _get_acquire_script():
+    global _acquire_script
+
+    if _acquire_script is None:
+        _acquire_script = redis_client.register_script(_ACQUIRE_SCRIPT)
+
+    return _acquire_script
+
+
+def _get_block_script():
+    global _block_script
+
+    if _block_script is None:
+        _block_script = redis_client.register_script(_BLOCK_SCRIPT)
+
+    return _block_script
+
+
+def _get_current_time() -> int:
+    """
+    :returns:
+    Current time in milliseconds.
+    """
+    return int(time() * 1000)
+
+
+def _is_group_chat(chat_id: Union[int, str]) -> bool:
+    """
+    :returns:
+    Chat is a group or a channel.
+    Telegram uses negative ID's for them.
+    """
+    try:
+        return (int(chat_id) < 0)
+    except (TypeError, ValueError):
+        # `@channelusername` is also valid `chat_id`
+        return isinstance(chat_id, str)
+
+
+def _get_buckets(
+    method_name: str,
+    chat_id: Union[int, str, None]
+) -> List[Tuple[str, int, float]]:
+    """
+    :returns:
+    Buckets that should be used for request.
+    Every bucket is `(key, capacity, interval in milliseconds)`.
+    """
+    config = current_app.config
+    buckets = []
+
+    if method_name not in LIMITED_METHODS:
+        return buckets
+
+    global_limit = config["TELEGRAM_API_GLOBAL_RATE_LIMIT"]
+    buckets.append((
+        _create_key(_NAMESPACE_KEY, _BUCKET_KEY, _GLOBAL_KEY),
+        global_limit,
+        1000 / global_limit
+    ))
+
+    if (
+        (chat_id is None) or
+        (method_name not in MESSAGE_METHODS)
+    ):
+        return buckets
+
+    chat_limit = config["TELEGRAM_API_CHAT_RATE_LIMIT"]
+    buckets.append((
+        _create_key(_NAMESPACE_KEY, _BUCKET_KEY, _CHAT_KEY, chat_id),
+        chat_limit,
+        1000 / chat_limit
+    ))
+
+    if _is_group_chat(chat_id):
+        group_limit = config["TELEGRAM_API_GROUP_RATE_LIMIT"]
+        buckets.append((
+            _create_key(_NAMESPACE_KEY, _BUCKET_KEY, _GROUP_KEY, chat_id),
+            group_limit,
+            60 * 1000 / group_limit
+        ))
+
+    return buckets
+
+
+def rate_limiter_is_enabled() -> bool:
+    return (
+        current_app.config["TELEGRAM_API_RATE_LIMITER_ENABLED"] and
+        redis_client.is_enabled
+    )
+
+
+def acquire(
+    method_name: str,
+    chat_id: Union[int, str, None] = None
+) -> float:
+    """
+    Waits until request to Telegram Bot API can be made.
+
+    - current thread (or greenlet) will be blocked.
+    - if waiting takes more than `TELEGRAM_API_RATE_LIMITER_MAX_WAIT`,
+    then request will be allowed anyway. In that case Telegram
+    most probably will respond with `retry_after`.
+
+    :param method_name:
+    Name of Telegram Bot API method.
+    :param chat_id:
+    Target chat of that method. `None` if method
+    not associated with any chat.
+
+    :returns:
+    How long (in seconds) request was delayed.
+    """
+    if not rate_limiter_is_enabled():
+        return 0
+
+    buckets = _get_buckets(method_name, chat_id)
+
+    if not buckets:
+        return 0
+
+    keys = []
+    arguments = []
+
+    for key, capacity, interval in buckets:
+        keys.append(key)
+        arguments.extend((capacity, interval))
+
+    script = _get_acquire_script()
+    max_wait = current_app.config["TELEGRAM_API_RATE_LIMITER_MAX_WAIT"]
+    total_wait = 0
+
+    while True:
+        wait = script(
+            keys=keys,
+            args=[_get_current_time(), *arguments]
+        ) / 1000
+
+        if not wait:
+            break
+
+        if (total_wait + wait > max_wait):
+            current_app.logger.warning(
+                f"Rate limit wait time exceeded for {method_name} "
+                f"in {chat_id} chat"
+            )
+
+            break
+
+        sleep(wait)
+        total_wait += wait
+
+    if total_wait:
+        current_app.logger.debug(
+            f"{method_name} was delayed for {total_wait:.3f} seconds"
+        )
+        record_wait(total_wait)
+
+    return total_wait
+
+
+def block(
+    chat_id: Union[int, str, None],
+    retry_after: int
+) -> None:
+    """
+    Blocks requests to chat according to `retry_after`
+    from Telegram error response. All processes will wait
+    before making requests to that chat.
+
+    :param chat_id:
+    Chat that got error response. If `None`, then
+    requests to all chats will be blocked.
+    :param retry_after:
+    Number of seconds from Telegram error response.
+    """
+    if not rate_limiter_is_enabled():
+        return
+
+    key = (
+        _create_key(_NAMESPACE_KEY, _BUCKET_KEY, _GLOBAL_KEY)
+        if (chat_id is None) else
+        _create_key(_NAMESPACE_KEY, _BUCKET_KEY, _CHAT_KEY, chat_id)
+    )
+    script = _get_block_script()
+
+    script(
+        keys=[key],
+        args=[_get_current_time(), retry_after * 1000]
+    )
+    redis_client.hincrby(
+        _create_key(_NAMESPACE_KEY, _METRICS_KEY),
+        "retry_after_count",
+        1
+    )
+
+
+def record_wait(seconds: float) -> None:
+    """
+    Adds wait time into limiter metrics.
+    """
+    if not rate_limiter_is_enabled():
+        return
+
+    key = _create_key(_NAMESPACE_KEY, _METRICS_KEY)
+    pipeline = redis_client.pipeline()
+
+    pipeline.hincrbyfloat(key, "wait_seconds", seconds)
+    pipeline.hincrby(key, "wait_count", 1)
+
+    pipeline.execute(raise_on_error=True)
+
+
+def get_metrics() -> dict:
+    """
+    :returns:
+    Metrics of limiter that were collected by all processes:
+    `wait_seconds` - total time of waiting;
+    `wait_count` - number of delayed requests;
+    `average_wait_seconds` - average delay of delayed request;
+    `retry_after_count` - number of `retry_after` error responses.
+    """
+    result = {
+        "wait_seconds": 0.0,
+        "wait_count": 0,
+        "average_wait_seconds": 0.0,
+        "retry_after_count": 0
+    }
+
+    if not redis_client.is_enabled:
+        return result
+
+    data = redis_client.hgetall(
+        _create_key(_NAMESPACE_KEY, _METRICS_KEY)
+    )
+
+    result["wait_seconds"] = float(data.get("wait_seconds", 0))
+    result["wait_count"] = int(data.get("wait_count", 0))
+    result["retry_after_count"] = int(data.get("retry_after_count", 0))
+
+    if result["wait_count"]:
+        result["average_wait_seconds"] = (
+            result["wait_seconds"] / result["wait_count"]
+        )
+
+    return result
+
+
+def reset_metrics() -> None:
+    """
+    Removes all collected metrics.
+    """
+    if not redis_client.is_enabled:
+        return
+
+    redis_client.delete(
+        _create_key(_NAMESPACE_KEY, _METRICS_KEY)
+    )
+
+
+def wait_retry_after(retry_after: int) -> bool:
+    """
+    Waits `retry_after` seconds before next request.
+
+    :returns:
+    `True` if waiting was performed, `False` if
+    `retry_after` is too big to wait.
+    """
+    max_wait = current_app.config["TELEGRAM_API_RATE_LIMITER_MAX_WAIT"]
+
+    if (retry_after > max_wait):
+        return False
+
+    sleep(retry_after)
+    record_wait(retry_after)
+
+    return True
+
+
+def get_retry_after(error_response: dict) -> Union[int, None]:
+    """
+    :returns:
+    `retry_after` from Telegram error response,
+    `None` if there is no such value.
+    """
+    parameters = error_response.get("parameters") or {}
+    retry_after = parameters.get("retry_after")
+
+    if not isinstance(retry_after, (int, float)):
+        return None
+
+    return int(math.ceil(retry_after))
@@ -1,4 +1,5 @@
 from os import environ
+from typing import Callable, List
 
 from flask import current_app
 
@@ -9,6 +10,21 @@ from src.http.request import (
 from .exceptions import (
     RequestFailed
 )
+from . import rate_limiter
+
+
+# Functions that are called before every request,
+# see `register_before_request()`
+_before_request_functions: List[Callable[[], None]] = []
+
+
+def register_before_request(function: Callable[[], None]) -> None:
+    """
+    Registers function that will be called before every
+    request to Telegram Bot API (for example, to make
+    delayed calls first, so, calls will be not reordered).
+    """
+    _before_request_functions.append(function)
 
 
 def create_bot_url(method_name: str) -> str:
@@ -52,6 +68,11 @@ def make_request(
     Makes HTTP request to Telegram Bot API.
 
     - see `api/request.py` documentation for more.
+    - requests are rate limited, see `telegram/rate_limiter.py`
+    documentation for more. So, this function can block current
+    thread for a while.
+    - if Telegram responds with `retry_after`, then request will
+    be repeated after that time (according to app configuration).
 
     :param method_name: Name of API method in URL.
     :param data: JSON data to send. It will be sent as
@@ -64,8 +85,13 @@ def make_request(
     :raises TelegramBotApiException:
     See `telegram/exceptions.py` documentation for more.
     """
+    for function in _before_request_functions:
+        function()
+
     url = create_bot_url(method_name)
     timeout = current_app.config["TELEGRAM_API_TIMEOUT"]
+    max_retries = current_app.config["TELEGRAM_API_MAX_RETRIES"]
+    chat_id = data.get("chat_id")
     payload = {
         "json": data
     }
@@ -76,24 +102,52 @@ def make_request(
             "params": data
         }
 
-    result = request(
-        content_type="json",
-        method="POST",
-        url=url,
-        timeout=timeout,
-        allow_redirects=False,
-        verify=True,
-        **payload
-    )
-    ok = result["content"]["ok"]
+    attempt = 0
 
-    # 4xx or 5xx
-    if not ok:
-        raise RequestFailed(
-            create_error_text(
-                result["content"]
-            )
+    while True:
+        rate_limiter.acquire(method_name, chat_id)
+
+        result = request(
+            content_type="json",
+            method="POST",
+            url=url,
+            timeout=timeout,
+            allow_redirects=False,
+            verify=True,
+            **payload
         )
+        ok = result["content"]["ok"]
+
+        if ok:
+            break
+
+        # 429 (Too Many Requests). All processes should
+        # stop making requests to that chat for a while
+        retry_after = rate_limiter.get_retry_after(result["content"])
+        should_retry = (
+            (retry_after is not None) and
+            (attempt < max_retries)
+        )
+
+        if retry_after is not None:
+            current_app.logger.warning(
+                f"{method_name} is limited for {chat_id} chat, "
+                f"retry after {retry_after} seconds"
+            )
+            rate_limiter.block(chat_id, retry_after)
+
+        if should_retry:
+            should_retry = rate_limiter.wait_retry_after(retry_after)
+
+        # 4xx or 5xx
+        if not should_retry:
+            raise RequestFailed(
+                create_error_text(
+                    result["content"]
+                )
+            )
+
+        attempt += 1
 
     # https://core.telegram.org/bots/api/#making-requests
     result["content"] = result["content"]["result"]
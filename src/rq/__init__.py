@@ -2,5 +2,12 @@ from src.extensions import task_queue
 
 from .task import (
     prepare_task,
-    run_task
+    run_task,
+    register_task,
+    background_tasks_is_enabled,
+    enqueue_task
+)
+from .queues import (
+    TaskQueueName,
+    QUEUES_PRIORITY
 )
@@ -0,0 +1,184 @@
+"""
+In-process executor of background tasks.
+
+It is used instead of RQ when RQ is disabled (`RUNTIME_RQ_ENABLED`
+or `REDIS_URL` is missing), so, small deployments still handle
+long tasks (uploading, preview, chart) in background without
+running Redis and RQ workers. Use it through `enqueue_task()`.
+
+- every process (gunicorn worker, for example) has its own
+executor. It is created on first use, i.e. after fork.
+- if gevent monkey patching was applied, then greenlets are
+used, otherwise threads are used.
+- number of tasks that are executed at the same time is limited
+by `RUNTIME_LOCAL_EXECUTOR_CONCURRENCY`, number of tasks that
+wait for execution is limited by `RUNTIME_LOCAL_EXECUTOR_QUEUE_SIZE`.
+- tasks are stored only in memory, so, waiting and running
+tasks are lost when process is stopped.
+- timeout of task is applied only in greenlets,
+threads can't be interrupted.
+"""
+
+import threading
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Union
+
+from flask import Flask, current_app
+
+
+class LocalExecutorFullError(Exception):
+    """
+    Too many tasks are waiting for execution.
+    """
+    pass
+
+
+class LocalTaskTimeoutError(Exception):
+    """
+    Task was not completed before timeout.
+    """
+    pass
+
+
+def _gevent_is_patched() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+
+    return monkey.is_module_patched("threading")
+
+
+class LocalExecutor:
+    """
+    Executes functions in background with bounded concurrency
+    and bounded queue.
+    """
+    def __init__(self, app: Flask, concurrency: int, queue_size: int):
+        """
+        :param app:
+        Every function is executed in new app context of this app.
+        :param concurrency:
+        Maximum number of functions that are executed at the same time.
+        :param queue_size:
+        Maximum number of functions that wait for execution.
+        """
+        self.app = app
+        self._slots = threading.BoundedSemaphore(concurrency + queue_size)
+        self._use_greenlets = _gevent_is_patched()
+
+        if self._use_greenlets:
+            from gevent.pool import Pool
+
+            self._pool = Pool(concurrency)
+            self._executor = None
+        else:
+            self._pool = None
+            self._executor = ThreadPoolExecutor(
+                concurrency,
+                thread_name_prefix="local_executor"
+            )
+
+    def submit(
+        self,
+        function: Callable,
+        timeout: Union[int, None] = None,
+        ttl: Union[int, None] = None
+    ) -> None:
+        """
+        Submits function for execution in background.
+
+        :param function:
+        Function without arguments.
+        :param timeout:
+        Maximum runtime of function in seconds.
+        `None` or `-1` for no timeout.
+        :param ttl:
+        Maximum time (in seconds) that function can wait for
+        execution. Function is discarded if it waits longer.
+        `None` for infinite waiting.
+
+        :raises:
+        `LocalExecutorFullError` if queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise LocalExecutorFullError()
+
+        submitted_at = monotonic()
+
+        def task():
+            try:
+                waited = monotonic() - submitted_at
+
+                if (ttl is not None) and (waited > ttl):
+                    self.app.logger.warning(
+                        "Local task discarded, "
+                        f"it waited {waited:.1f} seconds"
+                    )
+
+                    return
+
+                with self.app.app_context():
+                    self._run(function, timeout)
+            except BaseException:
+                self.app.logger.exception("Local task failed")
+            finally:
+                self._slots.release()
+
+        if self._use_greenlets:
+            import gevent
+
+            # `Pool.spawn()` blocks while pool is full,
+            # so, caller shouldn't wait for it
+            gevent.spawn(self._pool.spawn, task)
+        else:
+            self._executor.submit(task)
+
+    def _run(
+        self,
+        function: Callable,
+        timeout: Union[int, None]
+    ) -> None:
+        if (
+            not self._use_greenlets or
+            (timeout is None) or
+            (timeout <= 0)
+        ):
+            function()
+
+            return
+
+        import gevent
+
+        error = LocalTaskTimeoutError(
+            f"Task exceeded maximum timeout value ({timeout} seconds)"
+        )
+
+        with gevent.Timeout(timeout, error):
+            function()
+
+
+_executor: Union[LocalExecutor, None] = None
+
+
+def local_executor_is_enabled() -> bool:
+    return (current_app.config["RUNTIME_LOCAL_EXECUTOR_CONCURRENCY"] > 0)
+
+
+def get_local_executor() -> LocalExecutor:
+    """
+    :returns:
+    Executor of current process. It is created on first call.
+    """
+    global _executor
+
+    if _executor is None:
+        config = current_app.config
+        _executor = LocalExecutor(
+            current_app._get_current_object(),
+            config["RUNTIME_LOCAL_EXECUTOR_CONCURRENCY"],
+            config["RUNTIME_LOCAL_EXECUTOR_QUEUE_SIZE"]
+        )
+
+    return _executor
@@ -0,0 +1,46 @@
+"""
+Named queues of background tasks.
+
+Tasks of different classes have very different duration (upload
+can take tens of seconds, preview takes a second), so, every class
+of tasks has separate queue. Workers listen to queues in order of
+priority, so, short tasks will be not delayed behind long ones.
+Also you can run separate pool of workers for every queue.
+"""
+
+from enum import Enum, unique
+
+
+@unique
+class TaskQueueName(Enum):
+    """
+    Name of queue for class of tasks.
+    """
+    # short follow-up tasks that update
+    # messages of user (statuses of uploading)
+    NOTIFICATIONS = "notifications"
+
+    # downloading and sending of previews
+    PREVIEWS = "previews"
+
+    # generating and sending of charts
+    CHARTS = "charts"
+
+    # uploading of files
+    UPLOADS = "uploads"
+
+    # tasks without specific queue (also tasks that
+    # were enqueued before named queues were added)
+    DEFAULT = "default"
+
+
+# Workers will check queues in this order, i.e. task
+# from next queue is taken only when all previous
+# queues are empty
+QUEUES_PRIORITY = (
+    TaskQueueName.NOTIFICATIONS,
+    TaskQueueName.PREVIEWS,
+    TaskQueueName.CHARTS,
+    TaskQueueName.UPLOADS,
+    TaskQueueName.DEFAULT
+)
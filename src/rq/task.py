@@ -1,10 +1,24 @@
-from typing import Union, Callable
+from time import time
+from typing import Union, Callable, Dict
 
 from flask import (
     g,
     has_app_context,
     current_app
 )
+from rq.job import Job
+
+from src.extensions import task_queue
+from src.database import UserQuery
+from .local_executor import (
+    LocalExecutorFullError,
+    local_executor_is_enabled,
+    get_local_executor
+)
+
+
+# Tasks that can be enqueued by name, see `register_task()`
+_registered_tasks: Dict[str, Callable] = {}
 
 
 class RQTaskPrepareData:
@@ -23,6 +37,10 @@ def prepare_task() -> RQTaskPrepareData:
     (`g`, for example). That data will be available
     in background task.
 
+    NOTE:
+    copy of `g` is large (DB objects, Telegram objects, etc.)
+    and it is pickled into job. Prefer `enqueue_task()`.
+
     NOTE:
     this function should be called inside of application
     context and request context, i.e. inside of current request.
@@ -64,6 +82,9 @@ def run_task(
 
     NOTE:
     you should pass this function to task queue.
+    Prefer `enqueue_task()`, this function is kept for
+    tasks that don't use it (and for jobs that were
+    enqueued before).
 
     :param f:
     Function that will be called from background task.
@@ -83,3 +104,213 @@ def run_task(
     )
 
     f(*args, **kwargs)
+
+
+def register_task(name: str) -> Callable[[Callable], Callable]:
+    """
+    Registers function as a task, so, it can be enqueued
+    by name with `enqueue_task()`.
+
+    - use it as decorator.
+    - function should accept only keyword arguments
+    that can be serialized to JSON.
+    - function should be registered on import of module
+    that is imported by the app, otherwise worker will
+    not know about that function.
+
+    :param name:
+    Unique name of task.
+    """
+    def decorator(f: Callable) -> Callable:
+        if name in _registered_tasks:
+            raise ValueError(f"Task {name} is already registered")
+
+        _registered_tasks[name] = f
+
+        return f
+
+    return decorator
+
+
+def create_task_context() -> dict:
+    """
+    :returns:
+    IDs of current request data that will be loaded
+    again in background task, see `setup_task_context()`.
+    """
+    context = {}
+
+    if not has_app_context():
+        return context
+
+    user = g.get("db_user")
+
+    if user is not None:
+        context["user_telegram_id"] = user.telegram_id
+
+    return context
+
+
+def setup_task_context(context: dict) -> None:
+    """
+    Loads request data that was specified by
+    `create_task_context()`.
+
+    - `g.db_user` is loaded with all relationships
+    (it is needed, for example, to select language).
+    """
+    user_telegram_id = context.get("user_telegram_id")
+
+    if user_telegram_id is not None:
+        g.db_user = UserQuery.get_user_with_relationships(
+            user_telegram_id
+        )
+
+
+def background_tasks_is_enabled() -> bool:
+    """
+    :returns:
+    Tasks enqueued with `enqueue_task()` will be executed
+    in background (by RQ or by in-process executor).
+    """
+    return (
+        task_queue.is_enabled or
+        local_executor_is_enabled()
+    )
+
+
+def enqueue_task(
+    queue_name: str,
+    name: str,
+    kwargs: dict = {},
+    **options
+) -> Union[Job, None]:
+    """
+    Enqueues registered task.
+
+    Job will contain only name of task, arguments and
+    IDs of current request data, so, its payload is small
+    and doesn't depend on state of objects.
+
+    - if RQ is disabled, then task is submitted to in-process
+    executor (see `local_executor.py`). Only `job_timeout` and
+    `ttl` options are applied in that case.
+    - if in-process executor is disabled or full, then task
+    is executed right now, i.e. current thread will be blocked.
+
+    :param queue_name:
+    Name of queue. See `TaskQueueName`.
+    :param name:
+    Name of registered task. See `register_task()`.
+    :param kwargs:
+    Arguments of task. Should be serializable to JSON.
+    :param options:
+    Options of job for `Queue.enqueue()`
+    (`job_timeout`, `ttl`, etc.).
+
+    :returns:
+    Enqueued RQ job. `None` if RQ is disabled.
+    """
+    if name not in _registered_tasks:
+        raise ValueError(f"Task {name} is not registered")
+
+    if not task_queue.is_enabled:
+        _submit_local_task(name, kwargs, options)
+
+        return None
+
+    job = task_queue.get_queue(queue_name).enqueue(
+        run_registered_task,
+        kwargs={
+            "name": name,
+            "context": create_task_context(),
+            "kwargs": kwargs
+        },
+        **options
+    )
+
+    current_app.logger.debug(
+        f"RQ task {name} enqueued, payload size: {len(job.data)} bytes"
+    )
+
+    return job
+
+
+def _submit_local_task(
+    name: str,
+    kwargs: dict,
+    options: dict
+) -> None:
+    if local_executor_is_enabled():
+        context = create_task_context()
+
+        try:
+            get_local_executor().submit(
+                lambda: run_registered_task(
+                    name,
+                    context,
+                    kwargs,
+                    options.get("job_timeout")
+                ),
+                timeout=options.get("job_timeout"),
+                ttl=options.get("ttl")
+            )
+        except LocalExecutorFullError:
+            current_app.logger.warning(
+                f"Local executor is full, task {name} is executed now"
+            )
+        else:
+            current_app.logger.debug(
+                f"Local task {name} submitted"
+            )
+
+            return
+
+    _call_registered_task(name, kwargs, options.get("job_timeout"))
+
+
+def _call_registered_task(
+    name: str,
+    kwargs: dict,
+    timeout: Union[int, None]
+) -> None:
+    # task that is executed outside of RQ job
+    # can find out how much time it has left
+    g.task_started_at = time()
+    g.task_timeout = timeout
+
+    try:
+        _registered_tasks[name](**kwargs)
+    finally:
+        g.pop("task_started_at", None)
+        g.pop("task_timeout", None)
+
+
+def run_registered_task(
+    name: str,
+    context: dict,
+    kwargs: dict,
+    timeout: Union[int, None] = None
+) -> None:
+    """
+    Runs registered task.
+
+    - start time and `timeout` of task are available as
+    `g.task_started_at` and `g.task_timeout` while task
+    is executed. RQ job provides them by itself.
+
+    NOTE:
+    you shouldn't pass this function to task queue
+    directly, use `enqueue_task()`.
+
+    :param timeout:
+    Maximum runtime of task in seconds.
+    `None` if unknown.
+    """
+    setup_task_context(context)
+
+    current_app.logger.debug(
+        f"RQ task called: {name}"
+    )
+
+    _call_registered_task(name, kwargs, timeout)
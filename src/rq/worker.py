@@ -1,17 +1,149 @@
 """
 Runs RQ worker.
+
+Two modes are available:
+- forking worker (stock `rq.Worker`): every job is executed in
+fork of worker, one job at a time.
+- concurrent worker (`ConcurrentWorker`): jobs are executed without
+fork, many jobs at the same time in greenlets (if gevent monkey
+patching was applied) or in threads. Our jobs mostly wait for
+network, so, it allows to run a lot of jobs in a few processes.
 """
 
+import os
+import ctypes
+import signal
+import threading
+from time import sleep
+from functools import partial
+from multiprocessing import Process
+from typing import Sequence, Union
+
 import redis
-from rq import Worker, Queue, Connection
+from flask import Flask
+from rq import Worker, SimpleWorker, Queue, Connection
+from rq.timeouts import BaseDeathPenalty
 
 from src.app import create_app
+from src.blueprints.telegram_bot._common import youtube_dl
+from .queues import QUEUES_PRIORITY
+
+
+# TTL of concurrent worker. Idle worker blocks for
+# `TTL - 15` seconds while waiting for a job, so, it
+# is also max time of graceful stop of idle worker
+_CONCURRENT_WORKER_TTL = 30
+
 
+def _gevent_is_patched() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
 
-def run_worker():
+    return monkey.is_module_patched("threading")
+
+
+class ConcurrentDeathPenalty(BaseDeathPenalty):
+    """
+    Timeout of job that is executed in greenlet or thread
+    (`SIGALRM` can be used only for one job per process).
+
+    - greenlet: `gevent.Timeout` is raised in greenlet of job.
+    - thread: exception is raised asynchronously in thread of
+    job. It will be raised only when thread executes Python code,
+    so, blocking calls (without their own timeouts) will be
+    not interrupted.
+    """
+    def setup_death_penalty(self):
+        self._gevent_timeout = None
+        self._timer = None
+
+        # -1 means that job never timeouts
+        if (self._timeout <= 0):
+            return
+
+        if _gevent_is_patched():
+            import gevent
+
+            self._gevent_timeout = gevent.Timeout(
+                self._timeout,
+                self._exception(
+                    "Task exceeded maximum timeout value "
+                    f"({self._timeout} seconds)"
+                )
+            )
+            self._gevent_timeout.start()
+        else:
+            self._timer = threading.Timer(
+                self._timeout,
+                self._raise_in_thread,
+                args=(threading.get_ident(),)
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel_death_penalty(self):
+        if self._gevent_timeout is not None:
+            self._gevent_timeout.cancel()
+
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def _raise_in_thread(self, thread_id: int):
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_long(thread_id),
+            ctypes.py_object(self._exception)
+        )
+
+
+class ConcurrentWorker(SimpleWorker):
+    """
+    Worker that executes jobs without fork. Run multiple
+    instances in greenlets or threads to execute jobs
+    at the same time, see `run_concurrent_worker()`.
+
+    - app is created once and reused by all jobs, but every
+    job is executed in new app context, so, `g` from one job
+    will not intersects with `g` from another job.
+    """
+    death_penalty_class = ConcurrentDeathPenalty
+
+    def __init__(self, *args, app: Flask, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.app = app
+
+    def _install_signal_handlers(self):
+        # signals can be handled only in main thread,
+        # they are handled by `run_concurrent_worker()`
+        pass
+
+    def perform_job(self, job, queue, heartbeat_ttl=None):
+        with self.app.app_context():
+            return super().perform_job(
+                job,
+                queue,
+                heartbeat_ttl=heartbeat_ttl
+            )
+
+    def request_graceful_stop(self):
+        """
+        Worker will be stopped after current job
+        (or after waiting for a job if it is idle).
+        """
+        self._stop_requested = True
+
+
+def run_worker(queue_names: Union[Sequence[str], None] = None):
     """
     Creates single RQ worker and runs it.
 
+    :param queue_names:
+    Names of queues that worker will listen to, in order
+    of priority. `None` to listen to all queues in order
+    of `QUEUES_PRIORITY`.
+
     NOTE:
     App context. Separate one will be created
     (not actual app that serves requests) and
@@ -45,7 +177,10 @@ def run_worker():
         raise Exception("Redis URL is not specified")
 
     connection = redis.from_url(redis_url)
-    listen = ["default"]
+    listen = (
+        queue_names or
+        [name.value for name in QUEUES_PRIORITY]
+    )
 
     with Connection(connection):
         with app.app_context():
@@ -56,5 +191,158 @@ def run_worker():
             worker.work()
 
 
+def run_concurrent_worker(
+    queue_names: Union[Sequence[str], None] = None,
+    jobs: int = 10
+):
+    """
+    Runs `jobs` concurrent workers in current process and
+    blocks until SIGINT or SIGTERM will be received.
+
+    - if gevent monkey patching was applied (for example,
+    `python -m gevent.monkey manage.py run-worker ...`),
+    then greenlets are used, otherwise threads are used.
+    - first signal stops workers gracefully (busy workers will
+    complete their jobs, idle workers will complete waiting for
+    a job), second signal stops process immediately.
+
+    :param queue_names:
+    See `run_worker()`.
+    :param jobs:
+    How many jobs can be executed at the same time.
+    """
+    app = create_app()
+    redis_url = app.config.get("REDIS_URL")
+
+    if not redis_url:
+        raise Exception("Redis URL is not specified")
+
+    connection = redis.from_url(redis_url)
+    listen = (
+        queue_names or
+        [name.value for name in QUEUES_PRIORITY]
+    )
+    use_gevent = _gevent_is_patched()
+
+    # extractors are reused by all jobs of this process,
+    # fork server should be started before jobs
+    with app.app_context():
+        youtube_dl.prepare_extractors()
+
+    workers = [
+        ConcurrentWorker(
+            [Queue(name, connection=connection) for name in listen],
+            connection=connection,
+            default_worker_ttl=_CONCURRENT_WORKER_TTL,
+            app=app
+        )
+        for _ in range(jobs)
+    ]
+    stop_requested = threading.Event()
+
+    def stop(signal_number, frame):
+        if stop_requested.is_set():
+            raise SystemExit(1)
+
+        stop_requested.set()
+
+        for worker in workers:
+            worker.request_graceful_stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    app.logger.info(
+        f"Running {jobs} concurrent workers "
+        f"({'greenlets' if use_gevent else 'threads'})"
+    )
+
+    if use_gevent:
+        import gevent
+
+        runners = [gevent.spawn(worker.work) for worker in workers]
+
+        gevent.joinall(runners)
+    else:
+        runners = [
+            threading.Thread(target=worker.work, daemon=True)
+            for worker in workers
+        ]
+
+        for runner in runners:
+            runner.start()
+
+        # main thread should be free to handle signals
+        while any(runner.is_alive() for runner in runners):
+            sleep(1)
+
+
+def _run_in_own_process_group(target, queue_names) -> None:
+    # signals of terminal (Ctrl+C) are sent to whole process
+    # group. Worker should receive every signal only once,
+    # from parent, because second signal means forced stop
+    os.setpgrp()
+
+    target(queue_names)
+
+
+def run_workers(
+    queue_names: Union[Sequence[str], None] = None,
+    concurrency: int = 1,
+    jobs_per_worker: int = 0
+):
+    """
+    Runs pool of RQ workers that listen to same queues.
+
+    - every worker is separate process.
+    - it is blocking function, it will be completed when
+    all workers are stopped. SIGTERM and SIGINT are
+    forwarded to workers, so, they can be stopped gracefully.
+    Second signal is forwarded too, it stops workers immediately.
+    - every worker runs in its own process group, so, signal that
+    is sent to process group of this process (for example, Ctrl+C
+    in terminal) reaches workers only once, through forwarding.
+
+    :param queue_names:
+    See `run_worker()`.
+    :param concurrency:
+    How many workers to run.
+    :param jobs_per_worker:
+    If greater than 0, then concurrent workers will be used
+    (see `run_concurrent_worker()`), and every worker will execute
+    that many jobs at the same time. Otherwise forking
+    workers will be used.
+    """
+    target = run_worker
+
+    if (jobs_per_worker > 0):
+        target = partial(run_concurrent_worker, jobs=jobs_per_worker)
+
+    if (concurrency <= 1):
+        return target(queue_names)
+
+    workers = [
+        Process(
+            target=_run_in_own_process_group,
+            args=(target, queue_names)
+        )
+        for _ in range(concurrency)
+    ]
+
+    def stop(signal_number, frame):
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal_number)
+
+    for worker in workers:
+        worker.start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for worker in workers:
+        worker.join()
+
+
 if __name__ == "__main__":
     run_worker()